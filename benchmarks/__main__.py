@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import sys
+
+from jpegzip.compression.transforms import TRANSFORMS, set_transform_backend
+from jpegzip.utils.precision import SUPPORTED_DTYPES, set_compute_dtype
+
+from benchmarks.cases import CASES, SIZES
+from benchmarks.runner import DEFAULT_REPEAT, DEFAULT_THRESHOLD, compare, load, run_suite, save
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+logger = logging.getLogger("benchmarks")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="benchmarks", description="Benchmark the hot paths of the codec")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="Stages to run.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES), help="Image sizes to run.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per case.")
+    parser.add_argument(
+        "--precision",
+        choices=[dtype.name for dtype in SUPPORTED_DTYPES],
+        default="float32",
+        help="Floating point type the codec computes in.",
+    )
+    parser.add_argument(
+        "--transform", choices=list(TRANSFORMS), default="scipy", help="DCT backend of the codec stages."
+    )
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--baseline", type=str, default=BASELINE_PATH, help="JSON file of a previous run to compare against."
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative growth reported as a regression."
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store the results as the new baseline instead of comparing."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    logging.getLogger("benchmarks.runner").setLevel(logging.INFO)
+
+    set_compute_dtype(args.precision)
+    set_transform_backend(args.transform)
+    results = run_suite(args.cases, args.sizes, repeat=args.repeat)
+
+    if args.output is not None:
+        save(results, args.output)
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            # keep the cases that were not run this time, so a partial run only refreshes its own cases
+            results["results"] = load(args.baseline)["results"] | results["results"]
+        save(results, args.baseline)
+        logger.info(f" Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        logger.info(f" No baseline at {args.baseline}, nothing to compare against")
+        return 0
+
+    regressions = compare(results, load(args.baseline), threshold=args.threshold)
+    for regression in regressions:
+        logger.error(f" Regression: {regression}")
+    logger.info(f" {len(regressions)} regression(s) above {args.threshold:.0%}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import tempfile
+from typing import Callable, NamedTuple
+
+import cv2 as cv
+import numpy as np
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.jpeg_compression import JPEGCompression
+from jpegzip.compression.transforms import TRANSFORMS, AANTransform, TransformBackend, get_transform
+from jpegzip.compression.video_compression import VideoCompression
+from jpegzip.utils.image import (
+    ImageBlockProcessor,
+    rgb_to_ycbcr,
+    rgb_to_ycbcr_reference,
+    ycbcr_to_rgb,
+    ycbcr_to_rgb_reference,
+)
+from jpegzip.utils.precision import compute_dtype
+
+# (height, width) of every image size the suite can run, from a thumbnail up to an 8K UHD frame
+SIZES: dict[str, tuple[int, int]] = {
+    "256": (256, 256),
+    "512": (512, 512),
+    "1024": (1024, 1024),
+    "1080p": (1080, 1920),
+    "4k": (2160, 3840),
+    "8k": (4320, 7680),
+}
+
+VIDEO_FRAMES: int = 8
+
+# the registered DCT backends, and the AAN one that is only registered on demand, to compare it with them
+BACKENDS: dict[str, TransformBackend] = {**TRANSFORMS, "aan": AANTransform}
+
+
+class Case(NamedTuple):
+    """A benchmarked stage of the codec.
+
+    `setup(height, width, channels)` prepares the inputs outside of the timed region and returns
+    a `(run, cleanup)` pair, where `run` is the zero-argument function that is timed. One run processes
+    `frames` images of the given size, sizes above `max_pixels` are skipped.
+    """
+
+    setup: Callable[[int, int, int], tuple[Callable[[], object], Callable[[], None]]]
+    channels: tuple[int, ...]
+    max_pixels: int | None = None
+    frames: int = 1
+
+
+def synthetic_image(height: int, width: int, channels: int = 3, seed: int = 0) -> np.ndarray:
+    """A deterministic 8-bit test image: smooth gradients and waves with sensor-like noise.
+
+    Natural images compress to a few bits per pixel, random noise does not compress at all. Mixing
+    smooth content with mild noise keeps the quantization and the MSE search on a realistic path.
+    """
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    planes = [
+        255 * x / width,
+        255 * y / height,
+        128 + 80 * np.sin(x / 23) * np.cos(y / 31),
+    ]
+
+    image = np.stack([planes[c % 3] for c in range(channels)], axis=-1)
+    image += rng.normal(0, 6, image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    return image if channels > 1 else image[:, :, 0]
+
+
+def _nothing() -> None:
+    pass
+
+
+def _planar(image: np.ndarray) -> np.ndarray:
+    """The image in the compute dtype with channels first and both sides padded to whole blocks."""
+
+    image = np.moveaxis(image, -1, 0) if image.ndim == 3 else image
+    return ImageBlockProcessor.pad(image.astype(compute_dtype()))
+
+
+def _encode(height: int, width: int, channels: int):
+    image = synthetic_image(height, width, channels)
+    if channels == 1:
+        return lambda: JPEGCompression.encode(image), _nothing
+
+    q_methods = ["luminance"] + ["chroma"] * (channels - 1)
+    return lambda: JPEGCompression.encode_channels(image, q_methods), _nothing
+
+
+def _decode(height: int, width: int, channels: int):
+    image = synthetic_image(height, width, channels)
+    if channels == 1:
+        coefficients = JPEGCompression.encode(image)
+    else:
+        coefficients = JPEGCompression.encode_channels(image, ["luminance"] + ["chroma"] * (channels - 1))
+
+    return lambda: JPEGCompression.decode(coefficients, (height, width)), _nothing
+
+
+def _blocks(height: int, width: int, channels: int):
+    # the block view itself is free, copying it out is what the DCT stage pays for
+    image = _planar(synthetic_image(height, width, channels))
+    return lambda: np.ascontiguousarray(ImageBlockProcessor.blocks(image)), _nothing
+
+
+def _iblocks(height: int, width: int, channels: int):
+    image = _planar(synthetic_image(height, width, channels))
+    blocks = np.ascontiguousarray(ImageBlockProcessor.blocks(image))
+    out = np.empty_like(image)
+
+    return lambda: ImageBlockProcessor.iblocks(blocks, out=out), _nothing
+
+
+def _dct(backend: TransformBackend):
+    def setup(height: int, width: int, channels: int):
+        blocks = ImageBlockProcessor.blocks(_planar(synthetic_image(height, width, channels)) - 128)
+        return lambda: backend.dct(blocks), _nothing
+
+    return setup
+
+
+def _idct(backend: TransformBackend):
+    def setup(height: int, width: int, channels: int):
+        blocks = ImageBlockProcessor.blocks(_planar(synthetic_image(height, width, channels)) - 128)
+        coefficients = get_transform("scipy").dct(blocks)
+        return lambda: backend.idct(coefficients), _nothing
+
+    return setup
+
+
+def _rgb_to_ycbcr(convert: Callable[[np.ndarray], np.ndarray]):
+    def setup(height: int, width: int, channels: int):
+        image = synthetic_image(height, width, channels)
+        return lambda: convert(image), _nothing
+
+    return setup
+
+
+def _ycbcr_to_rgb(convert: Callable[[np.ndarray], np.ndarray]):
+    def setup(height: int, width: int, channels: int):
+        image = rgb_to_ycbcr(synthetic_image(height, width, channels))
+        return lambda: convert(image), _nothing
+
+    return setup
+
+
+def _compress_to_mse(height: int, width: int, channels: int):
+    image = synthetic_image(height, width, channels)
+    return lambda: ImageCompression.compress_to_mse(image, target_mse=40.0), _nothing
+
+
+def _video_compress(height: int, width: int, channels: int):
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, "benchmark.mp4")
+
+    out_video = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"mp4v"), 25.0, (width, height))
+    try:
+        for frame in range(VIDEO_FRAMES):
+            out_video.write(synthetic_image(height, width, channels, seed=frame))
+    finally:
+        out_video.release()
+
+    def run() -> float:
+        # an absolute name is kept as is by `os.path.join`, so the video is read from the temporary directory
+        video = VideoCompression(path)
+        video.output_path = os.path.join(directory.name, "benchmark_compressed.mp4")
+        return video.compress()
+
+    return run, directory.cleanup
+
+
+CASES: dict[str, Case] = {
+    "encode": Case(_encode, channels=(1, 3)),
+    "decode": Case(_decode, channels=(1, 3)),
+    "blocks": Case(_blocks, channels=(1, 3)),
+    "iblocks": Case(_iblocks, channels=(1, 3)),
+    **{f"dct_{name}": Case(_dct(backend), channels=(1, 3)) for name, backend in BACKENDS.items()},
+    **{f"idct_{name}": Case(_idct(backend), channels=(1, 3)) for name, backend in BACKENDS.items()},
+    "rgb_to_ycbcr": Case(_rgb_to_ycbcr(rgb_to_ycbcr), channels=(3,)),
+    "ycbcr_to_rgb": Case(_ycbcr_to_rgb(ycbcr_to_rgb), channels=(3,)),
+    # the whole-image conversions the chunked ones replaced
+    "rgb_to_ycbcr_reference": Case(_rgb_to_ycbcr(rgb_to_ycbcr_reference), channels=(3,)),
+    "ycbcr_to_rgb_reference": Case(_ycbcr_to_rgb(ycbcr_to_rgb_reference), channels=(3,)),
+    "compress_to_mse": Case(_compress_to_mse, channels=(3,)),
+    # eight 1080p frames already take longer than one 8K image, larger videos only slow the suite down
+    "video_compress": Case(_video_compress, channels=(3,), max_pixels=1080 * 1920, frames=VIDEO_FRAMES),
+}
@@ -0,0 +1,222 @@
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+from jpegzip.compression.transforms import transform_backend
+from jpegzip.utils.precision import compute_dtype
+
+from benchmarks.cases import CASES, SIZES, Case
+
+logger = logging.getLogger(__name__)
+
+# a case is a regression when its best time or its peak memory grows by more than this fraction of the baseline
+DEFAULT_THRESHOLD: float = 0.25
+DEFAULT_REPEAT: int = 3
+
+# below this duration or allocation timer and allocator noise dominate, so such changes are not reported
+MIN_SECONDS: float = 1e-3
+MIN_MEGABYTES: float = 1.0
+
+
+def case_key(name: str, size: str, channels: int) -> str:
+    """The key of a measurement in the results file, e.g. `encode/1080p/3`."""
+
+    return f"{name}/{size}/{channels}"
+
+
+def _reset_peak_rss() -> None:
+    # writing 5 to clear_refs resets the peak resident set size of the process (Linux only)
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float | None:
+    """The peak resident set size of the process in MB, since the last `_reset_peak_rss` where supported."""
+
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # kilobytes on Linux, bytes on macOS, and never reset: the peak of the whole run so far
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+
+def measure(case: Case, size: str, channels: int, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Time one stage on one image size and channel count, and record its peak memory.
+
+    The inputs are built before the timed region. The stage is run once to warm up, `repeat` times
+    under the timer and once more under `tracemalloc`, so the tracing overhead never shows up in the times.
+
+    Parameters
+    ----------
+    case : Case
+        The stage to run, see `benchmarks.cases.CASES`.
+    size : str
+        A key of `benchmarks.cases.SIZES`.
+    channels : int
+        The number of channels of the image.
+    repeat : int, optional
+        The number of timed runs. The default is 3.
+
+    Returns
+    -------
+    dict
+        The best and median wall times in seconds, the throughput of the best run in MB/s of 8-bit input pixels,
+        the peak memory allocated by the run (`tracemalloc`, in MB) and the peak resident set size of the process
+        (in MB, or None where it cannot be read).
+    """
+
+    height, width = SIZES[size]
+    megabytes = case.frames * height * width * channels / 1e6
+
+    run, cleanup = case.setup(height, width, channels)
+    try:
+        run()
+
+        times = []
+        gc.collect()
+        _reset_peak_rss()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        peak_rss = _peak_rss_mb()
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        cleanup()
+
+    best = min(times)
+
+    return {
+        "height": height,
+        "width": width,
+        "channels": channels,
+        "repeat": repeat,
+        "best_s": best,
+        "median_s": statistics.median(times),
+        "mb_per_s": megabytes / best,
+        "peak_memory_mb": peak / 1e6,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def run_suite(names: list[str], sizes: list[str], repeat: int = DEFAULT_REPEAT) -> dict:
+    """Measure every channel count of every selected stage on every selected size.
+
+    Returns
+    -------
+    dict
+        `{"metadata": ..., "results": {case_key: measurement}}`, with the measurements of `measure`
+        and the machine and library versions they were taken with.
+    """
+
+    results = {}
+    for name in names:
+        case = CASES[name]
+        for size in sizes:
+            height, width = SIZES[size]
+            if case.max_pixels is not None and height * width > case.max_pixels:
+                continue
+
+            for channels in case.channels:
+                key = case_key(name, size, channels)
+                results[key] = measure(case, size, channels, repeat=repeat)
+                logger.info(
+                    f" {key:28} {results[key]['best_s'] * 1e3:10.2f} ms {results[key]['mb_per_s']:10.2f} MB/s "
+                    f"{results[key]['peak_memory_mb']:10.2f} MB"
+                )
+
+    metadata = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "compute_dtype": compute_dtype().name,
+        "transform": transform_backend(),
+    }
+
+    return {"metadata": metadata, "results": results}
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """Compare a run against a baseline and list the cases that got slower or use more memory.
+
+    Only cases present in both runs are compared. Times below `MIN_SECONDS` and memory below
+    `MIN_MEGABYTES` are too noisy to compare and never count as regressions.
+
+    Parameters
+    ----------
+    results : dict
+        A run, as returned by `run_suite`.
+    baseline : dict
+        A previous run, as returned by `run_suite` and stored with `save`.
+    threshold : float, optional
+        The relative growth above which a case is a regression. The default is 0.25 (25%).
+
+    Returns
+    -------
+    list[str]
+        A description of every regression, empty if there are none.
+    """
+
+    regressions = []
+    for key, current in results["results"].items():
+        previous = baseline["results"].get(key)
+        if previous is None:
+            continue
+
+        for metric, unit, minimum in (("best_s", "s", MIN_SECONDS), ("peak_memory_mb", "MB", MIN_MEGABYTES)):
+            change = current[metric] / previous[metric] - 1 if previous[metric] > 0 else 0.0
+            logger.info(f" {key:28} {metric:16} {previous[metric]:12.4f} -> {current[metric]:12.4f} {change:+8.1%}")
+
+            if change > threshold and max(current[metric], previous[metric]) >= minimum:
+                regressions.append(
+                    f"{key}: {metric} {previous[metric]:.4f} {unit} -> {current[metric]:.4f} {unit} ({change:+.1%})"
+                )
+
+    return regressions
+
+
+def save(results: dict, path: str) -> None:
+    """Write a run to a JSON file, creating its directory if needed."""
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load(path: str) -> dict:
+    """Read a run written by `save`."""
+
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,284 @@
+import glob
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+import cv2 as cv
+import numpy as np
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.transforms import set_transform_backend, transform_backend
+from jpegzip.utils.file_system import logger
+from jpegzip.utils.image import Subsampling
+from jpegzip.utils.precision import compute_dtype, set_compute_dtype
+from skimage.metrics import mean_squared_error
+
+IMAGE_EXTENSIONS: tuple[str, ...] = (".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp")
+
+
+def _init_worker(dtype: str, transform: str) -> None:
+    """Make a pool worker compute in the parent's dtype with the parent's DCT backend."""
+
+    set_compute_dtype(dtype)
+    set_transform_backend(transform)
+
+
+def output_path(path: str, output_dir: str, jpeg: bool = False) -> str:
+    """The path `compress_file` writes the compressed image of `path` to, `<name>_compressed.<extension>`."""
+
+    root, extension = os.path.splitext(os.path.basename(path))
+
+    return os.path.join(output_dir, f"{root}_compressed{'.jpg' if jpeg else extension}")
+
+
+def compress_file(
+    path: str,
+    output_dir: str,
+    q_factor: float = 1.0,
+    target_mse: float | None = None,
+    subsampling: Subsampling = "4:4:4",
+    jpeg: bool = False,
+) -> tuple[int, int, int, float]:
+    """Compress a single image file into `output_dir`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the image to compress.
+    output_dir : str
+        The directory the compressed image is written to, see `output_path`.
+    q_factor : float, optional
+        The quality factor, or the starting point of the search when `target_mse` is set.
+    target_mse : float, optional
+        If set, the image is compressed to this MSE with `ImageCompression.search_q_factor`, or with
+        `ImageCompression.search_q_factor_jpeg` for a `.jpg` file, whose decoded image is searched.
+    subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+        The chroma subsampling mode, see `ImageCompression.compress_rgb`.
+    jpeg : bool, optional
+        If True, a baseline JFIF `.jpg` file is written with `ImageCompression.encode_jpeg` instead of the
+        decoded image in the format of the input. Its MSE is the one of the image a decoder reads from it.
+
+    Returns
+    -------
+    tuple
+        A tuple `(pixels, input_bytes, output_bytes, mse)` with the number of pixels of the image, the sizes
+        of the input and output files, and the MSE of the compressed image.
+
+    Raises
+    ------
+    ValueError
+        If the file cannot be read as an image, or the compressed image cannot be written.
+    RuntimeError
+        If `target_mse` cannot be reached, see `ImageCompression.search_q_factor`.
+    """
+
+    image = cv.imread(path, cv.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Cannot read an image from {path}.")
+    image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+
+    output = output_path(path, output_dir, jpeg)
+
+    if jpeg:
+        if target_mse is not None:
+            data, _, q_factor, mse, _ = ImageCompression.search_q_factor_jpeg(
+                image, target_mse, q_factor=q_factor, subsampling=subsampling
+            )
+        else:
+            data, compressed_image = ImageCompression.encode_jpeg(image, q_factor=q_factor, subsampling=subsampling)
+            mse = mean_squared_error(image, compressed_image)
+        with open(output, "wb") as file:
+            file.write(data)
+    else:
+        if target_mse is not None:
+            compressed_image, q_factor, mse, _ = ImageCompression.search_q_factor(
+                image, target_mse, q_factor=q_factor, subsampling=subsampling
+            )
+        else:
+            compressed_image = ImageCompression.compress_rgb(image, q_factor=q_factor, subsampling=subsampling)
+            mse = mean_squared_error(image, compressed_image)
+
+        if not cv.imwrite(output, cv.cvtColor(compressed_image, cv.COLOR_RGB2BGR)):
+            raise ValueError(f"Cannot write the compressed image to {output}.")
+
+    return image.shape[0] * image.shape[1], os.path.getsize(path), os.path.getsize(output), float(mse)
+
+
+class BatchCompression:
+    """Compresses many image files, spreading them over a pool of worker processes.
+
+    A file that cannot be compressed is logged and counted as failed, the rest of the batch goes on.
+    So is a file whose output path is the one of an earlier file of the batch, e.g. `a.jpg` after `a.png`
+    when both are written as `a_compressed.jpg`, instead of overwriting its output.
+
+    Parameters
+    ----------
+    paths : list[str]
+        The image files to compress, see `find_images`.
+    output_dir : str
+        The directory the compressed images are written to. It is created if needed.
+    workers : int, optional
+        The number of processes compressing images in parallel. The default is 1, which compresses
+        the images in the current process.
+    q_factor : float, optional
+        The quality factor of every image, or the starting point of the search in target MSE mode.
+    target_mse : float, optional
+        If set, every image is compressed to this MSE instead of using a fixed `q_factor`.
+    subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+        The chroma subsampling mode of every image. The default is "4:4:4".
+    jpeg : bool, optional
+        If True, every image is written as a baseline JFIF `.jpg` file, see `compress_file`.
+
+    Attributes
+    ----------
+    results : dict[str, tuple[int, int, int, float]]
+        The result of `compress_file` for every file compressed by the last run.
+    failures : dict[str, str]
+        The error message of every file that could not be compressed by the last run.
+    throughput : float
+        The number of images per second processed by the last run.
+    """
+
+    def __init__(
+        self,
+        paths: list[str],
+        output_dir: str,
+        workers: int = 1,
+        q_factor: float = 1.0,
+        target_mse: float | None = None,
+        subsampling: Subsampling = "4:4:4",
+        jpeg: bool = False,
+    ):
+        """Initializes the batch, no file is read until `compress` is called.
+
+        Raises
+        ------
+        ValueError
+            If `workers` is smaller than 1.
+        """
+
+        if workers < 1:
+            raise ValueError(f"The number of workers must be at least 1, got {workers}.")
+
+        self.paths: list[str] = paths
+        self.output_dir: str = output_dir
+        self.workers: int = workers
+        self.q_factor: float = q_factor
+        self.target_mse: float | None = target_mse
+        self.subsampling: Subsampling = subsampling
+        self.jpeg: bool = jpeg
+
+        self.results: dict[str, tuple[int, int, int, float]] = {}
+        self.failures: dict[str, str] = {}
+        self.throughput: float = 0.0
+
+    @staticmethod
+    def find_images(pattern: str) -> list[str]:
+        """List the images to compress, in sorted order.
+
+        Parameters
+        ----------
+        pattern : str
+            A directory, whose files with a known image extension are returned,
+            or a glob pattern such as `input/*.png`, whose matches are all returned.
+
+        Returns
+        -------
+        list[str]
+            The paths of the images.
+        """
+
+        if os.path.isdir(pattern):
+            return sorted(
+                os.path.join(pattern, name)
+                for name in os.listdir(pattern)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+
+        return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+    def compress(self) -> tuple[int, int]:
+        """Compress every file of the batch and log an aggregate report.
+
+        Returns
+        -------
+        tuple[int, int]
+            The number of files compressed and the number of files that failed.
+        """
+
+        self.results = {}
+        self.failures = {}
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        arguments = (self.output_dir, self.q_factor, self.target_mse, self.subsampling, self.jpeg)
+        start = time.perf_counter()
+
+        # the first file of the batch keeps an output path, the other files that would overwrite it fail
+        paths: dict[str, str] = {}
+        for path in self.paths:
+            output = output_path(path, self.output_dir, self.jpeg)
+            if output in paths:
+                self.record_failure(path, ValueError(f"{output} is already the output of {paths[output]}."))
+            else:
+                paths[output] = path
+
+        if self.workers == 1:
+            for path in paths.values():
+                try:
+                    self.record(path, compress_file(path, *arguments))
+                except Exception as e:
+                    self.record_failure(path, e)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(compute_dtype().name, transform_backend())
+            ) as pool:
+                futures: dict[Future, str] = {
+                    pool.submit(compress_file, path, *arguments): path for path in paths.values()
+                }
+                for future in as_completed(futures):
+                    try:
+                        self.record(futures[future], future.result())
+                    except Exception as e:
+                        self.record_failure(futures[future], e)
+
+        elapsed = time.perf_counter() - start
+        self.throughput = len(self.results) / elapsed if elapsed > 0 else 0.0
+        self.report(elapsed)
+
+        return len(self.results), len(self.failures)
+
+    def record(self, path: str, result: tuple[int, int, int, float]) -> None:
+        """Keep the result of a compressed file and log the progress of the batch."""
+
+        self.results[path] = result
+        _, input_bytes, output_bytes, mse = result
+        logger.info(
+            f" [{len(self.results) + len(self.failures):4}/{len(self.paths):4}] {os.path.basename(path)}: "
+            f"MSE: {mse:.4f}, Size: {input_bytes} -> {output_bytes} bytes"
+        )
+
+    def record_failure(self, path: str, error: Exception) -> None:
+        """Keep the error of a file that could not be compressed, without stopping the batch."""
+
+        self.failures[path] = str(error)
+        logger.error(
+            f" [{len(self.results) + len(self.failures):4}/{len(self.paths):4}] {os.path.basename(path)}: "
+            f"failed: {error}"
+        )
+
+    def report(self, elapsed: float) -> None:
+        """Log the aggregate throughput, MSE and size of the last run."""
+
+        pixels = sum(result[0] for result in self.results.values())
+        input_bytes = sum(result[1] for result in self.results.values())
+        output_bytes = sum(result[2] for result in self.results.values())
+        average_mse = np.mean([result[3] for result in self.results.values()]) if self.results else 0.0
+
+        logger.info(
+            f" Workers: {self.workers}, Images: {len(self.results)}, Failed: {len(self.failures)}, "
+            f"Time: {elapsed:.2f}s, Throughput: {self.throughput:.2f} images/s "
+            f"({3 * pixels / 1e6 / elapsed if elapsed > 0 else 0.0:.2f} MB/s)"
+        )
+        logger.info(
+            f" Average MSE: {average_mse:.4f}, Size: {input_bytes} -> {output_bytes} bytes "
+            f"({8 * output_bytes / pixels if pixels else 0.0:.4f} bpp)"
+        )
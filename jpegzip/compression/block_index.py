@@ -0,0 +1,163 @@
+import numpy as np
+from jpegzip.compression.entropy_coding import EntropyCoding
+from jpegzip.compression.jfif import JFIF
+
+
+class BlockIndex:
+    """An index of the entropy-coded data of a sequential JPEG file, to decode a region without the rest of the file.
+
+    The Huffman codes of a scan have variable lengths and the DC terms are coded as differences, so a block can
+    only be decoded after all the blocks before it. The index records, every `interval` MCUs of every MCU row, the
+    position of the first bit of the MCU in the file and the DC predictors of every component at that point. Decoding
+    a rectangle then starts at the closest entry before every MCU row it covers, and reads the MCUs of the rectangle
+    plus fewer than `interval` others per row, see `ImageCompression.decompress_jpeg_region`.
+
+    The index is built once per file with `build`, and can be stored next to it as a small `.npz` sidecar file,
+    see `save` and `load`.
+
+    Examples
+    --------
+    >>> index = BlockIndex.build(data)
+    >>> index.save("image.jpg.npz")
+    >>> tile = ImageCompression.decompress_jpeg_region(data, 512, 1024, 256, 256, BlockIndex.load("image.jpg.npz"))
+
+    Parameters
+    ----------
+    grid : tuple[int, int]
+        The MCU grid (n, m) of the file.
+    interval : int
+        The number of MCUs between two entries of a row.
+    positions : np.ndarray
+        Array of shape (n, ceil(m / interval)), the position in bits from the start of the file of every entry.
+    predictors : np.ndarray
+        Array of shape (n, ceil(m / interval), C), the DC predictor of every component at every entry.
+
+    Attributes
+    ----------
+    INTERVAL : int
+        The default number of MCUs between two entries of a row. Larger intervals make the index smaller
+        and regions slower to decode.
+    """
+
+    INTERVAL: int = 4
+
+    def __init__(self, grid: tuple[int, int], interval: int, positions: np.ndarray, predictors: np.ndarray):
+        self.grid: tuple[int, int] = grid
+        self.interval: int = interval
+        self.positions: np.ndarray = positions
+        self.predictors: np.ndarray = predictors
+
+    @staticmethod
+    def build(data: bytes, interval: int | None = None) -> "BlockIndex":
+        """Index a sequential JPEG file.
+
+        The file is decoded once, then the number of bits of every block is computed again from its
+        coefficients, with the Huffman tables of the file. This is exact for the files of every encoder
+        that codes the coefficients the standard way, e.g. this package or libjpeg.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of the .jpg file.
+        interval : int, optional
+            The number of MCUs between two entries of a row. If None, `INTERVAL` is used.
+
+        Returns
+        -------
+        BlockIndex
+            The index of the file.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a sequential JPEG file, see `JFIF.read_header`, or the interval is not positive.
+        """
+
+        interval = BlockIndex.INTERVAL if interval is None else interval
+        if interval < 1:
+            raise ValueError(f"The interval must be at least 1, got {interval}.")
+
+        _, sampling, _, huffman_tables, scan_start = JFIF.read_header(data)
+        components, _, _ = JFIF.read(data)
+
+        layout = EntropyCoding.mcu_layout(sampling)
+        grid = (components[0].shape[0] // sampling[0][1], components[0].shape[1] // sampling[0][0])
+
+        # the number of bits of every block, summed up to the start of every MCU of the unstuffed stream
+        blocks, component_ids = EntropyCoding.mcu_order(components, sampling)
+        block_id, _, is_dc, symbol, _, extra_length = EntropyCoding.run_length(blocks, component_ids, len(components))
+        _, code_lengths = EntropyCoding.huffman_encode(symbol, is_dc, component_ids[block_id], huffman_tables)
+        block_bits = np.bincount(block_id, weights=code_lengths + extra_length, minlength=blocks.shape[0])
+        mcu_bits = block_bits.astype(np.int64).reshape(-1, layout.size).sum(axis=1)
+        starts = (np.cumsum(mcu_bits) - mcu_bits).reshape(grid)[:, ::interval]
+
+        # every 0xFF byte of the scan is followed by a stuffed zero byte, which shifts the bytes after it
+        scan_end = JFIF.scan_end(data, scan_start)
+        scan = np.frombuffer(data, dtype=np.uint8, count=scan_end - scan_start, offset=scan_start)
+        stuffed = np.flatnonzero((scan[:-1] == 0xFF) & (scan[1:] == 0x00))
+        stuffed -= np.arange(stuffed.size)
+        byte = starts >> 3
+        positions = (scan_start + byte + np.searchsorted(stuffed, byte)) * 8 + (starts & 7)
+
+        # the predictor of a component is the DC of its last block in the previous MCU
+        dc = blocks[:, 0, 0].reshape(-1, layout.size)
+        predictors = np.zeros((dc.shape[0], len(components)), dtype=np.int32)
+        for component in range(len(components)):
+            predictors[1:, component] = dc[:-1, np.flatnonzero(layout == component)[-1]]
+
+        return BlockIndex(grid, interval, positions, predictors.reshape(*grid, -1)[:, ::interval])
+
+    def segment(self, row: int, first: int, last: int) -> tuple[int, int, int | None, list[int]]:
+        """Locate the entropy-coded data holding the MCUs `first` to `last` of an MCU row.
+
+        Parameters
+        ----------
+        row : int
+            The MCU row.
+        first, last : int
+            The first and last MCU of the row to decode.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - `column` : int
+                The MCU the data starts at, the closest entry before `first`.
+            - `start` : int
+                The position of the data in the file, in bits.
+            - `end` : int | None
+                The position of the next entry after `last` in the file, in bits, the data of the MCUs ends
+                before it. None if there is no entry after `last`, the data then runs up to the end of the scan.
+            - `predictors` : list[int]
+                The DC predictor of every component at `column`.
+        """
+
+        entry = first // self.interval
+        next_entry = last // self.interval + 1
+
+        if next_entry < self.positions.shape[1]:
+            end = int(self.positions[row, next_entry])
+        elif row + 1 < self.grid[0]:
+            end = int(self.positions[row + 1, 0])
+        else:
+            end = None
+
+        return entry * self.interval, int(self.positions[row, entry]), end, self.predictors[row, entry].tolist()
+
+    def save(self, path: str) -> None:
+        """Write the index to a `.npz` file, e.g. a sidecar file next to the .jpg file."""
+
+        with open(path, "wb") as file:
+            np.savez(file, grid=self.grid, interval=self.interval, positions=self.positions, predictors=self.predictors)
+
+    @staticmethod
+    def load(path: str) -> "BlockIndex":
+        """Read an index written by `save`."""
+
+        with np.load(path) as file:
+            return BlockIndex(
+                tuple(int(size) for size in file["grid"]),
+                int(file["interval"]),
+                file["positions"],
+                file["predictors"],
+            )
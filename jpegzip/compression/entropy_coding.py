@@ -0,0 +1,1462 @@
+import heapq
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Literal
+
+import numpy as np
+from jpegzip.utils.profiling import stage
+
+HuffmanSpec = tuple[list[int], list[int]]
+HuffmanTables = tuple[HuffmanSpec, HuffmanSpec]
+
+
+class EntropyCoding:
+    """Implements the lossless entropy coding stage of baseline JPEG: zigzag ordering,
+    DPCM coding of the DC terms, run-length coding of the AC terms and Huffman coding
+    of the resulting symbols into a byte stream.
+
+    Attributes
+    ----------
+    ZIGZAG : np.ndarray
+        Flat (row-major) indices of an 8x8 block in zigzag order.
+    IZIGZAG : np.ndarray
+        The zigzag position of every flat index of an 8x8 block, the inverse permutation of `ZIGZAG`.
+
+    DC_LUMINANCE_BITS, DC_LUMINANCE_VALUES, AC_LUMINANCE_BITS, AC_LUMINANCE_VALUES : list[int]
+        The standard luminance Huffman tables (JPEG Annex K.3), given as the number of codes of
+        each length 1..16 followed by the symbols in order of increasing code length.
+
+    DC_CHROMA_BITS, DC_CHROMA_VALUES, AC_CHROMA_BITS, AC_CHROMA_VALUES : list[int]
+        The standard chroma Huffman tables (JPEG Annex K.3).
+
+    MAX_DC_SIZE : int
+        Largest DC difference category representable by the baseline tables.
+
+    MAX_AC_SIZE : int
+        Largest AC coefficient category representable by the baseline tables.
+
+    MAX_CODE_LENGTH : int
+        The longest Huffman code a JPEG table can hold, in bits.
+    """
+
+    # fmt: off
+    ZIGZAG: np.ndarray = np.array([
+        0, 1, 8, 16, 9, 2, 3, 10,
+        17, 24, 32, 25, 18, 11, 4, 5,
+        12, 19, 26, 33, 40, 48, 41, 34,
+        27, 20, 13, 6, 7, 14, 21, 28,
+        35, 42, 49, 56, 57, 50, 43, 36,
+        29, 22, 15, 23, 30, 37, 44, 51,
+        58, 59, 52, 45, 38, 31, 39, 46,
+        53, 60, 61, 54, 47, 55, 62, 63,
+    ])
+    IZIGZAG: np.ndarray = np.argsort(ZIGZAG)
+
+    DC_LUMINANCE_BITS: list[int] = [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+    DC_LUMINANCE_VALUES: list[int] = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+
+    DC_CHROMA_BITS: list[int] = [0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0]
+    DC_CHROMA_VALUES: list[int] = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+
+    AC_LUMINANCE_BITS: list[int] = [0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D]
+    AC_LUMINANCE_VALUES: list[int] = [
+        0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12, 0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+        0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xA1, 0x08, 0x23, 0x42, 0xB1, 0xC1, 0x15, 0x52, 0xD1, 0xF0,
+        0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0A, 0x16, 0x17, 0x18, 0x19, 0x1A, 0x25, 0x26, 0x27, 0x28,
+        0x29, 0x2A, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3A, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48, 0x49,
+        0x4A, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69,
+        0x6A, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7A, 0x83, 0x84, 0x85, 0x86, 0x87, 0x88, 0x89,
+        0x8A, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9A, 0xA2, 0xA3, 0xA4, 0xA5, 0xA6, 0xA7,
+        0xA8, 0xA9, 0xAA, 0xB2, 0xB3, 0xB4, 0xB5, 0xB6, 0xB7, 0xB8, 0xB9, 0xBA, 0xC2, 0xC3, 0xC4, 0xC5,
+        0xC6, 0xC7, 0xC8, 0xC9, 0xCA, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9, 0xDA, 0xE1, 0xE2,
+        0xE3, 0xE4, 0xE5, 0xE6, 0xE7, 0xE8, 0xE9, 0xEA, 0xF1, 0xF2, 0xF3, 0xF4, 0xF5, 0xF6, 0xF7, 0xF8,
+        0xF9, 0xFA,
+    ]
+
+    AC_CHROMA_BITS: list[int] = [0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77]
+    AC_CHROMA_VALUES: list[int] = [
+        0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21, 0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+        0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91, 0xA1, 0xB1, 0xC1, 0x09, 0x23, 0x33, 0x52, 0xF0,
+        0x15, 0x62, 0x72, 0xD1, 0x0A, 0x16, 0x24, 0x34, 0xE1, 0x25, 0xF1, 0x17, 0x18, 0x19, 0x1A, 0x26,
+        0x27, 0x28, 0x29, 0x2A, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3A, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48,
+        0x49, 0x4A, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68,
+        0x69, 0x6A, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7A, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87,
+        0x88, 0x89, 0x8A, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9A, 0xA2, 0xA3, 0xA4, 0xA5,
+        0xA6, 0xA7, 0xA8, 0xA9, 0xAA, 0xB2, 0xB3, 0xB4, 0xB5, 0xB6, 0xB7, 0xB8, 0xB9, 0xBA, 0xC2, 0xC3,
+        0xC4, 0xC5, 0xC6, 0xC7, 0xC8, 0xC9, 0xCA, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9, 0xDA,
+        0xE2, 0xE3, 0xE4, 0xE5, 0xE6, 0xE7, 0xE8, 0xE9, 0xEA, 0xF2, 0xF3, 0xF4, 0xF5, 0xF6, 0xF7, 0xF8,
+        0xF9, 0xFA,
+    ]
+    # fmt: on
+
+    MAX_DC_SIZE: int = 11
+    MAX_AC_SIZE: int = 10
+    MAX_CODE_LENGTH: int = 16
+
+    @staticmethod
+    def zigzag(blocks: np.ndarray) -> np.ndarray:
+        """Reorder 8x8 blocks into zigzag sequences.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Array of shape (..., 8, 8).
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (..., 64) with the coefficients of every block in zigzag order.
+        """
+
+        # gathering with np.take is several times faster than fancy indexing the last axis
+        return np.take(blocks.reshape(*blocks.shape[:-2], 64), EntropyCoding.ZIGZAG, axis=-1)
+
+    @staticmethod
+    def izigzag(coefficients: np.ndarray) -> np.ndarray:
+        """Inverse of `zigzag`, reorders zigzag sequences back into 8x8 blocks.
+
+        Parameters
+        ----------
+        coefficients : np.ndarray
+            Array of shape (..., 64) in zigzag order.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (..., 8, 8).
+        """
+
+        # gathering along the last axis is much faster than scattering into it, see `zigzag`
+        blocks = np.take(coefficients, EntropyCoding.IZIGZAG, axis=-1)
+
+        return blocks.reshape(*coefficients.shape[:-1], 8, 8)
+
+    @staticmethod
+    def huffman_table(q_method: Literal["luminance", "chroma"] | HuffmanTables = "luminance") -> HuffmanTables:
+        """Return the standard (bits, values) specifications of the DC and AC tables for a channel type.
+
+        Parameters
+        ----------
+        q_method : Literal["luminance", "chroma"] | HuffmanTables, optional
+            The channel type, the same value that was used for quantization. The default is "luminance".
+            Explicit `(dc, ac)` specifications (e.g. read from a file) are returned unchanged.
+
+        Returns
+        -------
+        HuffmanTables
+            A tuple `(dc, ac)` where each element is a `(bits, values)` pair.
+        """
+
+        if not isinstance(q_method, str):
+            return q_method
+
+        if q_method == "chroma":
+            return (
+                (EntropyCoding.DC_CHROMA_BITS, EntropyCoding.DC_CHROMA_VALUES),
+                (EntropyCoding.AC_CHROMA_BITS, EntropyCoding.AC_CHROMA_VALUES),
+            )
+
+        return (
+            (EntropyCoding.DC_LUMINANCE_BITS, EntropyCoding.DC_LUMINANCE_VALUES),
+            (EntropyCoding.AC_LUMINANCE_BITS, EntropyCoding.AC_LUMINANCE_VALUES),
+        )
+
+    @staticmethod
+    def huffman_codes(bits: list[int], values: list[int]) -> tuple[np.ndarray, np.ndarray]:
+        """Generate the canonical Huffman codes of a table specification (JPEG Annex C).
+
+        Parameters
+        ----------
+        bits : list[int]
+            Number of codes of each length 1..16.
+        values : list[int]
+            Symbols in order of increasing code length.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            Two arrays of length 256 indexed by symbol: the code and the code length.
+            Symbols that are not part of the table have a code length of 0.
+        """
+
+        codes = np.zeros(256, dtype=np.int64)
+        lengths = np.zeros(256, dtype=np.int64)
+
+        code = 0
+        index = 0
+        for length, count in enumerate(bits, start=1):
+            for _ in range(count):
+                codes[values[index]] = code
+                lengths[values[index]] = length
+                code += 1
+                index += 1
+            code <<= 1
+
+        return codes, lengths
+
+    @staticmethod
+    def huffman_lookup(bits: list[int], values: list[int]) -> list[int]:
+        """Build a decoding table indexed by the next 16 bits of the stream.
+
+        Parameters
+        ----------
+        bits : list[int]
+            Number of codes of each length 1..16.
+        values : list[int]
+            Symbols in order of increasing code length.
+
+        Returns
+        -------
+        list[int]
+            A list of 65536 entries, each one packing `symbol | (code_length << 8)`.
+            Bit patterns that do not start with a valid code map to 0. The tables of the last few Huffman
+            specifications are cached, so the list is shared and must not be modified.
+        """
+
+        return EntropyCoding._huffman_lookup(tuple(bits), tuple(values))
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _huffman_lookup(bits: tuple[int, ...], values: tuple[int, ...]) -> list[int]:
+        # building a table takes longer than decoding a few MCUs, e.g. a row of a region or a progressive scan
+        codes, lengths = EntropyCoding.huffman_codes(list(bits), list(values))
+        lookup = np.zeros(1 << 16, dtype=np.int64)
+
+        for symbol in values:
+            shift = 16 - lengths[symbol]
+            lookup[codes[symbol] << shift : (codes[symbol] + 1) << shift] = symbol | (lengths[symbol] << 8)
+
+        return lookup.tolist()
+
+    @staticmethod
+    def optimal_table(frequencies: np.ndarray) -> HuffmanSpec:
+        """Build the Huffman table specification best suited to the given symbol frequencies (JPEG Annex K.2).
+
+        The code lengths of a Huffman tree over the symbols that occur are limited to `MAX_CODE_LENGTH` bits
+        by moving the deepest codes up the tree (Annex K.3). As in libjpeg, a reserved symbol with the lowest
+        frequency takes the longest code while the tree is built and is then removed, so no code is made of
+        1 bits only.
+
+        Parameters
+        ----------
+        frequencies : np.ndarray
+            Array of shape (256,) with the number of occurrences of every symbol.
+
+        Returns
+        -------
+        HuffmanSpec
+            The `(bits, values)` specification of the table, see `huffman_codes`. Symbols that do not occur
+            get no code.
+        """
+
+        symbols = np.flatnonzero(frequencies).tolist()
+        if not symbols:
+            return [0] * EntropyCoding.MAX_CODE_LENGTH, []
+
+        # the reserved symbol 256 comes last among the symbols of the lowest frequency
+        heap = [(int(frequencies[symbol]), symbol, [symbol]) for symbol in symbols] + [(0, 256, [256])]
+        heapq.heapify(heap)
+
+        code_lengths = dict.fromkeys(symbols + [256], 0)
+        while len(heap) > 1:
+            frequency_a, _, group_a = heapq.heappop(heap)
+            frequency_b, tie_b, group_b = heapq.heappop(heap)
+            for symbol in group_a + group_b:
+                code_lengths[symbol] += 1
+            heapq.heappush(heap, (frequency_a + frequency_b, tie_b, group_a + group_b))
+
+        bits = [0] * (max(code_lengths.values()) + 1)
+        for length in code_lengths.values():
+            bits[length] += 1
+
+        # a pair of codes at the deepest level is replaced by one code one level up, and a code of a
+        # shallower level is split into two codes one level down, until no code is too long
+        for length in range(len(bits) - 1, EntropyCoding.MAX_CODE_LENGTH, -1):
+            while bits[length] > 0:
+                shorter = length - 2
+                while bits[shorter] == 0:
+                    shorter -= 1
+                bits[length] -= 2
+                bits[length - 1] += 1
+                bits[shorter + 1] += 2
+                bits[shorter] -= 1
+
+        bits = (bits + [0] * EntropyCoding.MAX_CODE_LENGTH)[1 : EntropyCoding.MAX_CODE_LENGTH + 1]
+        # the reserved symbol has the last of the longest codes
+        bits[max(index for index, count in enumerate(bits) if count)] -= 1
+        values = sorted(symbols, key=lambda symbol: (code_lengths[symbol], symbol))
+
+        return bits, values
+
+    @staticmethod
+    def magnitude(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Split signed coefficients into their size category and additional bits.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Integer coefficients.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The size category (number of bits of `abs(value)`) and the additional bits,
+            where negative values are stored as `value - 1` in one's complement.
+        """
+
+        values = values.astype(np.int64)
+        # frexp returns abs(values) = mantissa * 2 ** exponent with mantissa in [0.5, 1),
+        # the exponent is therefore the bit length of abs(values), and 0 for 0
+        _, sizes = np.frexp(np.abs(values))
+        sizes = sizes.astype(np.int64)
+        extra = np.where(values < 0, values + (np.int64(1) << sizes) - 1, values)
+
+        return sizes, extra
+
+    @staticmethod
+    def pack_bits(
+        words: np.ndarray, lengths: np.ndarray, intervals: np.ndarray | None = None, first_marker: int = 0
+    ) -> bytes:
+        """Concatenate variable length code words into a byte stream.
+
+        The stream is padded with 1 bits to a byte boundary and every 0xFF byte is
+        followed by a stuffed 0x00 byte, as required for JPEG entropy-coded segments.
+
+        Parameters
+        ----------
+        words : np.ndarray
+            Code words, right aligned.
+        lengths : np.ndarray
+            Number of bits of every code word, at most 32.
+        intervals : np.ndarray, optional
+            The restart interval of every code word, in increasing order from 0. Every interval is padded
+            with 1 bits to a byte boundary and followed by a restart marker, except the last one.
+            If None, the words form a single interval.
+        first_marker : int, optional
+            The number of the first restart marker, the markers RST0 to RST7 are numbered modulo 8.
+            The default is 0.
+
+        Returns
+        -------
+        bytes
+            The packed byte stream.
+        """
+
+        words = words.astype(np.int64)
+        lengths = lengths.astype(np.int64)
+
+        boundaries = np.empty(0, dtype=np.int64)
+        if intervals is not None and intervals.size:
+            n_intervals = int(intervals[-1]) + 1
+            interval_bits = np.bincount(intervals, weights=lengths, minlength=n_intervals).astype(np.int64)
+            padding = -interval_bits % 8
+            last = np.searchsorted(intervals, np.arange(n_intervals), side="right")
+            words = np.insert(words, last, (1 << padding) - 1)
+            lengths = np.insert(lengths, last, padding)
+            boundaries = np.cumsum(interval_bits + padding)[:-1] >> 3
+
+        ends = np.cumsum(lengths)
+        total_bits = int(ends[-1]) if ends.size else 0
+        starts = ends - lengths
+
+        n_bytes = (total_bits + 7) // 8
+        first_byte = starts >> 3
+
+        # align every word inside a 40 bit window starting at its first byte, a word of
+        # at most 32 bits starting at any bit offset always fits into 5 consecutive bytes
+        window = words << (40 - (starts & 7) - lengths)
+
+        # the bits of different words never overlap, so summing the bytes is the same as OR-ing them
+        stream = np.zeros(n_bytes + 5, dtype=np.float64)
+        for k in range(5):
+            stream += np.bincount(
+                first_byte + k, weights=((window >> (32 - 8 * k)) & 0xFF).astype(np.float64), minlength=n_bytes + 5
+            )
+        stream = stream[:n_bytes].astype(np.uint8)
+
+        if total_bits % 8:
+            stream[-1] |= (1 << (8 - total_bits % 8)) - 1
+
+        # np.insert keeps the order of the values inserted at the same position, so the zero stuffed after
+        # the last byte of an interval comes before the marker that follows the interval
+        stuffing = np.flatnonzero(stream == 0xFF)
+        markers = 0xD0 + (first_marker + np.arange(boundaries.size)) % 8
+        stream = np.insert(
+            stream,
+            np.concatenate([stuffing + 1, boundaries, boundaries]),
+            np.concatenate([np.zeros(stuffing.size, np.int64), np.full(boundaries.size, 0xFF), markers]),
+        )
+
+        return stream.tobytes()
+
+    @staticmethod
+    def unstuff(data: bytes) -> bytes:
+        """Remove the 0x00 bytes stuffed after every 0xFF byte of an entropy-coded segment."""
+
+        return data.replace(b"\xff\x00", b"\xff")
+
+    @staticmethod
+    def run_length(
+        blocks: np.ndarray,
+        components: np.ndarray,
+        n_components: int,
+        predictors: np.ndarray | None = None,
+        band: tuple[int, int] = (0, 63),
+        restart: int = 0,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Generate the symbols of a sequence of quantized blocks, before Huffman coding.
+
+        All the work is vectorized over the blocks: DC differences, zero runs, ZRL and EOB
+        symbols are computed with array operations. The symbols are grouped by kind, not in
+        coding order, the returned sort key gives the coding order.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Quantized blocks of shape (N, 8, 8) in coding order.
+        components : np.ndarray
+            Array of shape (N,) with the component index of every block. The DC prediction
+            is done separately for every component.
+        n_components : int
+            The number of components.
+        predictors : np.ndarray, optional
+            The DC value every component is predicted from at the start of the sequence, i.e. the last DC
+            coded before it. If None, the prediction starts from 0, as at the start of a scan.
+        band : tuple[int, int], optional
+            The first and last zigzag index coded, (0, 63) for a sequential scan. A progressive scan
+            (spectral selection) codes either the DC terms only, (0, 0), or a band of AC terms. An EOB
+            ends every block whose last non-zero coefficient comes before the end of the band.
+        restart : int, optional
+            The number of blocks of a restart interval. The prediction starts again from 0 at the first
+            block of every interval, which can then be decoded on its own. The default is 0, no restarts.
+
+        Returns
+        -------
+        tuple
+            A tuple `(block_id, key, is_dc, symbol, extra, extra_length)` of arrays with one entry per symbol:
+            the index of its block, its sort key, whether it is a DC symbol, the symbol byte
+            (DC size category, or (run, size) for AC), and the additional bits with their length.
+
+        Raises
+        ------
+        ValueError
+            If a coefficient is too large to be represented with the baseline tables.
+        """
+
+        n_blocks = blocks.shape[0]
+        start, end = band
+        first = max(start, 1)
+        coefficients = EntropyCoding.zigzag(blocks).astype(np.int64)
+
+        # DPCM coding of the DC terms, each component keeps its own predictor
+        dc = coefficients[:, 0]
+        dc_diff = np.empty(n_blocks, dtype=np.int64)
+        for component in range(n_components):
+            index = np.flatnonzero(components == component)
+            dc_diff[index] = np.diff(dc[index], prepend=0 if predictors is None else predictors[component])
+            if restart:
+                reset = np.ones(index.size, dtype=bool)
+                reset[1:] = index[1:] // restart != index[:-1] // restart
+                dc_diff[index[reset]] = dc[index[reset]]
+        dc_block = np.arange(n_blocks) if start == 0 else np.empty(0, dtype=np.int64)
+        dc_diff = dc_diff[dc_block]
+
+        dc_size, dc_extra = EntropyCoding.magnitude(dc_diff)
+        if dc_size.size and dc_size.max() > EntropyCoding.MAX_DC_SIZE:
+            raise ValueError(f"DC difference of category {dc_size.max()} cannot be coded with the baseline tables.")
+
+        # run-length coding of the AC terms of the band, positions are counted from the first AC term
+        ac = coefficients[:, first : end + 1]
+        nz_block, nz_position = np.nonzero(ac)
+        nz_value = ac[nz_block, nz_position]
+        nz_position += first - 1
+
+        is_first = np.ones(nz_block.size, dtype=bool)
+        is_first[1:] = nz_block[1:] != nz_block[:-1]
+        previous = np.empty_like(nz_position)
+        previous[1:] = nz_position[:-1]
+        previous[is_first] = first - 2
+
+        run = nz_position - previous - 1
+        n_zrl = run // 16
+        run = run % 16
+
+        ac_size, ac_extra = EntropyCoding.magnitude(nz_value)
+        if ac_size.size and ac_size.max() > EntropyCoding.MAX_AC_SIZE:
+            raise ValueError(f"AC coefficient of category {ac_size.max()} cannot be coded with the baseline tables.")
+
+        # blocks whose last non-zero coefficient is not the last one of the band end with an EOB
+        is_last = np.ones(nz_block.size, dtype=bool)
+        is_last[:-1] = nz_block[1:] != nz_block[:-1]
+        last_position = np.full(n_blocks, -1, dtype=np.int64)
+        last_position[nz_block[is_last]] = nz_position[is_last]
+        eob_block = np.flatnonzero(last_position != end - 1) if end > 0 else np.empty(0, dtype=np.int64)
+
+        zrl_source = np.repeat(np.arange(nz_block.size), n_zrl)
+        zrl_sub = np.arange(zrl_source.size) - np.repeat(np.cumsum(n_zrl) - n_zrl, n_zrl)
+
+        # every symbol gets a sort key (block, slot, sub), slot 0 is the DC, slots 1..63 the AC
+        # coefficients and slot 64 the EOB, the ZRL symbols come right before their coefficient
+        n_dc = dc_block.size
+        block_id = np.concatenate([dc_block, nz_block, nz_block[zrl_source], eob_block])
+        slot = np.concatenate(
+            [np.zeros(n_dc, np.int64), nz_position + 1, nz_position[zrl_source] + 1, np.full(eob_block.size, 64)]
+        )
+        sub = np.concatenate(
+            [np.zeros(n_dc, np.int64), np.full(nz_block.size, 3), zrl_sub, np.zeros(eob_block.size, np.int64)]
+        )
+        is_dc = np.concatenate([np.ones(n_dc, bool), np.zeros(nz_block.size + zrl_source.size + eob_block.size, bool)])
+        symbol = np.concatenate(
+            [dc_size, (run << 4) | ac_size, np.full(zrl_source.size, 0xF0), np.zeros(eob_block.size, np.int64)]
+        )
+        extra = np.concatenate([dc_extra, ac_extra, np.zeros(zrl_source.size + eob_block.size, np.int64)])
+        extra_length = np.concatenate([dc_size, ac_size, np.zeros(zrl_source.size + eob_block.size, np.int64)])
+
+        key = (block_id * 65 + slot) * 4 + sub
+
+        return block_id, key, is_dc, symbol, extra, extra_length
+
+    @staticmethod
+    def huffman_encode(
+        symbol: np.ndarray,
+        is_dc: np.ndarray,
+        component: np.ndarray,
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Look up the Huffman code of every symbol in the tables of its component.
+
+        Parameters
+        ----------
+        symbol : np.ndarray
+            The symbol bytes.
+        is_dc : np.ndarray
+            Whether every symbol is coded with the DC or the AC table.
+        component : np.ndarray
+            The component index of every symbol.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The table selection of every component, see `huffman_table`.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The codes and their lengths.
+        """
+
+        codes = np.zeros(symbol.size, dtype=np.int64)
+        code_lengths = np.zeros(symbol.size, dtype=np.int64)
+
+        for index_component, q_method in enumerate(q_methods):
+            (dc_bits, dc_values), (ac_bits, ac_values) = EntropyCoding.huffman_table(q_method)
+            for table_bits, table_values, mask in (
+                (dc_bits, dc_values, is_dc),
+                (ac_bits, ac_values, ~is_dc),
+            ):
+                table_codes, table_lengths = EntropyCoding.huffman_codes(table_bits, table_values)
+                index = np.flatnonzero(mask & (component == index_component))
+                codes[index] = table_codes[symbol[index]]
+                code_lengths[index] = table_lengths[symbol[index]]
+
+        return codes, code_lengths
+
+    @staticmethod
+    def symbols(
+        blocks: np.ndarray,
+        components: np.ndarray,
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        predictors: np.ndarray | None = None,
+        band: tuple[int, int] = (0, 63),
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Generate the Huffman coded words of a sequence of quantized blocks, in coding order.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Quantized blocks of shape (N, 8, 8) in coding order.
+        components : np.ndarray
+            Array of shape (N,) with the component index of every block. The DC prediction
+            is done separately for every component.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The table selection of every component, see `huffman_table`.
+        predictors : np.ndarray, optional
+            The initial DC predictor of every component, see `run_length`.
+        band : tuple[int, int], optional
+            The first and last zigzag index coded, see `run_length`. The default is (0, 63).
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The code words (Huffman code followed by the additional bits) and their lengths.
+
+        Raises
+        ------
+        ValueError
+            If a coefficient is too large to be represented with the baseline tables.
+        """
+
+        run_lengths = EntropyCoding.run_length(blocks, components, len(q_methods), predictors, band)
+        words, lengths, _ = EntropyCoding.code_words(run_lengths, components, q_methods)
+
+        return words, lengths
+
+    @staticmethod
+    def code_words(
+        run_lengths: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        components: np.ndarray,
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Huffman code the symbols generated by `run_length`, in coding order.
+
+        Parameters
+        ----------
+        run_lengths : tuple[np.ndarray, ...]
+            The arrays returned by `run_length`.
+        components : np.ndarray
+            Array with the component index of every block.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The table selection of every component, see `huffman_table`.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            The code words (Huffman code followed by the additional bits), their lengths and their block index.
+        """
+
+        block_id, key, is_dc, symbol, extra, extra_length = run_lengths
+
+        order = np.argsort(key, kind="stable")
+        block_id, is_dc, symbol, extra, extra_length = (
+            block_id[order],
+            is_dc[order],
+            symbol[order],
+            extra[order],
+            extra_length[order],
+        )
+
+        codes, code_lengths = EntropyCoding.huffman_encode(symbol, is_dc, components[block_id], q_methods)
+
+        return (codes << extra_length) | extra, code_lengths + extra_length, block_id
+
+    @staticmethod
+    def estimate_size(
+        components: list[np.ndarray],
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        sampling: list[tuple[int, int]] | None = None,
+    ) -> int:
+        """Compute the size of the stream `encode_components` would produce, without encoding it.
+
+        The number of coded bits is exact, since it only depends on the symbols and not on their order,
+        so the symbols are neither sorted nor packed. The stuffed bytes, which depend on the packed
+        stream, are estimated assuming every byte is 0xFF with probability 1/256.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            Quantized coefficient blocks of every component, see `encode_components`.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The Huffman table selection of every component, see `huffman_table`.
+        sampling : list[tuple[int, int]], optional
+            The (horizontal, vertical) sampling factors of every component, see `encode_components`.
+
+        Returns
+        -------
+        int
+            The estimated size of the entropy-coded stream in bytes.
+        """
+
+        if sampling is None or len(components) == 1:
+            sampling = [(1, 1)] * len(components)
+
+        total_bits = 0
+        for index, (blocks, (h, v)) in enumerate(zip(components, sampling)):
+            # the DC predictor follows the coding order, which groups the blocks by MCU
+            n, m = blocks.shape[0] // v, blocks.shape[1] // h
+            blocks = blocks.reshape(n, v, m, h, 8, 8).transpose(0, 2, 1, 3, 4, 5).reshape(-1, 8, 8)
+            component_ids = np.zeros(blocks.shape[0], dtype=np.int64)
+
+            _, _, is_dc, symbol, _, extra_length = EntropyCoding.run_length(blocks, component_ids, 1)
+            _, code_lengths = EntropyCoding.huffman_encode(
+                symbol, is_dc, component_ids[:1].repeat(symbol.size), [q_methods[index]]
+            )
+
+            total_bits += int(code_lengths.sum() + extra_length.sum())
+
+        n_bytes = (total_bits + 7) // 8
+
+        return n_bytes + n_bytes // 256
+
+    @staticmethod
+    def optimized_tables(
+        components: list[np.ndarray],
+        q_methods: list[Literal["luminance", "chroma"]],
+        sampling: list[tuple[int, int]] | None = None,
+        bands: tuple[tuple[int, int], ...] = ((0, 63),),
+        restart_interval: int = 0,
+    ) -> list[HuffmanTables]:
+        """Build Huffman tables fitted to the symbols of an image, for a second pass of `encode_components`.
+
+        The symbols of every scan are generated with the same vectorized pass as for encoding, without Huffman
+        coding them, and counted per table. The components of the same channel type share their tables, e.g.
+        the Cb and Cr components, as in the table slots of a JFIF file. Every table then gets the shortest
+        codes for its statistics, see `optimal_table`. A file with a single scan can reuse the symbols of the
+        first pass for the second one instead, see `encode_optimized`.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            Quantized coefficient blocks of every component, see `encode_components`.
+        q_methods : list[Literal["luminance", "chroma"]]
+            The channel type of every component.
+        sampling : list[tuple[int, int]], optional
+            The (horizontal, vertical) sampling factors of every component, see `encode_components`.
+        bands : tuple[tuple[int, int], ...], optional
+            The first and last zigzag index of every scan. A scan starting at the DC terms interleaves all the
+            components, the others code a single component each, as in a progressive file, see `JFIF.write`.
+            The default is ((0, 63),), the single scan of a sequential file.
+        restart_interval : int, optional
+            The number of MCUs between two restart markers, where the DC prediction restarts. The default is 0.
+
+        Returns
+        -------
+        list[HuffmanTables]
+            The DC and AC tables of every component.
+
+        Raises
+        ------
+        RuntimeError
+            If the block grids of the components do not match the same MCU grid.
+        """
+
+        counts = 0
+        with stage("huffman_statistics", sum(blocks.nbytes for blocks in components)):
+            for band in bands:
+                if band[0] == 0:
+                    blocks, component_ids = EntropyCoding.mcu_order(components, sampling)
+                    restart = restart_interval * EntropyCoding.mcu_layout(sampling or [(1, 1)] * len(components)).size
+                    scans = [(blocks, component_ids, restart)]
+                else:
+                    scans = [
+                        (blocks.reshape(-1, 8, 8), np.full(blocks.shape[0] * blocks.shape[1], index), 0)
+                        for index, blocks in enumerate(components)
+                    ]
+
+                for blocks, component_ids, restart in scans:
+                    run_lengths = EntropyCoding.run_length(
+                        blocks, component_ids, len(components), band=band, restart=restart
+                    )
+                    counts = counts + EntropyCoding.symbol_counts(run_lengths, component_ids, q_methods)
+
+        return EntropyCoding.fitted_tables(counts, q_methods)
+
+    @staticmethod
+    def symbol_counts(
+        run_lengths: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        components: np.ndarray,
+        q_methods: list[Literal["luminance", "chroma"]],
+    ) -> np.ndarray:
+        """Count the symbols generated by `run_length` per Huffman table.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (G, 2, 256) with the number of occurrences of every DC and AC symbol of every channel
+            type, in order of first appearance in `q_methods`, see `fitted_tables`.
+        """
+
+        groups = list(dict.fromkeys(q_methods))
+        group = np.array([groups.index(q_method) for q_method in q_methods])
+        block_id, _, is_dc, symbol, _, _ = run_lengths
+
+        table = group[components[block_id]] * 2 + ~is_dc
+        counts = np.bincount(table * 256 + symbol, minlength=len(groups) * 512)
+
+        return counts.reshape(len(groups), 2, 256)
+
+    @staticmethod
+    def fitted_tables(counts: np.ndarray, q_methods: list[Literal["luminance", "chroma"]]) -> list[HuffmanTables]:
+        """Build the tables of every component from the symbol counts of its channel type, see `symbol_counts`."""
+
+        groups = list(dict.fromkeys(q_methods))
+        tables = [
+            (EntropyCoding.optimal_table(dc_counts), EntropyCoding.optimal_table(ac_counts))
+            for dc_counts, ac_counts in counts
+        ]
+
+        return [tables[groups.index(q_method)] for q_method in q_methods]
+
+    @staticmethod
+    def encode_optimized(
+        components: list[np.ndarray],
+        q_methods: list[Literal["luminance", "chroma"]],
+        sampling: list[tuple[int, int]] | None = None,
+        restart_interval: int = 0,
+    ) -> tuple[bytes, list[HuffmanTables]]:
+        """Entropy code the single interleaved scan of `encode_components` with Huffman tables fitted to it.
+
+        The symbols are generated once: they are counted to build the tables, see `optimized_tables`, then
+        Huffman coded with them. Fitting the tables only adds the counting and the construction of the tables
+        to the work of `encode_components`.
+
+        Parameters
+        ----------
+        components, q_methods, sampling, restart_interval
+            See `optimized_tables`.
+
+        Returns
+        -------
+        tuple[bytes, list[HuffmanTables]]
+            The entropy-coded byte stream and the DC and AC tables of every component, to be stored in the file.
+
+        Raises
+        ------
+        RuntimeError
+            If the block grids of the components do not match the same MCU grid.
+        """
+
+        with stage("entropy_encode", sum(blocks.nbytes for blocks in components)):
+            blocks, component_ids = EntropyCoding.mcu_order(components, sampling)
+            restart = restart_interval * EntropyCoding.mcu_layout(sampling or [(1, 1)] * len(components)).size
+            run_lengths = EntropyCoding.run_length(blocks, component_ids, len(components), restart=restart)
+
+            counts = EntropyCoding.symbol_counts(run_lengths, component_ids, q_methods)
+            huffman_tables = EntropyCoding.fitted_tables(counts, q_methods)
+
+            words, lengths, block_id = EntropyCoding.code_words(run_lengths, component_ids, huffman_tables)
+
+            return EntropyCoding.pack_bits(words, lengths, block_id // restart if restart else None), huffman_tables
+
+    @staticmethod
+    def mcu_layout(sampling: list[tuple[int, int]]) -> np.ndarray:
+        """The component index of every block of a minimum coded unit (MCU).
+
+        Parameters
+        ----------
+        sampling : list[tuple[int, int]]
+            The (horizontal, vertical) sampling factors of every component. An interleaved MCU holds
+            `horizontal * vertical` blocks of every component, one component after the other.
+            A stream with a single component is never interleaved, its MCU is a single block.
+
+        Returns
+        -------
+        np.ndarray
+            The component index of every block of an MCU, in coding order.
+        """
+
+        if len(sampling) == 1:
+            return np.zeros(1, dtype=np.int64)
+
+        return np.repeat(np.arange(len(sampling)), [h * v for h, v in sampling])
+
+    @staticmethod
+    def encode_components(
+        components: list[np.ndarray],
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        sampling: list[tuple[int, int]] | None = None,
+        band: tuple[int, int] = (0, 63),
+        restart_interval: int = 0,
+        workers: int = 1,
+    ) -> bytes:
+        """Entropy code one or more components into a single interleaved stream.
+
+        The stream is a sequence of minimum coded units (MCU) in raster order. Every MCU holds a
+        `vertical x horizontal` group of blocks of every component, in raster order, the components
+        being coded one after another. Without subsampling this is one block per component.
+
+        With a restart interval, the MCUs are split into runs of `restart_interval` MCUs separated by
+        restart markers, each coded independently of the others, see `encode_intervals`. The runs are
+        then coded by a pool of `workers` processes, each coding a contiguous part of them.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            Quantized coefficient blocks of every component, each of shape (n * vertical, m * horizontal, 8, 8)
+            where (n, m) is the MCU grid.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The Huffman table selection of every component, see `huffman_table`.
+        sampling : list[tuple[int, int]], optional
+            The (horizontal, vertical) sampling factors of every component. If None, every component
+            uses (1, 1) and they all share the same block grid.
+        band : tuple[int, int], optional
+            The first and last zigzag index coded, see `run_length`. The default is (0, 63), all of them.
+        restart_interval : int, optional
+            The number of MCUs between two restart markers. The default is 0, no restart markers.
+        workers : int, optional
+            The number of processes coding the restart intervals in parallel. The default is 1, no pool is started.
+
+        Returns
+        -------
+        bytes
+            The entropy-coded byte stream.
+
+        Raises
+        ------
+        RuntimeError
+            If the block grids of the components do not match the same MCU grid.
+        ValueError
+            If `workers` is smaller than 1.
+        """
+
+        if workers < 1:
+            raise ValueError(f"The number of workers must be at least 1, got {workers}.")
+
+        with stage("entropy_encode", sum(blocks.nbytes for blocks in components)):
+            blocks, component_ids = EntropyCoding.mcu_order(components, sampling)
+
+            if not restart_interval:
+                words, lengths = EntropyCoding.symbols(blocks, component_ids, q_methods, band=band)
+                return EntropyCoding.pack_bits(words, lengths)
+
+            mcu_size = EntropyCoding.mcu_layout(sampling or [(1, 1)] * len(components)).size
+            restart = restart_interval * mcu_size
+            if workers == 1:
+                return EntropyCoding.encode_intervals(blocks, component_ids, q_methods, restart, band=band)
+
+            # every worker codes a contiguous run of intervals, the runs are joined by the markers between them
+            n_intervals = -(-blocks.shape[0] // restart)
+            bounds = np.unique(np.linspace(0, n_intervals, workers + 1).round().astype(np.int64)).tolist()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        EntropyCoding.encode_intervals,
+                        blocks[first * restart : last * restart],
+                        component_ids[first * restart : last * restart],
+                        q_methods,
+                        restart,
+                        first,
+                        band,
+                    )
+                    for first, last in zip(bounds[:-1], bounds[1:])
+                ]
+                parts = [future.result() for future in futures]
+
+            stream = [parts[0]]
+            for first, part in zip(bounds[1:-1], parts[1:]):
+                stream += [bytes([0xFF, 0xD0 + (first - 1) % 8]), part]
+
+            return b"".join(stream)
+
+    @staticmethod
+    def encode_intervals(
+        blocks: np.ndarray,
+        components: np.ndarray,
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        restart: int,
+        first_marker: int = 0,
+        band: tuple[int, int] = (0, 63),
+    ) -> bytes:
+        """Entropy code a sequence of restart intervals, see `encode_components`.
+
+        The DC prediction starts from 0 in every interval, and every interval is padded to a byte boundary
+        and followed by a restart marker, except the last one. Any interval can then be decoded without
+        the ones before it.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Quantized blocks of shape (N, 8, 8) in coding order, starting at the first block of an interval.
+        components : np.ndarray
+            Array of shape (N,) with the component index of every block.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The Huffman table selection of every component, see `huffman_table`.
+        restart : int
+            The number of blocks of an interval, a whole number of MCUs.
+        first_marker : int, optional
+            The number of intervals before the sequence in the scan, which numbers its restart markers.
+            The default is 0, the start of the scan.
+        band : tuple[int, int], optional
+            The first and last zigzag index coded, see `run_length`. The default is (0, 63).
+
+        Returns
+        -------
+        bytes
+            The entropy-coded byte stream.
+        """
+
+        run_lengths = EntropyCoding.run_length(blocks, components, len(q_methods), band=band, restart=restart)
+        words, lengths, block_id = EntropyCoding.code_words(run_lengths, components, q_methods)
+
+        return EntropyCoding.pack_bits(words, lengths, block_id // restart, first_marker)
+
+    @staticmethod
+    def mcu_order(
+        components: list[np.ndarray], sampling: list[tuple[int, int]] | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Interleave the blocks of several components in coding order, see `encode_components`.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            Quantized coefficient blocks of every component, each of shape (n * vertical, m * horizontal, 8, 8).
+        sampling : list[tuple[int, int]], optional
+            The (horizontal, vertical) sampling factors of every component. If None, every component uses (1, 1).
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The blocks of shape (N, 8, 8) in coding order and the component index of every block.
+
+        Raises
+        ------
+        RuntimeError
+            If the block grids of the components do not match the same MCU grid.
+        """
+
+        if sampling is None or len(components) == 1:
+            sampling = [(1, 1)] * len(components)
+
+        grids = {
+            (component.shape[0] // v, component.shape[1] // h, component.shape[0] % v, component.shape[1] % h)
+            for component, (h, v) in zip(components, sampling)
+        }
+        if len(grids) != 1 or next(iter(grids))[2:] != (0, 0):
+            raise RuntimeError(
+                f"The block grids {[component.shape[:2] for component in components]} do not match "
+                f"the sampling factors {sampling}."
+            )
+        n, m, _, _ = grids.pop()
+
+        # (n * v, m * h, 8, 8) -> (n, v, m, h, 8, 8) -> (n, m, v, h, 8, 8) -> (n * m, v * h, 8, 8)
+        mcu_blocks = [
+            component.reshape(n, v, m, h, 8, 8).transpose(0, 2, 1, 3, 4, 5).reshape(n * m, v * h, 8, 8)
+            for component, (h, v) in zip(components, sampling)
+        ]
+        blocks = np.concatenate(mcu_blocks, axis=1).reshape(-1, 8, 8)
+        component_ids = np.tile(EntropyCoding.mcu_layout(sampling), n * m)
+
+        return blocks, component_ids
+
+    @staticmethod
+    def decode_components(
+        data: bytes,
+        shape: tuple[int, int],
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        sampling: list[tuple[int, int]] | None = None,
+        band: tuple[int, int] = (0, 63),
+        bit_offset: int = 0,
+        predictors: list[int] | None = None,
+        restart_interval: int = 0,
+        workers: int = 1,
+    ) -> list[np.ndarray]:
+        """Decode a stream produced by `encode_components`.
+
+        In a progressive scan, only the coefficients of `band` are decoded and the others are left at 0, so
+        the components decoded from the scans of a file add up to its coefficients. Runs of blocks ending
+        with an EOB (the EOBn symbols of progressive AC scans) are understood, successive approximation is not.
+
+        The restart intervals of a stream with restart markers are independent of each other. With more than
+        one worker, the stream is cut at its markers into contiguous runs of intervals, which are decoded by
+        a pool of `workers` processes and joined in order.
+
+        Parameters
+        ----------
+        data : bytes
+            The entropy-coded byte stream.
+        shape : tuple[int, int]
+            The MCU grid (n, m), which is the block grid shared by all the components without subsampling.
+        q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+            The Huffman table selection of every component, see `huffman_table`.
+        sampling : list[tuple[int, int]], optional
+            The (horizontal, vertical) sampling factors of every component. If None, every component uses (1, 1).
+        band : tuple[int, int], optional
+            The first and last zigzag index coded in the stream, see `run_length`. The default is (0, 63).
+        bit_offset : int, optional
+            The number of bits of the first byte of `data` that precede the first block. The default is 0.
+        predictors : list[int], optional
+            The DC value every component is predicted from at the first block, as in `run_length`. Together
+            with `bit_offset` this allows decoding any run of MCUs out of a scan, see `BlockIndex`.
+            If None, the prediction starts from 0, as at the start of a scan.
+        restart_interval : int, optional
+            The number of MCUs between two restart markers of the stream, see `encode_components`. The stream
+            must start at the first MCU of an interval, `predictors` are not used. The default is 0, no markers.
+        workers : int, optional
+            The number of processes decoding the restart intervals in parallel. The default is 1, no pool is started.
+
+        Returns
+        -------
+        list[np.ndarray]
+            The quantized coefficient blocks of every component, each of shape (n * vertical, m * horizontal, 8, 8).
+
+        Raises
+        ------
+        ValueError
+            If the stream contains an invalid Huffman code, misses a restart marker, or `workers` is smaller than 1.
+        """
+
+        if workers < 1:
+            raise ValueError(f"The number of workers must be at least 1, got {workers}.")
+
+        n, m = shape
+        start, end = band
+        if sampling is None or len(q_methods) == 1:
+            sampling = [(1, 1)] * len(q_methods)
+
+        if restart_interval and workers > 1:
+            return EntropyCoding.decode_parallel(data, shape, q_methods, sampling, band, restart_interval, workers)
+
+        layout = EntropyCoding.mcu_layout(sampling)
+        mcu_size = layout.size
+        n_blocks = n * m * mcu_size
+        restart = restart_interval * mcu_size
+
+        lookups = []
+        for q_method in q_methods:
+            (dc_bits, dc_values), (ac_bits, ac_values) = EntropyCoding.huffman_table(q_method)
+            lookups.append(
+                (EntropyCoding.huffman_lookup(dc_bits, dc_values), EntropyCoding.huffman_lookup(ac_bits, ac_values))
+            )
+        block_lookups = [lookups[component] for component in layout.tolist()]
+
+        # trailing 1 bits so that peeking past the end of the stream never fails
+        data = EntropyCoding.unstuff(data) + b"\xff\xff\xff"
+        from_bytes = int.from_bytes
+
+        dc_diff = [0] * n_blocks
+        ac_index: list[int] = []
+        ac_value: list[int] = []
+
+        if band == (0, 0) and not restart:
+            # a progressive DC scan has one symbol per block, which is decoded without a Python loop
+            dc_diff = EntropyCoding.decode_dc(data, n_blocks, [dc_lookup for dc_lookup, _ in block_lookups], bit_offset)
+        else:
+            position = bit_offset
+            first_ac = max(start, 1)
+            # the number of blocks left in the current run of empty blocks, see the EOBn symbols below
+            eob_run = 0
+            for block in range(n_blocks):
+                dc_lookup, ac_lookup = block_lookups[block % mcu_size]
+
+                if restart and block and block % restart == 0:
+                    # the previous interval is padded to a byte boundary, the marker follows it
+                    byte = (position + 7) >> 3
+                    if data[byte] != 0xFF or not 0xD0 <= data[byte + 1] <= 0xD7:
+                        raise ValueError(f"Missing restart marker before block {block}.")
+                    position = (byte + 2) << 3
+                    eob_run = 0
+
+                if start == 0:
+                    byte = position >> 3
+                    entry = dc_lookup[(from_bytes(data[byte : byte + 3]) >> (8 - (position & 7))) & 0xFFFF]
+                    if entry == 0:
+                        raise ValueError(f"Invalid Huffman code in block {block}.")
+                    position += entry >> 8
+                    size = entry & 0xFF
+                    if size:
+                        byte = position >> 3
+                        value = (from_bytes(data[byte : byte + 3]) >> (24 - (position & 7) - size)) & ((1 << size) - 1)
+                        position += size
+                        if value < 1 << (size - 1):
+                            value -= (1 << size) - 1
+                        dc_diff[block] = value
+
+                if eob_run:
+                    eob_run -= 1
+                    continue
+
+                k = first_ac
+                while k <= end:
+                    byte = position >> 3
+                    entry = ac_lookup[(from_bytes(data[byte : byte + 3]) >> (8 - (position & 7))) & 0xFFFF]
+                    if entry == 0:
+                        raise ValueError(f"Invalid Huffman code in block {block}.")
+                    position += entry >> 8
+                    symbol = entry & 0xFF
+                    size = symbol & 0x0F
+
+                    if size == 0:
+                        if symbol == 0xF0:
+                            k += 16
+                            continue
+                        # EOBn ends this block and the next 2^n - 1 + (n additional bits) blocks
+                        run = symbol >> 4
+                        if run:
+                            byte = position >> 3
+                            value = (from_bytes(data[byte : byte + 3]) >> (24 - (position & 7) - run)) & (
+                                (1 << run) - 1
+                            )
+                            position += run
+                            eob_run = (1 << run) + value - 1
+                        break
+
+                    k += symbol >> 4
+                    byte = position >> 3
+                    value = (from_bytes(data[byte : byte + 3]) >> (24 - (position & 7) - size)) & ((1 << size) - 1)
+                    position += size
+                    if value < 1 << (size - 1):
+                        value -= (1 << size) - 1
+
+                    ac_index.append(block * 64 + k)
+                    ac_value.append(value)
+                    k += 1
+
+        coefficients = np.zeros(n_blocks * 64, dtype=np.int32)
+        coefficients[np.array(ac_index, dtype=np.int64)] = ac_value
+        coefficients = coefficients.reshape(n * m, mcu_size, 64)
+        dc_diff = np.array(dc_diff, dtype=np.int64).reshape(n * m, mcu_size)
+
+        components = []
+        for component, (h, v) in enumerate(sampling):
+            slots = np.flatnonzero(layout == component)
+
+            # undo the DPCM coding, the predictor runs over the blocks of the component in coding order
+            component_coefficients = coefficients[:, slots]
+            dc = np.cumsum(dc_diff[:, slots].reshape(-1))
+            if restart:
+                # the prediction starts again from 0 at the first MCU of every interval
+                first = np.arange(n * m) // restart_interval * restart_interval * slots.size
+                dc -= np.concatenate([[0], dc])[first].repeat(slots.size)
+            elif predictors is not None:
+                dc += predictors[component]
+            component_coefficients[:, :, 0] = dc.reshape(n * m, slots.size)
+
+            # (n * m, v * h, 64) -> (n, m, v, h, 64) -> (n, v, m, h, 64) -> (n * v, m * h, 64)
+            component_coefficients = component_coefficients.reshape(n, m, v, h, 64).transpose(0, 2, 1, 3, 4)
+            components.append(EntropyCoding.izigzag(component_coefficients.reshape(n * v, m * h, 64)))
+
+        return components
+
+    @staticmethod
+    def decode_parallel(
+        data: bytes,
+        shape: tuple[int, int],
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        sampling: list[tuple[int, int]],
+        band: tuple[int, int],
+        restart_interval: int,
+        workers: int,
+    ) -> list[np.ndarray]:
+        """Decode the restart intervals of a stream in a pool of `workers` processes, see `decode_components`.
+
+        Raises
+        ------
+        ValueError
+            If the number of restart markers does not match the number of MCUs, or an interval cannot be decoded.
+        """
+
+        n, m = shape
+        n_intervals = -(-n * m // restart_interval)
+        # stuffed 0xFF bytes are followed by 0x00, so every 0xFF byte followed by 0xD0 to 0xD7 is a marker
+        markers = [match.start() for match in re.finditer(rb"\xff[\xd0-\xd7]", data)]
+        if len(markers) != n_intervals - 1:
+            raise ValueError(f"The stream holds {len(markers) + 1} restart intervals, expected {n_intervals}.")
+
+        bounds = np.unique(np.linspace(0, n_intervals, workers + 1).round().astype(np.int64)).tolist()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                begin = markers[first - 1] + 2 if first else 0
+                stop = markers[last - 1] if last < n_intervals else len(data)
+                mcus = min(last * restart_interval, n * m) - first * restart_interval
+                futures.append(
+                    executor.submit(
+                        EntropyCoding.decode_components,
+                        data[begin:stop],
+                        (1, mcus),
+                        q_methods,
+                        sampling,
+                        band,
+                        restart_interval=restart_interval,
+                    )
+                )
+            parts = [future.result() for future in futures]
+
+        # every part holds a single row of MCUs, (v, n * m * h) -> (v, n, m * h) -> (n * v, m * h)
+        components = []
+        for index, (h, v) in enumerate(sampling):
+            blocks = np.concatenate([part[index] for part in parts], axis=1)
+            components.append(blocks.reshape(v, n, m * h, 8, 8).transpose(1, 0, 2, 3, 4).reshape(n * v, m * h, 8, 8))
+
+        return components
+
+    @staticmethod
+    def decode_dc(data: bytes, n_blocks: int, lookups: list[list[int]], bit_offset: int = 0) -> np.ndarray:
+        """Decode the DC differences of a progressive DC scan, see `decode_components`.
+
+        Every block holds a single DC symbol, so the length of the code word starting at every bit of the stream
+        (Huffman code and additional bits) is computed at once with array operations. Only following these
+        lengths from one block to the next is left to a loop, which does nothing else.
+
+        Parameters
+        ----------
+        data : bytes
+            The unstuffed stream, followed by at least 3 bytes of padding.
+        n_blocks : int
+            The number of blocks of the scan.
+        lookups : list[list[int]]
+            The DC decoding table of every block of an MCU, see `huffman_lookup`.
+        bit_offset : int, optional
+            The position of the first block in the stream, in bits. The default is 0.
+
+        Returns
+        -------
+        np.ndarray
+            The DC difference of every block.
+
+        Raises
+        ------
+        ValueError
+            If the stream contains an invalid Huffman code.
+        """
+
+        stream = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+        # the 24 bits starting at every byte, enough for a code of up to 16 bits at any bit offset
+        windows = (stream[:-2] << 16) | (stream[1:-1] << 8) | stream[2:]
+        positions = np.arange(8 * windows.size)
+        peek = (windows[positions >> 3] >> (8 - (positions & 7))) & 0xFFFF
+
+        tables = {id(lookup): np.asarray(lookup, dtype=np.int64) for lookup in lookups}
+        entries = {key: table[peek] for key, table in tables.items()}
+        # the number of bits of the symbol starting at every position, or 0 where no valid code starts
+        jumps = {key: (((entry >> 8) + (entry & 0xFF)) * (entry != 0)).tolist() for key, entry in entries.items()}
+
+        mcu_jumps = [jumps[id(lookup)] for lookup in lookups]
+        mcu_size = len(lookups)
+        starts = [0] * n_blocks
+        position = bit_offset
+        try:
+            for block in range(n_blocks):
+                starts[block] = position
+                position += mcu_jumps[block % mcu_size][position]
+        except IndexError:
+            raise ValueError(f"The scan ends before block {block}.") from None
+
+        starts = np.array(starts, dtype=np.int64)
+        slots = np.arange(n_blocks) % mcu_size
+        entry = np.empty(n_blocks, dtype=np.int64)
+        for slot, lookup in enumerate(lookups):
+            index = np.flatnonzero(slots == slot)
+            entry[index] = entries[id(lookup)][starts[index]]
+        if n_blocks and not entry.all():
+            raise ValueError(f"Invalid Huffman code in block {int(np.argmin(entry != 0))}.")
+
+        # the additional bits follow the code, at most 11 bits at any bit offset fit in a 24 bit window
+        size = entry & 0xFF
+        extra = starts + (entry >> 8)
+        value = (windows[extra >> 3] >> (24 - (extra & 7) - size)) & ((1 << size) - 1)
+
+        return np.where(value < (1 << size) >> 1, value - (1 << size) + 1, value) * (size > 0)
+
+    @staticmethod
+    def encode(blocks: np.ndarray, q_method: Literal["luminance", "chroma"] = "luminance") -> bytes:
+        """Entropy code the quantized blocks of a single channel.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Quantized coefficient blocks of shape (n, m, 8, 8),
+            as returned by `JPEGCompression.quantize`.
+        q_method : Literal["luminance", "chroma"], optional
+            Selects the standard luminance or chroma Huffman tables. The default is "luminance".
+
+        Returns
+        -------
+        bytes
+            The entropy-coded byte stream.
+        """
+
+        return EntropyCoding.encode_components([blocks], [q_method])
+
+    @staticmethod
+    def decode(
+        data: bytes, shape: tuple[int, int], q_method: Literal["luminance", "chroma"] = "luminance"
+    ) -> np.ndarray:
+        """Decode a single channel stream produced by `encode`.
+
+        Parameters
+        ----------
+        data : bytes
+            The entropy-coded byte stream.
+        shape : tuple[int, int]
+            The block grid (n, m) of the channel.
+        q_method : Literal["luminance", "chroma"], optional
+            Selects the standard luminance or chroma Huffman tables. The default is "luminance".
+
+        Returns
+        -------
+        np.ndarray
+            The quantized coefficient blocks of shape (n, m, 8, 8).
+        """
+
+        return EntropyCoding.decode_components(data, shape, [q_method])[0]
+
+
+class ScanEncoder:
+    """Entropy codes a scan incrementally, a few MCU rows at a time.
+
+    The stream produced by successive calls to `encode` followed by `flush` is the same as the one
+    `EntropyCoding.encode_components` produces for all the rows at once: the DC predictors and the
+    bits of the last incomplete byte are carried over from one call to the next.
+
+    Parameters
+    ----------
+    q_methods : list[Literal["luminance", "chroma"] | HuffmanTables]
+        The Huffman table selection of every component, see `EntropyCoding.huffman_table`.
+    sampling : list[tuple[int, int]], optional
+        The (horizontal, vertical) sampling factors of every component. If None, no component is subsampled.
+
+    Attributes
+    ----------
+    predictors : np.ndarray
+        The last DC value coded for every component.
+    pending : tuple[int, int]
+        The bits that do not fill a whole byte yet, as a (value, length) pair.
+    """
+
+    def __init__(
+        self,
+        q_methods: list[Literal["luminance", "chroma"] | HuffmanTables],
+        sampling: list[tuple[int, int]] | None = None,
+    ):
+        self.q_methods = q_methods
+        self.sampling = sampling
+        self.predictors: np.ndarray = np.zeros(len(q_methods), dtype=np.int64)
+        self.pending: tuple[int, int] = (0, 0)
+
+    def encode(self, components: list[np.ndarray]) -> bytes:
+        """Entropy code the next MCU rows of the scan.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            Quantized coefficient blocks of every component, see `EntropyCoding.encode_components`.
+
+        Returns
+        -------
+        bytes
+            The complete bytes of the stream produced so far, stuffed.
+        """
+
+        with stage("entropy_encode", sum(blocks.nbytes for blocks in components)):
+            blocks, component_ids = EntropyCoding.mcu_order(components, self.sampling)
+            words, lengths = EntropyCoding.symbols(blocks, component_ids, self.q_methods, self.predictors)
+
+        for component in range(len(self.q_methods)):
+            index = np.flatnonzero(component_ids == component)
+            if index.size:
+                self.predictors[component] = blocks[index[-1], 0, 0]
+
+        value, length = self.pending
+        if length:
+            words = np.concatenate([[value], words])
+            lengths = np.concatenate([[length], lengths])
+
+        data = EntropyCoding.pack_bits(words, lengths)
+
+        # keep the bits of the last, incomplete byte for the next call, the padding only filled its low bits
+        remainder = int(lengths.sum()) % 8
+        if remainder:
+            last, data = (0xFF, data[:-2]) if data.endswith(b"\xff\x00") else (data[-1], data[:-1])
+            self.pending = (last >> (8 - remainder), remainder)
+        else:
+            self.pending = (0, 0)
+
+        return data
+
+    def flush(self) -> bytes:
+        """Pad the pending bits with 1 bits to a byte boundary, ending the scan."""
+
+        value, length = self.pending
+        self.pending = (0, 0)
+        if not length:
+            return b""
+
+        return EntropyCoding.pack_bits(np.array([value]), np.array([length]))
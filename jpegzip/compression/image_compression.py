@@ -1,8 +1,26 @@
 import logging
+from typing import BinaryIO, Callable, Literal
 
 import numpy as np
+from jpegzip.compression.block_index import BlockIndex
+from jpegzip.compression.entropy_coding import EntropyCoding, ScanEncoder
+from jpegzip.compression.jfif import JFIF
 from jpegzip.compression.jpeg_compression import JPEGCompression
-from jpegzip.utils.image import rgb_to_ycbcr, ycbcr_to_rgb
+from jpegzip.compression.transforms import get_transform
+from jpegzip.utils.image import (
+    CHROMA_SUBSAMPLING,
+    RGB_TO_YCBCR,
+    YCBCR_BIAS,
+    YCBCR_TO_RGB,
+    ImageBlockProcessor,
+    Subsampling,
+    downsample,
+    rgb_to_ycbcr,
+    upsample,
+    ycbcr_to_rgb,
+)
+from jpegzip.utils.precision import compute_dtype
+from jpegzip.utils.profiling import stage
 from skimage.metrics import mean_squared_error
 
 logger = logging.getLogger(__name__)
@@ -11,10 +29,14 @@ logger = logging.getLogger(__name__)
 class ImageCompression:
     MSE_TOLERANCE: float = 10.0
     MAX_ITERATIONS: int = 30
-    FACTOR_RATE: float = 0.5
+    BRACKET_STEP: float = 1.25
+    Q_FACTOR_MIN: float = 1 / 128
+    Q_FACTOR_MAX: float = 256.0
+    Q_FACTOR_PRECISION: float = 1e-3
+    TILE_ROWS: int = 64
 
     @staticmethod
-    def compress_rgb(image: np.ndarray, q_factor: float = 1.0) -> np.ndarray:
+    def compress_rgb(image: np.ndarray, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4") -> np.ndarray:
         """Compress an image using JPEG compression on the YCbCr channels.
 
         The function compresses the image by converting it to the YCbCr color space
@@ -35,6 +57,12 @@ class ImageCompression:
             Conversely, lower values reduce the compression and preserve more image
             details. The default value is 1.
 
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode, see `CHROMA_SUBSAMPLING`. With "4:2:2" the chroma channels are
+            encoded at half the horizontal resolution, with "4:2:0" at half the resolution on both axes,
+            which divides the chroma work by 4. They are upsampled back after decoding.
+            The default is "4:4:4" (no subsampling).
+
         Returns
         -------
         np.ndarray
@@ -53,31 +81,504 @@ class ImageCompression:
                 f"Invalid image dimensions: {image.ndim}. Expected a 2D grayscale image or a 3D RGB image."
             )
 
-        image_ycbcr = rgb_to_ycbcr(image) if image.ndim == 3 else image
+        if image.ndim == 2:
+            return JPEGCompression.decode(
+                JPEGCompression.encode(image, q_method="luminance", q_factor=q_factor), image.shape
+            )
 
-        y_channel = image_ycbcr[:, :, 0] if image.ndim == 3 else image_ycbcr
-        cb_channel = image_ycbcr[:, :, 1] if image.ndim == 3 else None
-        cr_channel = image_ycbcr[:, :, 2] if image.ndim == 3 else None
+        image_ycbcr = rgb_to_ycbcr(image)
+        shape = image.shape[:2]
+        factors = CHROMA_SUBSAMPLING[subsampling]
 
-        # fmt: off
-        y_channel_compressed = JPEGCompression.decode(JPEGCompression.encode(y_channel, q_method="luminance", q_factor=q_factor), y_channel.shape)
-        cb_channel_compressed = JPEGCompression.decode(JPEGCompression.encode(cb_channel, q_method="chroma", q_factor=q_factor), cb_channel.shape) if cb_channel is not None else None
-        cr_channel_compressed = JPEGCompression.decode(JPEGCompression.encode(cr_channel, q_method="chroma", q_factor=q_factor), cr_channel.shape) if cr_channel is not None else None
-        # fmt: on
+        # every group of channels sharing a resolution goes through a single batched encode and decode pass
+        if factors == (1, 1):
+            image_ycbcr_compressed = JPEGCompression.decode_channels(
+                JPEGCompression.encode_channels(image_ycbcr, ["luminance", "chroma", "chroma"], q_factor=q_factor),
+                shape,
+            )
+        else:
+            chroma = downsample(image_ycbcr[:, :, 1:], factors)
 
-        if image.ndim == 3:
             # fmt: off
-            image_ycbcr_compressed = np.stack([y_channel_compressed, cb_channel_compressed, cr_channel_compressed], axis=-1)
+            y_channel_compressed = JPEGCompression.decode_channels(JPEGCompression.encode_channels(image_ycbcr[:, :, :1], ["luminance"], q_factor=q_factor), shape)
+            chroma_compressed = JPEGCompression.decode_channels(JPEGCompression.encode_channels(chroma, ["chroma", "chroma"], q_factor=q_factor), chroma.shape[:2])
             # fmt: on
-            rgb_image_compressed = ycbcr_to_rgb(image_ycbcr_compressed)
 
-            return rgb_image_compressed
+            image_ycbcr_compressed = np.concatenate(
+                [y_channel_compressed, upsample(chroma_compressed, factors, shape)], axis=-1
+            )
+
+        rgb_image_compressed = ycbcr_to_rgb(image_ycbcr_compressed)
+
+        return rgb_image_compressed
+
+    @staticmethod
+    def mse_model(
+        image: np.ndarray, subsampling: Subsampling = "4:4:4", baseline: bool = False
+    ) -> tuple[Callable[[float], float], Callable[[float], np.ndarray]]:
+        """Build an estimate of the MSE of `compress_rgb` as a function of the quality factor, without decoding.
+
+        The DCT is orthonormal, so by Parseval's identity the squared error of a block is the squared error of
+        its coefficients. The image is converted and transformed once, then every estimate only quantizes the
+        cached coefficients again. The error is measured against the coefficients of the exact (not rounded)
+        YCbCr image, which accounts for the pre-rounding of `JPEGCompression.transform` and the rounding of the
+        colour conversion, and is mapped to RGB through the Gram matrix of the inverse colour transform, the
+        correlation of the errors of channels coded at the same resolution included. With chroma subsampling,
+        the error of the downsampling itself is a constant computed once: it is orthogonal to the upsampled
+        chroma error, because the boxes are averaged and upsampling repeats pixels.
+
+        What the coefficients do not see is added as the expected error of rounding the decoded channels. The error
+        of the padding is assumed to be the mean error of the image. Clipping to [0, 255] and the correlation between
+        the luma and the subsampled chroma errors are left out, so the estimate is usually a few percent above the
+        real MSE, see `search_q_factor` for how it is calibrated.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            The input image, a 2D grayscale image or a 3D RGB image.
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], default="4:4:4"
+            The chroma subsampling mode, see `compress_rgb`.
+        baseline : bool, default=False
+            If True, the quantization steps are clamped like the ones of JPEG files, see `search_q_factor_jpeg`.
+
+        Returns
+        -------
+        tuple
+            A tuple `(estimate, compress)` of functions of the quality factor:
+            - `estimate` : Callable[[float], float]
+                The estimated MSE of `compress_rgb(image, q_factor, subsampling)`.
+            - `compress` : Callable[[float], np.ndarray]
+                The result of `compress_rgb(image, q_factor, subsampling)`, decoded from the cached coefficients.
+        """
+
+        def coefficients(channels: np.ndarray) -> np.ndarray:
+            # the DCT of centered channels of shape (H, W, C), padded like `JPEGCompression.encode_channels`
+            x = np.subtract(np.moveaxis(channels, -1, 0), JPEGCompression.PIXEL_MEAN, dtype=compute_dtype())
+            return get_transform().dct(ImageBlockProcessor.blocks(ImageBlockProcessor.pad(x)))
+
+        def quantize(y_blocks: np.ndarray, q_methods: list[str], q_factor: float) -> np.ndarray:
+            # the dequantized coefficients, like `JPEGCompression.encode_channels` computes them in place
+            Q = JPEGCompression.quantization_matrices(q_methods, q_factor, baseline)[:, None, None]
+            y_quantized = np.divide(y_blocks, Q)
+            np.round(y_quantized, out=y_quantized)
+            np.multiply(y_quantized, Q, out=y_quantized)
+
+            return y_quantized
+
+        shape = image.shape[:2]
+        factors = CHROMA_SUBSAMPLING[subsampling]
+        fixed = 0.0
+
+        if image.ndim == 2:
+            # (coded channels, exact channels, quantization methods, channel indices)
+            groups = [(image[:, :, None], image[:, :, None], ["luminance"], [0])]
+            gram = np.ones((1, 1))
+        else:
+            image_ycbcr = rgb_to_ycbcr(image)
+            exact = image.astype(compute_dtype()) @ RGB_TO_YCBCR.T.astype(compute_dtype())
+            exact += YCBCR_BIAS.astype(compute_dtype())
+
+            # the mean over the RGB channels of |YCBCR_TO_RGB @ e|² is eᵀ G e
+            gram = YCBCR_TO_RGB.T @ YCBCR_TO_RGB / 3
+
+            if factors == (1, 1):
+                groups = [(image_ycbcr, exact, ["luminance", "chroma", "chroma"], [0, 1, 2])]
+            else:
+                chroma = downsample(exact[:, :, 1:], factors)
+                residual = (exact[:, :, 1:] - upsample(chroma, factors, shape)).reshape(-1, 2)
+                fixed = float(np.sum((residual.T @ residual) * gram[1:, 1:]))
+
+                groups = [
+                    (image_ycbcr[:, :, :1], exact[:, :, :1], ["luminance"], [0]),
+                    (downsample(image_ycbcr[:, :, 1:], factors), chroma, ["chroma", "chroma"], [1, 2]),
+                ]
+
+        groups = [
+            (
+                JPEGCompression.transform(np.moveaxis(coded, -1, 0)),
+                coefficients(exact),
+                q_methods,
+                np.ix_(index, index),
+                coded.shape[:2],
+            )
+            for coded, exact, q_methods, index in groups
+        ]
+
+        # every decoded channel is rounded to an integer, and RGB channels are truncated to uint8
+        rounding = np.trace(gram) / 12 + (1 / 3 if image.ndim == 3 else 0)
+
+        # the estimates reuse the same buffers, the search evaluates many of them
+        buffers = [np.empty_like(y_blocks) for y_blocks, *_ in groups]
+
+        def estimate(q_factor: float) -> float:
+            mse = fixed / (shape[0] * shape[1]) + rounding
+            for (y_blocks, reference, q_methods, index, _), buffer in zip(groups, buffers):
+                # multiplying by the inverse is faster than dividing, an estimate does not need the exact ties
+                Q = JPEGCompression.quantization_matrices(q_methods, q_factor, baseline)[:, None, None]
+                error = np.multiply(y_blocks, 1 / Q, out=buffer)
+                np.round(error, out=error)
+                np.multiply(error, Q, out=error)
+                np.subtract(error, reference, out=error)
+                error = error.reshape(len(q_methods), -1)
+
+                # the mean error of the padded channels, upsampling by repeating pixels does not change it,
+                # the dot products of the channels are faster than a (C, N) @ (N, C) product
+                weights = gram[index]
+                for i, j in zip(*np.triu_indices(len(q_methods))):
+                    mse += (1 if i == j else 2) * weights[i, j] * float(np.dot(error[i], error[j])) / error.shape[1]
+
+            return mse
+
+        def compress(q_factor: float) -> np.ndarray:
+            channels = [
+                JPEGCompression.decode_channels(
+                    ImageBlockProcessor.iblocks(quantize(y_blocks, q_methods, q_factor)), channels_shape
+                )
+                for y_blocks, _, q_methods, _, channels_shape in groups
+            ]
+
+            if image.ndim == 2:
+                return channels[0][:, :, 0]
+            if len(channels) == 1:
+                return ycbcr_to_rgb(channels[0])
+
+            return ycbcr_to_rgb(np.concatenate([channels[0], upsample(channels[1], factors, shape)], axis=-1))
+
+        return estimate, compress
+
+    @staticmethod
+    def solve_q_factor(
+        mse: Callable[[float], float],
+        target_mse: float,
+        q_factor: float = 1.0,
+        tolerance: float | None = None,
+        bounds: tuple[float, float] | None = None,
+    ) -> tuple[float, float, int]:
+        """Search the quality factor for which a function of it, e.g. the estimate of `mse_model`, reaches a target.
+
+        The function is assumed to grow with `q_factor`, so the search first brackets the target between
+        a `q_factor` below and one above it, starting from the proportional estimate `q_factor * target_mse / mse`.
+        The bracket is then shrunk with secant steps on `log(q_factor)` against `log(mse)`, falling back
+        to bisection whenever a secant step would not shrink it enough. The search therefore always converges.
+
+        Parameters
+        ----------
+        mse : Callable[[float], float]
+            The function of the quality factor.
+        target_mse : float
+            The target value of the function.
+        q_factor : float, default=1.0
+            The quality factor the search starts from.
+        tolerance : float, optional
+            How far from the target the value may be. If None, `MSE_TOLERANCE` is used.
+        bounds : tuple[float, float], optional
+            The range of quality factors to search in. If None, `Q_FACTOR_MIN` to `Q_FACTOR_MAX` are used.
+
+        Returns
+        -------
+        tuple
+            A tuple `(q_factor, mse, evaluations)` with the quality factor found, its value and the number
+            of evaluations of the function. If the target is outside of the values reached in `bounds`,
+            the closest bound is returned.
+        """
+
+        tolerance = ImageCompression.MSE_TOLERANCE if tolerance is None else tolerance
+        q_min, q_max = (ImageCompression.Q_FACTOR_MIN, ImageCompression.Q_FACTOR_MAX) if bounds is None else bounds
+
+        # (q_factor, mse) of the closest evaluated points below and above the target
+        lower: tuple[float, float] | None = None
+        upper: tuple[float, float] | None = None
+        best: tuple[float, float] | None = None
+        last_side: bool | None = None
+        repeated_side = False
+
+        q_factor = float(np.clip(q_factor, q_min, q_max))
+
+        for evaluations in range(1, ImageCompression.MAX_ITERATIONS + 1):
+            value = mse(q_factor)
+
+            if best is None or np.abs(target_mse - value) < np.abs(target_mse - best[1]):
+                best = (q_factor, value)
+
+            if np.abs(target_mse - value) <= tolerance:
+                return q_factor, value, evaluations
+
+            side = value < target_mse
+            repeated_side = side == last_side
+            last_side = side
+            if side:
+                lower = (q_factor, value)
+            else:
+                upper = (q_factor, value)
+
+            if lower is None or upper is None:
+                # not bracketed yet, move in the right direction by at least BRACKET_STEP
+                if (side and q_factor >= q_max) or (not side and q_factor <= q_min):
+                    return q_factor, value, evaluations
+
+                q_factor_new = q_factor * target_mse / max(value, np.finfo(np.float64).tiny)
+                if side:
+                    q_factor_new = max(q_factor_new, q_factor * ImageCompression.BRACKET_STEP)
+                else:
+                    q_factor_new = min(q_factor_new, q_factor / ImageCompression.BRACKET_STEP)
+
+                q_factor = float(np.clip(q_factor_new, q_min, q_max))
+                continue
+
+            (q_lower, mse_lower), (q_upper, mse_upper) = lower, upper
+            if q_upper / q_lower < 1 + ImageCompression.Q_FACTOR_PRECISION:
+                # the value jumps over the tolerance band between two almost equal quality factors
+                break
+
+            q_factor = ImageCompression.secant_step(lower, upper, target_mse, repeated_side)
+
+        return *best, evaluations
+
+    @staticmethod
+    def secant_step(
+        lower: tuple[float, float], upper: tuple[float, float], target_mse: float, bisect: bool = False
+    ) -> float:
+        """The next quality factor of a bracketing search, between `lower` and `upper`, see `solve_q_factor`.
+
+        The secant step must land well inside the bracket, and after two updates of the same side in a row
+        (a slowly converging secant, `bisect`) the bracket is bisected instead.
+        """
+
+        (q_lower, mse_lower), (q_upper, mse_upper) = lower, upper
+        log_lower, log_upper = np.log(q_lower), np.log(q_upper)
+        t = (np.log(target_mse) - np.log(max(mse_lower, np.finfo(np.float64).tiny))) / (
+            np.log(mse_upper) - np.log(max(mse_lower, np.finfo(np.float64).tiny))
+        )
+        log_q_factor = log_lower + t * (log_upper - log_lower)
+
+        margin = 0.05 * (log_upper - log_lower)
+        if bisect or not np.isfinite(log_q_factor) or not log_lower + margin < log_q_factor < log_upper - margin:
+            log_q_factor = (log_lower + log_upper) / 2
+
+        return float(np.exp(log_q_factor))
+
+    @staticmethod
+    def search_q_factor(
+        image: np.ndarray, target_mse: float, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+    ) -> tuple[np.ndarray, float, float, int]:
+        """Search the quality factor whose compression reaches a target Mean Squared Error (MSE).
+
+        The image is transformed once by `mse_model`, and the quality factor is searched on its estimate
+        with `solve_q_factor`, which only quantizes the cached coefficients again. Only the chosen quality
+        factor is decoded, from the same coefficients, and its real MSE measured. The estimate leaves out
+        clipping and the luma and chroma correlation, so when the real MSE misses the target the estimate is
+        scaled by their ratio at that quality factor and searched again. The quality factors decoded so far
+        bracket the target like in `solve_q_factor`, and a new one that does not shrink the bracket enough is
+        replaced by a secant or bisection step, so the search always converges. It usually takes one or two
+        compressions, where a search on full compressions alone takes four to six.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            The input image as a NumPy array.
+        target_mse : float
+            The target Mean Squared Error (MSE) to achieve after compression.
+        q_factor : float, default=1.0
+            The quality factor the search starts from, e.g. the one found for the previous video frame.
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], default="4:4:4"
+            The chroma subsampling mode, see `compress_rgb`.
+
+        Returns
+        -------
+        tuple
+            A tuple `(compressed_image, q_factor, mse, iterations)` with the compressed image closest to the
+            target, its quality factor and MSE, and the number of compressions performed.
+
+        Raises
+        ------
+        RuntimeError
+            If the target MSE is outside the range reachable with `Q_FACTOR_MIN` to `Q_FACTOR_MAX`,
+            or if it cannot be achieved within the maximum allowed iterations.
+        """
+
+        estimate, compress = ImageCompression.mse_model(image, subsampling)
+
+        return ImageCompression.search_calibrated(image, target_mse, estimate, compress, q_factor)
+
+    @staticmethod
+    def search_q_factor_jpeg(
+        image: np.ndarray, target_mse: float, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+    ) -> tuple[bytes, np.ndarray, float, float, int]:
+        """Search the quality factor whose JFIF file reaches a target Mean Squared Error (MSE), and write the file.
+
+        Like `search_q_factor`, but every candidate is the image a decoder reads from the file of `compress_jpeg`,
+        reconstructed from the quantized coefficients of `jpeg_coefficients` without entropy coding, see
+        `encode_jpeg`. The estimate of `mse_model` uses the clamped steps of the file and is calibrated on these
+        reconstructions, so only the chosen quality factor is entropy coded.
+
+        Parameters
+        ----------
+        image, target_mse, q_factor, subsampling
+            See `search_q_factor`.
+
+        Returns
+        -------
+        tuple
+            A tuple `(data, compressed_image, q_factor, mse, iterations)` with the content of the .jpg file,
+            its decoded image, its quality factor and MSE, and the number of reconstructions performed.
+
+        Raises
+        ------
+        RuntimeError
+            If the target MSE is outside the range reachable with `Q_FACTOR_MIN` to `Q_FACTOR_MAX`,
+            or if it cannot be achieved within the maximum allowed iterations.
+        """
+
+        estimate, _ = ImageCompression.mse_model(image, subsampling, baseline=True)
+        coefficients, q_methods, sampling = ImageCompression.jpeg_coefficients(image, subsampling)
+
+        def quantize(q_factor: float) -> tuple[list[np.ndarray], list[np.ndarray]]:
+            components = [
+                JPEGCompression.quantize_coefficients(blocks, q_method=q_method, q_factor=q_factor, baseline=True)
+                for blocks, q_method in zip(coefficients, q_methods)
+            ]
+            q_tables = [
+                JPEGCompression.quantization_matrix(q_method, q_factor, baseline=True) for q_method in q_methods
+            ]
+
+            return components, q_tables
+
+        def compress(q_factor: float) -> np.ndarray:
+            return ImageCompression.reconstruct_jpeg(*quantize(q_factor), image.shape[:2])
+
+        compressed_image, q_factor, mse, iterations = ImageCompression.search_calibrated(
+            image, target_mse, estimate, compress, q_factor
+        )
+        components, q_tables = quantize(q_factor)
+        data = JFIF.write(components, q_methods, q_tables, image.shape[:2], sampling=sampling)
+
+        return data, compressed_image, q_factor, mse, iterations
+
+    @staticmethod
+    def search_calibrated(
+        image: np.ndarray,
+        target_mse: float,
+        estimate: Callable[[float], float],
+        compress: Callable[[float], np.ndarray],
+        q_factor: float = 1.0,
+    ) -> tuple[np.ndarray, float, float, int]:
+        """Search a quality factor on an estimate of the MSE, calibrated on real compressions.
+
+        This is the search of `search_q_factor`, for any pair of functions like the ones of `mse_model`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            The input image, the MSE of the compressed images is measured against it.
+        target_mse : float
+            The target Mean Squared Error (MSE) to achieve after compression.
+        estimate : Callable[[float], float]
+            The estimated MSE as a function of the quality factor.
+        compress : Callable[[float], np.ndarray]
+            The decoded compressed image as a function of the quality factor.
+        q_factor : float, default=1.0
+            The quality factor the search starts from.
+
+        Returns
+        -------
+        tuple
+            A tuple `(compressed_image, q_factor, mse, iterations)`, see `search_q_factor`.
+
+        Raises
+        ------
+        RuntimeError
+            If the target MSE is outside the range reachable with `Q_FACTOR_MIN` to `Q_FACTOR_MAX`,
+            or if it cannot be achieved within the maximum allowed iterations.
+        """
+
+        # (q_factor, mse) of the closest compressed points below and above the target
+        lower: tuple[float, float] | None = None
+        upper: tuple[float, float] | None = None
+        best: tuple[np.ndarray, float, float] | None = None
+        last_side: bool | None = None
+        repeated_side = False
+
+        # the estimate is searched to a fraction of the tolerance, to aim at the middle of the tolerance band
+        q_factor, _, _ = ImageCompression.solve_q_factor(
+            estimate, target_mse, q_factor, tolerance=ImageCompression.MSE_TOLERANCE / 2
+        )
+
+        for iteration in range(1, ImageCompression.MAX_ITERATIONS + 1):
+            compressed_image = compress(q_factor)
+            mse = mean_squared_error(image, compressed_image)
+
+            logger.info(f" iteration: {iteration:2}, q_factor: {q_factor:10.4f}, mse: {mse:10.4f}")
+
+            if best is None or np.abs(target_mse - mse) < np.abs(target_mse - best[2]):
+                best = (compressed_image, q_factor, mse)
+
+            if np.abs(target_mse - mse) <= ImageCompression.MSE_TOLERANCE:
+                return compressed_image, q_factor, mse, iteration
+
+            side = mse < target_mse
+            repeated_side = side == last_side
+            last_side = side
+            if side:
+                lower = (q_factor, mse)
+            else:
+                upper = (q_factor, mse)
+
+            if side and q_factor >= ImageCompression.Q_FACTOR_MAX:
+                raise RuntimeError(
+                    f"The target MSE {target_mse} is above the MSE reached with the largest q_factor: {mse}."
+                )
+            if not side and q_factor <= ImageCompression.Q_FACTOR_MIN:
+                raise RuntimeError(
+                    f"The target MSE {target_mse} is below the MSE reached with the smallest q_factor: {mse}."
+                )
+
+            if (
+                lower is not None
+                and upper is not None
+                and upper[0] / lower[0] < 1 + ImageCompression.Q_FACTOR_PRECISION
+            ):
+                # the MSE jumps over the tolerance band between two almost equal quality factors
+                break
+
+            # calibrate the estimate on the last compression, and search it between the compressed quality factors
+            scale = mse / max(estimate(q_factor), np.finfo(np.float64).tiny)
+            bounds = (
+                ImageCompression.Q_FACTOR_MIN if lower is None else lower[0],
+                ImageCompression.Q_FACTOR_MAX if upper is None else upper[0],
+            )
+            q_factor_new, _, _ = ImageCompression.solve_q_factor(
+                lambda q: scale * estimate(q), target_mse, q_factor, ImageCompression.MSE_TOLERANCE / 2, bounds
+            )
+
+            if lower is not None and upper is not None:
+                log_lower, log_upper = np.log(lower[0]), np.log(upper[0])
+                margin = 0.05 * (log_upper - log_lower)
+                if repeated_side or not log_lower + margin < np.log(q_factor_new) < log_upper - margin:
+                    q_factor_new = ImageCompression.secant_step(lower, upper, target_mse, repeated_side)
+            elif q_factor_new == q_factor:
+                # the estimate cannot tell the quality factors apart, move by BRACKET_STEP
+                q_factor_new = (
+                    q_factor * ImageCompression.BRACKET_STEP if side else q_factor / ImageCompression.BRACKET_STEP
+                )
+
+            q_factor = float(np.clip(q_factor_new, ImageCompression.Q_FACTOR_MIN, ImageCompression.Q_FACTOR_MAX))
+        else:
+            raise RuntimeError(
+                f"Image conversion to the target MSE failed. The best achieved values are: q_factor = {best[1]}. "
+                f"To resolve this, you can try one or more of the following: increase MAX_ITERATIONS, use the provided best values, "
+                f"or increase MSE_TOLERANCE to allow a larger error margin."
+            )
+
+        compressed_image, q_factor, mse = best
 
-        return y_channel_compressed
+        return compressed_image, q_factor, mse, iteration
 
     @staticmethod
-    def compress_to_mse(image: np.ndarray, target_mse: float | None = None, q_factor: float = 1.0) -> np.ndarray:
-        """Compresses an image to achieve a specified Mean Squared Error (MSE) using iterative adjustment of the quality factor.
+    def compress_to_mse(
+        image: np.ndarray, target_mse: float | None = None, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+    ) -> np.ndarray:
+        """Compresses an image to achieve a specified Mean Squared Error (MSE) using a bracketing search
+        over the quality factor, see `search_q_factor`.
 
         Parameters
         ----------
@@ -87,6 +588,8 @@ class ImageCompression:
             The target Mean Squared Error (MSE) to achieve after compression. This parameter must be provided and cannot be None.
         q_factor : float, default=1.0
             The initial quality factor for image compression. This value will be iteratively adjusted to meet the target MSE.
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], default="4:4:4"
+            The chroma subsampling mode, see `compress_rgb`.
 
         Returns
         -------
@@ -104,27 +607,641 @@ class ImageCompression:
         if target_mse is None:
             raise ValueError("Target MSE must be specified and cannot be None. Please provide a valid value.")
 
-        mse: float = 0
-        iteration: int = 1
-        compressed_image: np.ndarray | None = None
+        compressed_image, _, _, _ = ImageCompression.search_q_factor(
+            image, target_mse, q_factor=q_factor, subsampling=subsampling
+        )
 
-        while np.abs(target_mse - mse) > ImageCompression.MSE_TOLERANCE:
-            compressed_image = ImageCompression.compress_rgb(image, q_factor=q_factor)
-            mse = mean_squared_error(image, compressed_image)
+        return compressed_image
 
-            logger.info(f" iteration: {iteration:2}, q_factor: {q_factor:10.4f}, mse: {mse:10.4f}")
+    @staticmethod
+    def jpeg_coefficients(
+        image: np.ndarray, subsampling: Subsampling = "4:4:4"
+    ) -> tuple[list[np.ndarray], list[Literal["luminance", "chroma"]], list[tuple[int, int]]]:
+        """Compute the unquantized DCT coefficients of every channel stored in a JFIF file.
 
-            q_factor_new: float = (q_factor * target_mse) / mse
-            step: float = q_factor_new - q_factor
-            q_factor = q_factor + step * ImageCompression.FACTOR_RATE
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image, either a 2D grayscale image or a 3D RGB image.
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode, see `compress_rgb`. The default is "4:4:4".
 
-            if iteration > ImageCompression.MAX_ITERATIONS:
-                raise RuntimeError(
-                    f"Image conversion to the target MSE failed. The best achieved values are: q_factor = {q_factor}. "
-                    f"To resolve this, you can try one or more of the following: increase MAX_ITERATIONS, use the provided best values, "
-                    f"or increase MSE_TOLERANCE to allow a larger error margin."
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - `coefficients` : list[np.ndarray]
+                The DCT coefficient blocks of the Y (and Cb, Cr) channels, see `JPEGCompression.transform`.
+            - `q_methods` : list[Literal["luminance", "chroma"]]
+                The channel type of every component.
+            - `sampling` : list[tuple[int, int]]
+                The (horizontal, vertical) JPEG sampling factors of every component.
+
+        Raises
+        ------
+        RuntimeError
+            If the image does not have 2 or 3 dimensions, an error is raised.
+        """
+
+        if image.ndim != 3 and image.ndim != 2:
+            raise RuntimeError(
+                f"Invalid image dimensions: {image.ndim}. Expected a 2D grayscale image or a 3D RGB image."
+            )
+
+        vertical, horizontal = CHROMA_SUBSAMPLING[subsampling] if image.ndim == 3 else (1, 1)
+        image_ycbcr = rgb_to_ycbcr(image) if image.ndim == 3 else image[:, :, None]
+
+        # JPEG files keep the image in the top-left corner of the MCU grid, repeating the
+        # edge pixels into the padding avoids coding an artificial edge
+        rows, cols = image.shape[:2]
+        mcu_rows, mcu_cols = 8 * vertical, 8 * horizontal
+        with stage("pad", image_ycbcr.nbytes):
+            image_ycbcr = np.pad(image_ycbcr, ((0, -rows % mcu_rows), (0, -cols % mcu_cols), (0, 0)), mode="edge")
+
+        channels = [image_ycbcr[:, :, 0]]
+        if image.ndim == 3:
+            channels += [downsample(image_ycbcr[:, :, index], (vertical, horizontal)) for index in (1, 2)]
+        q_methods = ["luminance", "chroma", "chroma"][: len(channels)]
+        sampling = [(horizontal, vertical), (1, 1), (1, 1)][: len(channels)]
+
+        coefficients = [JPEGCompression.transform(channel) for channel in channels]
+
+        return coefficients, q_methods, sampling
+
+    @staticmethod
+    def compress_jpeg(
+        image: np.ndarray,
+        q_factor: float = 1.0,
+        subsampling: Subsampling = "4:4:4",
+        progressive: bool = False,
+        restart_interval: int = 0,
+        workers: int = 1,
+        optimize: bool = False,
+    ) -> bytes:
+        """Compress an image into the bytes of a baseline JFIF (.jpg) file.
+
+        The channels go through the same YCbCr conversion and `JPEGCompression.quantize` step as
+        `compress_rgb`, the quantized coefficients are then entropy coded and stored together
+        with the `Q_LUMINANCE` and `Q_CHROMA` matrices scaled by `q_factor`.
+        The resulting file can be opened by any JPEG viewer.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image to be compressed. It can be either a 2D grayscale image or
+            a 3D RGB image.
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrix used in JPEG compression, see `compress_rgb`.
+            A value of 1 uses the standard tables, the same as libjpeg at quality 50.
+
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode, see `compress_rgb`. It is stored in the file as the
+            sampling factors of the components. The default is "4:4:4".
+
+        progressive : bool, optional
+            If True, a progressive file is written: a scan of the DC coefficients first, then bands of
+            AC coefficients, see `JFIF.write`. A preview can be decoded from the first scans, see
+            `decompress_jpeg`. The default is False.
+
+        restart_interval : int, optional
+            The number of MCUs between two restart markers, see `JFIF.write`. The intervals are entropy
+            coded independently, and can be decoded in parallel by `decompress_jpeg`. The default is 0, none.
+
+        workers : int, optional
+            The number of processes entropy coding the restart intervals in parallel. The default is 1.
+
+        optimize : bool, optional
+            If True, the file is coded with Huffman tables fitted to the image instead of the standard ones,
+            which makes it smaller at the same quality, see `JFIF.write`. The default is False.
+
+        Returns
+        -------
+        bytes
+            The content of the .jpg file.
+
+        Raises
+        ------
+        RuntimeError
+            If the image does not have 2 or 3 dimensions, an error is raised.
+        ValueError
+            If the restart interval is out of range or `workers` is smaller than 1.
+        """
+
+        components, q_methods, q_tables, sampling = ImageCompression.jpeg_components(image, q_factor, subsampling)
+
+        return JFIF.write(
+            components,
+            q_methods,
+            q_tables,
+            image.shape[:2],
+            sampling=sampling,
+            progressive=progressive,
+            restart_interval=restart_interval,
+            workers=workers,
+            optimize=optimize,
+        )
+
+    @staticmethod
+    def jpeg_components(
+        image: np.ndarray, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+    ) -> tuple[list[np.ndarray], list[Literal["luminance", "chroma"]], list[np.ndarray], list[tuple[int, int]]]:
+        """Compute the quantized coefficients of every component stored in a JFIF file, see `compress_jpeg`.
+
+        Returns
+        -------
+        tuple
+            A tuple `(components, q_methods, q_tables, sampling)` with the arguments of `JFIF.write`.
+        """
+
+        coefficients, q_methods, sampling = ImageCompression.jpeg_coefficients(image, subsampling)
+        components = [
+            JPEGCompression.quantize_coefficients(blocks, q_method=q_method, q_factor=q_factor, baseline=True)
+            for blocks, q_method in zip(coefficients, q_methods)
+        ]
+        q_tables = [JPEGCompression.quantization_matrix(q_method, q_factor, baseline=True) for q_method in q_methods]
+
+        return components, q_methods, q_tables, sampling
+
+    @staticmethod
+    def encode_jpeg(
+        image: np.ndarray, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+    ) -> tuple[bytes, np.ndarray]:
+        """Compress an image into the bytes of a JFIF file, together with the image a decoder reads from them.
+
+        The decoded image is reconstructed from the quantized coefficients before entropy coding,
+        so the file is never parsed back, see `compress_jpeg` and `reconstruct_jpeg`.
+
+        Returns
+        -------
+        tuple[bytes, np.ndarray]
+            The content of the .jpg file and the decoded image.
+        """
+
+        components, q_methods, q_tables, sampling = ImageCompression.jpeg_components(image, q_factor, subsampling)
+        data = JFIF.write(components, q_methods, q_tables, image.shape[:2], sampling=sampling)
+
+        return data, ImageCompression.reconstruct_jpeg(components, q_tables, image.shape[:2])
+
+    @staticmethod
+    def compress_to_size(
+        image: np.ndarray, max_bytes: int, subsampling: Subsampling = "4:4:4"
+    ) -> tuple[bytes, float, float]:
+        """Compress an image into the highest quality JFIF file that fits a size budget.
+
+        The DCT of every channel is computed once, each candidate `q_factor` only re-quantizes the
+        coefficients and estimates the coded size with `EntropyCoding.estimate_size`, which counts the
+        Huffman code lengths without building the bit stream. The q_factor is bisected in log space,
+        only the final candidate is fully encoded. When the real file is larger than estimated the
+        estimate is scaled by the observed ratio and the search is repeated. The MSE of the file is measured
+        on the image reconstructed from its quantized coefficients, see `encode_jpeg`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image to be compressed. It can be either a 2D grayscale image or
+            a 3D RGB image.
+
+        max_bytes : int
+            The maximum size of the .jpg file, in bytes.
+
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode, see `compress_rgb`. The default is "4:4:4".
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - `data` : bytes
+                The content of the .jpg file, at most `max_bytes` long.
+            - `q_factor` : float
+                The smallest q_factor (best quality) found whose file fits the budget.
+            - `mse` : float
+                The mean squared error between the original image and the decoded file.
+
+        Raises
+        ------
+        RuntimeError
+            If the image does not have 2 or 3 dimensions, or if the file does not fit
+            the budget even at `Q_FACTOR_MAX`.
+        """
+
+        coefficients, q_methods, sampling = ImageCompression.jpeg_coefficients(image, subsampling)
+
+        def quantize(q_factor: float) -> list[np.ndarray]:
+            return [
+                JPEGCompression.quantize_coefficients(blocks, q_method=q_method, q_factor=q_factor, baseline=True)
+                for blocks, q_method in zip(coefficients, q_methods)
+            ]
+
+        def write(q_factor: float) -> tuple[bytes, list[np.ndarray], list[np.ndarray]]:
+            components = quantize(q_factor)
+            q_tables = [
+                JPEGCompression.quantization_matrix(q_method, q_factor, baseline=True) for q_method in q_methods
+            ]
+            data = JFIF.write(components, q_methods, q_tables, image.shape[:2], sampling=sampling)
+
+            return data, components, q_tables
+
+        def estimate(q_factor: float) -> int:
+            return EntropyCoding.estimate_size(quantize(q_factor), q_methods, sampling)
+
+        # the markers and tables do not depend on the coefficients, measure them once on the smallest file
+        data, _, _ = write(ImageCompression.Q_FACTOR_MAX)
+        header = len(data) - estimate(ImageCompression.Q_FACTOR_MAX)
+        if len(data) > max_bytes:
+            raise RuntimeError(
+                f"The image cannot be compressed to {max_bytes} bytes, the smallest file is {len(data)} bytes."
+            )
+
+        ratio = 1.0
+        for _ in range(ImageCompression.MAX_ITERATIONS):
+            low, high = np.log(ImageCompression.Q_FACTOR_MIN), np.log(ImageCompression.Q_FACTOR_MAX)
+            if header + ratio * estimate(np.exp(low)) <= max_bytes:
+                high = low
+
+            while high - low > ImageCompression.Q_FACTOR_PRECISION:
+                middle = (low + high) / 2
+                if header + ratio * estimate(np.exp(middle)) <= max_bytes:
+                    high = middle
+                else:
+                    low = middle
+
+            q_factor = float(np.exp(high))
+            data, components, q_tables = write(q_factor)
+            logger.info(f" Q Factor: {q_factor:10.4f}, Size: {len(data):10d} bytes, Budget: {max_bytes:10d} bytes")
+
+            if len(data) <= max_bytes:
+                compressed_image = ImageCompression.reconstruct_jpeg(components, q_tables, image.shape[:2])
+                return data, q_factor, mean_squared_error(image, compressed_image)
+
+            # the estimate missed the stuffed bytes, correct it by the observed error and search again
+            ratio *= (len(data) - header) / estimate(q_factor) * (1 + ImageCompression.Q_FACTOR_PRECISION)
+
+        raise RuntimeError(f"Maximum iterations ({ImageCompression.MAX_ITERATIONS}) exceeded.")
+
+    @staticmethod
+    def compress_ladder(
+        image: np.ndarray, q_factors: list[float], subsampling: Subsampling = "4:4:4", decode: bool = False
+    ) -> list[tuple[bytes, np.ndarray | None]]:
+        """Compress an image into one JFIF file per quality factor, e.g. the renditions of a quality ladder.
+
+        Only the quantization depends on `q_factor`, so the colour conversion, padding, blocking and forward DCT
+        are done once for all the renditions, see `jpeg_coefficients`. Every rendition then only quantizes
+        the shared coefficients and entropy codes them, and is optionally decoded from its quantized
+        coefficients without parsing the file, see `encode_jpeg`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image to be compressed. It can be either a 2D grayscale image or
+            a 3D RGB image.
+
+        q_factors : list[float]
+            The quality factor of every rendition, see `compress_rgb`.
+
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode of all the renditions, see `compress_rgb`. The default is "4:4:4".
+
+        decode : bool, optional
+            If True, the image a decoder reads from every file is also returned. The default is False.
+
+        Returns
+        -------
+        list[tuple[bytes, np.ndarray | None]]
+            The content of the .jpg file of every rendition, in the order of `q_factors`, and its decoded
+            image, or None if `decode` is False. Every file is the one `compress_jpeg` produces for its q_factor.
+
+        Raises
+        ------
+        RuntimeError
+            If the image does not have 2 or 3 dimensions.
+        ValueError
+            If no quality factor is given.
+        """
+
+        if not q_factors:
+            raise ValueError("At least one q_factor must be given.")
+
+        coefficients, q_methods, sampling = ImageCompression.jpeg_coefficients(image, subsampling)
+
+        renditions = []
+        for q_factor in q_factors:
+            components = [
+                JPEGCompression.quantize_coefficients(blocks, q_method=q_method, q_factor=q_factor, baseline=True)
+                for blocks, q_method in zip(coefficients, q_methods)
+            ]
+            q_tables = [
+                JPEGCompression.quantization_matrix(q_method, q_factor, baseline=True) for q_method in q_methods
+            ]
+
+            data = JFIF.write(components, q_methods, q_tables, image.shape[:2], sampling=sampling)
+            decoded = ImageCompression.reconstruct_jpeg(components, q_tables, image.shape[:2]) if decode else None
+            renditions.append((data, decoded))
+
+        return renditions
+
+    @staticmethod
+    def compress_jpeg_tiled(
+        image: np.ndarray,
+        file: BinaryIO,
+        q_factor: float = 1.0,
+        subsampling: Subsampling = "4:4:4",
+        tile_rows: int | None = None,
+    ) -> int:
+        """Compress an image into a JFIF file one strip of rows at a time, for images that do not fit in memory.
+
+        Every strip goes through the same steps as `compress_jpeg`, and its entropy-coded data is written
+        to `file` before the next strip is read. The peak memory is therefore set by the strip size, not by
+        the image size, when `image` is a memory-mapped array (see `load_image_memmap`).
+        The file is identical to the one `compress_jpeg` produces for the whole image.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image, a 2D grayscale image or a 3D RGB image. Only strips of it are read at a time,
+            so it can be an `np.memmap` of an image much larger than the available memory.
+
+        file : BinaryIO
+            The binary file the .jpg content is written to.
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrix, see `compress_jpeg`. The default value is 1.
+
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode, see `compress_rgb`. The default is "4:4:4".
+
+        tile_rows : int, optional
+            The number of image rows compressed at a time, rounded down to a multiple of the MCU height.
+            If None, `TILE_ROWS` is used.
+
+        Returns
+        -------
+        int
+            The number of bytes written.
+
+        Raises
+        ------
+        RuntimeError
+            If the image does not have 2 or 3 dimensions, an error is raised.
+        """
+
+        if image.ndim != 3 and image.ndim != 2:
+            raise RuntimeError(
+                f"Invalid image dimensions: {image.ndim}. Expected a 2D grayscale image or a 3D RGB image."
+            )
+
+        # strips must hold whole MCU rows, so that the blocks and chroma boxes match the ones of the full image
+        mcu_height = 8 * (CHROMA_SUBSAMPLING[subsampling][0] if image.ndim == 3 else 1)
+        tile_rows = ImageCompression.TILE_ROWS if tile_rows is None else tile_rows
+        tile_rows = max(mcu_height, tile_rows // mcu_height * mcu_height)
+
+        encoder: ScanEncoder | None = None
+        written = 0
+
+        for top in range(0, image.shape[0], tile_rows):
+            coefficients, q_methods, sampling = ImageCompression.jpeg_coefficients(
+                image[top : top + tile_rows], subsampling
+            )
+            components = [
+                JPEGCompression.quantize_coefficients(blocks, q_method=q_method, q_factor=q_factor, baseline=True)
+                for blocks, q_method in zip(coefficients, q_methods)
+            ]
+
+            if encoder is None:
+                q_tables = [
+                    JPEGCompression.quantization_matrix(q_method, q_factor, baseline=True) for q_method in q_methods
+                ]
+                written += file.write(JFIF.header(q_methods, q_tables, image.shape[:2], sampling=sampling))
+                encoder = ScanEncoder(q_methods, sampling)
+
+            written += file.write(encoder.encode(components))
+
+        written += file.write(encoder.flush() + bytes([0xFF, JFIF.EOI]))
+
+        return written
+
+    @staticmethod
+    def decompress_jpeg(data: bytes, scans: int | None = None, scale: int = 1, workers: int = 1) -> np.ndarray:
+        """Decompress the bytes of a JFIF (.jpg) file with the package's own decoder.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of a .jpg file, e.g. as produced by `compress_jpeg`. A progressive file may be
+            cut short, the image is then decoded from its complete scans.
+        scans : int, optional
+            The number of scans to decode. For a progressive file, 1 decodes a preview from the DC coefficients
+            only, which is much faster than decoding the whole file, see `JFIF.read`. If None, all of them.
+        scale : int, optional
+            Decode the image reduced by this factor, one of `JPEGCompression.SCALES`, e.g. for a thumbnail.
+            Only the low frequencies of every block are decoded, see `JPEGCompression.decode_scaled`, and
+            at 1/8 scale only the DC scan of a progressive file is read. The default is 1, the full resolution.
+        workers : int, optional
+            The number of processes entropy decoding the restart intervals of a file with restart markers in
+            parallel, see `compress_jpeg`. Files without restart markers are decoded serially. The default is 1.
+
+        Returns
+        -------
+        np.ndarray
+            The decoded image, a 2D grayscale image or a 3D RGB image depending on
+            the number of components in the file.
+        """
+
+        # the scans of a progressive file above the frequencies kept at this scale are not decoded at all
+        size = JPEGCompression.scaled_block_size(scale)
+        last_index = int(EntropyCoding.IZIGZAG.reshape(8, 8)[:size, :size].max())
+
+        with stage("entropy_decode", len(data)):
+            components, q_tables, shape = JFIF.read(data, scans, last_index, workers)
+
+        return ImageCompression.reconstruct_jpeg(components, q_tables, shape, scale)
+
+    @staticmethod
+    def decompress_jpeg_pyramid(data: bytes, scales: tuple[int, ...] = JPEGCompression.SCALES) -> list[np.ndarray]:
+        """Decode a JFIF (.jpg) file at several resolutions, reading and entropy decoding it only once.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of a .jpg file, see `decompress_jpeg`.
+        scales : tuple[int, ...], optional
+            The reduction factor of every level, see `JPEGCompression.SCALES`. The default is all of them,
+            the full resolution, 1/2, 1/4 and 1/8.
+
+        Returns
+        -------
+        list[np.ndarray]
+            The decoded image at every scale, in the order of `scales`.
+        """
+
+        with stage("entropy_decode", len(data)):
+            components, q_tables, shape = JFIF.read(data)
+
+        return [ImageCompression.reconstruct_jpeg(components, q_tables, shape, scale) for scale in scales]
+
+    @staticmethod
+    def decompress_jpeg_region(
+        data: bytes, y0: int, x0: int, height: int, width: int, index: BlockIndex | None = None
+    ) -> np.ndarray:
+        """Decode a rectangle of a sequential JFIF (.jpg) file, e.g. a viewport of a very large image.
+
+        Only the MCUs overlapping the rectangle are entropy decoded and transformed, starting from the
+        closest entry of the block index in every MCU row, so the time taken depends on the size
+        of the rectangle and not on the size of the image. The pixels are the ones of `decompress_jpeg`.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of a sequential .jpg file.
+        y0, x0 : int
+            The top left corner of the rectangle.
+        height, width : int
+            The size of the rectangle.
+        index : BlockIndex, optional
+            The block index of the file, see `BlockIndex.build`. If None, it is built, which decodes the
+            whole file: build it once and keep it to decode several regions.
+
+        Returns
+        -------
+        np.ndarray
+            The decoded rectangle, of shape (height, width) or (height, width, 3).
+
+        Raises
+        ------
+        ValueError
+            If the rectangle is not inside the image, the file is not a sequential JPEG file,
+            or the index is not the one of the file.
+        """
+
+        shape, sampling, q_tables, huffman_tables, _ = JFIF.read_header(data)
+        if not (
+            0 <= y0 and 0 <= x0 and 0 < height and 0 < width and y0 + height <= shape[0] and x0 + width <= shape[1]
+        ):
+            raise ValueError(f"The region ({y0}, {x0}, {height}, {width}) is not inside the image of shape {shape}.")
+
+        index = BlockIndex.build(data) if index is None else index
+
+        # every MCU covers (8 * max vertical) x (8 * max horizontal) pixels
+        mcu_height = 8 * max(v for _, v in sampling)
+        mcu_width = 8 * max(h for h, _ in sampling)
+        if index.grid != (-(-shape[0] // mcu_height), -(-shape[1] // mcu_width)):
+            raise ValueError(f"The index of an MCU grid of {index.grid} does not match the file.")
+
+        first_row, last_row = y0 // mcu_height, (y0 + height - 1) // mcu_height
+        first_column, last_column = x0 // mcu_width, (x0 + width - 1) // mcu_width
+
+        rows = []
+        with stage("entropy_decode", len(data)):
+            for row in range(first_row, last_row + 1):
+                column, start, end, predictors = index.segment(row, first_column, last_column)
+                # the stuffed zero byte that may follow the last byte of the data is kept
+                segment = data[start >> 3 : None if end is None else (end >> 3) + 2]
+                rows.append(
+                    EntropyCoding.decode_components(
+                        segment,
+                        (1, last_column - column + 1),
+                        huffman_tables,
+                        sampling,
+                        bit_offset=start & 7,
+                        predictors=predictors,
+                    )
                 )
 
-            iteration += 1
+        # the MCUs decoded between the entry of the index and the first column of the region are dropped
+        skip = first_column - column
+        components = [
+            np.concatenate([decoded[component] for decoded in rows])[:, skip * h :]
+            for component, (h, _) in enumerate(sampling)
+        ]
+        region_shape = ((last_row - first_row + 1) * mcu_height, (last_column - first_column + 1) * mcu_width)
+        image = ImageCompression.reconstruct_jpeg(components, q_tables, region_shape)
 
-        return compressed_image
+        top, left = y0 - first_row * mcu_height, x0 - first_column * mcu_width
+
+        return image[top : top + height, left : left + width]
+
+    @staticmethod
+    def reconstruct_jpeg(
+        components: list[np.ndarray], q_tables: list[np.ndarray], shape: tuple[int, int], scale: int = 1
+    ) -> np.ndarray:
+        """Decode the quantized coefficients of a JFIF file, as returned by `JFIF.read`, into an image.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            The quantized coefficient blocks of every component.
+        q_tables : list[np.ndarray]
+            The 8x8 quantization matrix of every component.
+        shape : tuple[int, int]
+            The (height, width) of the image.
+        scale : int, optional
+            Decode the image reduced by this factor, see `JPEGCompression.decode_scaled`. Only the coefficients
+            the reduced inverse DCT reads are dequantized. The default is 1, the full resolution.
+
+        Returns
+        -------
+        np.ndarray
+            The decoded image, a 2D grayscale image or a 3D RGB image depending on the number of components.
+            Its shape is (ceil(height / scale), ceil(width / scale)).
+
+        Raises
+        ------
+        ValueError
+            If the scale is not one of `JPEGCompression.SCALES`.
+        """
+
+        JPEGCompression.scaled_block_size(scale)
+        height, width = -(-shape[0] // scale), -(-shape[1] // scale)
+
+        # subsampled components cover the same MCU grid as the luminance with fewer blocks
+        grid = components[0].shape[:2]
+
+        if scale == 1 and not any(np.any(blocks.reshape(-1, 64)[:, 1:]) for blocks in components):
+            return ImageCompression.reconstruct_flat(components, q_tables, shape)
+
+        channels = []
+        for blocks, q_table in zip(components, q_tables):
+            factors = (grid[0] // blocks.shape[0], grid[1] // blocks.shape[1])
+            # the blocks of a subsampled component cover more pixels, they are reduced that much less
+            block_scale = (max(scale // factors[0], 1), max(scale // factors[1], 1))
+
+            if block_scale == (1, 1):
+                channel = JPEGCompression.decode(
+                    ImageBlockProcessor.iblocks(np.multiply(blocks, q_table, dtype=compute_dtype()))
+                )
+            else:
+                rows, cols = 8 // block_scale[0], 8 // block_scale[1]
+                coefficients = np.multiply(blocks[..., :rows, :cols], q_table[:rows, :cols], dtype=compute_dtype())
+                pixels = JPEGCompression.idct_scaled(coefficients, block_scale)
+                # the blocks of a 4:2:2 chroma component are not square, which `iblocks` does not handle
+                channel = pixels.swapaxes(1, 2).reshape(blocks.shape[0] * rows, blocks.shape[1] * cols)
+
+            channels.append(
+                upsample(
+                    channel,
+                    (factors[0] * block_scale[0] // scale, factors[1] * block_scale[1] // scale),
+                    (height, width),
+                )
+            )
+
+        if len(channels) == 1:
+            return np.clip(channels[0], 0, 255).astype(np.uint8)
+
+        image_ycbcr = np.stack(channels, axis=-1)
+
+        return ycbcr_to_rgb(image_ycbcr)
+
+    @staticmethod
+    def reconstruct_flat(
+        components: list[np.ndarray], q_tables: list[np.ndarray], shape: tuple[int, int]
+    ) -> np.ndarray:
+        """`reconstruct_jpeg` for coefficients without AC terms, e.g. the first scan of a progressive file.
+
+        The inverse DCT of a block holding only a DC coefficient is flat, so the image is decoded at 1/8 scale,
+        64 times fewer pixels than the image, and only enlarged at the end.
+        """
+
+        image = ImageCompression.reconstruct_jpeg(components, q_tables, shape, scale=8)
+
+        return np.repeat(np.repeat(image, 8, axis=0), 8, axis=1)[: shape[0], : shape[1]]
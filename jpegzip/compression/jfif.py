@@ -0,0 +1,710 @@
+from typing import Literal
+
+import numpy as np
+from jpegzip.compression.entropy_coding import EntropyCoding, HuffmanTables
+
+
+class JFIF:
+    """Reads and writes sequential and progressive Huffman JPEG files in the JFIF format.
+
+    Only the file structure is handled here, the coefficients are produced and consumed by
+    `JPEGCompression` and the scan data by `EntropyCoding`.
+
+    Attributes
+    ----------
+    SOI, EOI, APP0, APP15, DQT, DHT, SOF0, SOF1, SOF2, SOS, DRI : int
+        The marker codes of the segments written and understood by this class.
+
+    RST0 : int
+        The first of the 8 restart markers RST0 to RST7, which separate the restart intervals of a scan.
+
+    DENSITY : tuple[int, int]
+        The pixel aspect ratio written to the APP0 segment (no units, square pixels).
+
+    BANDS : tuple[tuple[int, int], ...]
+        The bands of AC coefficients (first and last zigzag index) of the scans of a progressive file,
+        which follow a first scan of the DC coefficients.
+    """
+
+    SOI: int = 0xD8
+    EOI: int = 0xD9
+    APP0: int = 0xE0
+    APP15: int = 0xEF
+    DQT: int = 0xDB
+    DHT: int = 0xC4
+    SOF0: int = 0xC0
+    SOF1: int = 0xC1
+    SOF2: int = 0xC2
+    SOS: int = 0xDA
+    DRI: int = 0xDD
+    RST0: int = 0xD0
+
+    DENSITY: tuple[int, int] = (1, 1)
+
+    BANDS: tuple[tuple[int, int], ...] = ((1, 5), (6, 14), (15, 63))
+
+    @staticmethod
+    def segment(marker: int, payload: bytes) -> bytes:
+        """Build a marker segment, the length field counts itself but not the marker.
+
+        Raises
+        ------
+        ValueError
+            If the payload does not fit the 16-bit length field.
+        """
+
+        if len(payload) > 0xFFFF - 2:
+            raise ValueError(f"A marker segment holds at most {0xFFFF - 2} bytes, got {len(payload)}.")
+
+        return bytes([0xFF, marker]) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+    @staticmethod
+    def insert_segment(data: bytes, marker: int, payload: bytes) -> bytes:
+        """Insert an application segment into a JFIF file, right after its APP0 segment."""
+
+        position = 4 + int.from_bytes(data[4:6], "big")
+
+        return data[:position] + JFIF.segment(marker, payload) + data[position:]
+
+    @staticmethod
+    def remove_segments(data: bytes, marker: int) -> bytes:
+        """Remove every `marker` segment before the first scan of a JFIF file, e.g. the DHT segments
+        of the standard Huffman tables, which decoders of Motion-JPEG frames fall back to."""
+
+        kept, position = [data[:2]], 2
+        while position + 4 <= len(data):
+            found = data[position + 1]
+            length = int.from_bytes(data[position + 2 : position + 4], "big")
+            if found == JFIF.SOS:
+                break
+            if found != marker:
+                kept.append(data[position : position + 2 + length])
+            position += 2 + length
+
+        return b"".join(kept) + data[position:]
+
+    @staticmethod
+    def find_segment(data: bytes, marker: int, identifier: bytes) -> bytes | None:
+        """The payload after `identifier` of the first `marker` segment starting with it, before the first scan.
+
+        Returns None if the file has no such segment. Decoders ignore application segments they do not know,
+        so they are a way to store extra data in a file that stays readable everywhere.
+        """
+
+        position = 2
+        while position + 4 <= len(data):
+            while data[position] == 0xFF:
+                position += 1
+            found = data[position]
+            length = int.from_bytes(data[position + 1 : position + 3], "big")
+            if found == JFIF.SOS:
+                return None
+            if found == marker and data[position + 3 : position + 3 + len(identifier)] == identifier:
+                return data[position + 3 + len(identifier) : position + 1 + length]
+            position += 1 + length
+
+        return None
+
+    @staticmethod
+    def table_id(q_method: Literal["luminance", "chroma"]) -> int:
+        """Quantization and Huffman tables of luminance components use slot 0, chroma components use slot 1."""
+
+        return 0 if q_method == "luminance" else 1
+
+    @staticmethod
+    def header(
+        q_methods: list[Literal["luminance", "chroma"]],
+        q_tables: list[np.ndarray],
+        shape: tuple[int, int],
+        huffman_tables: list[HuffmanTables] | None = None,
+        sampling: list[tuple[int, int]] | None = None,
+        progressive: bool = False,
+        restart_interval: int = 0,
+    ) -> bytes:
+        """Build the segments of a JFIF file preceding the entropy-coded data, up to and including the SOS segment.
+
+        Parameters
+        ----------
+        q_methods, q_tables, shape, huffman_tables, sampling, progressive, restart_interval
+            See `write`.
+
+        Returns
+        -------
+        bytes
+            The start of the .jpg file. It is followed by the entropy-coded data and the EOI marker.
+            The header of a progressive file stops before the first SOS segment, see `scan_header`.
+
+        Raises
+        ------
+        ValueError
+            If a quantization step is above 255, which 8-bit DQT tables cannot hold.
+        """
+
+        height, width = shape
+        if sampling is None:
+            sampling = [(1, 1)] * len(q_methods)
+        if huffman_tables is None:
+            huffman_tables = [EntropyCoding.huffman_table(q_method) for q_method in q_methods]
+
+        table_ids = [JFIF.table_id(q_method) for q_method in q_methods]
+        # 16 bit tables are not allowed with 8 bit samples (T.81 B.2.4.1), so steps must fit a byte
+        if any(np.max(q_table) > 255 for q_table in q_tables):
+            raise ValueError("Quantization steps above 255 cannot be stored in a baseline file.")
+
+        # fmt: off
+        app0 = b"JFIF\x00" + bytes([1, 1, 0]) + JFIF.DENSITY[0].to_bytes(2, "big") + JFIF.DENSITY[1].to_bytes(2, "big") + bytes([0, 0])
+        # fmt: on
+        file = [bytes([0xFF, JFIF.SOI]), JFIF.segment(JFIF.APP0, app0)]
+
+        written: set[int] = set()
+        for table_id, q_table in zip(table_ids, q_tables):
+            if table_id in written:
+                continue
+            written.add(table_id)
+
+            values = EntropyCoding.zigzag(np.asarray(q_table)).astype(np.uint8)
+            file.append(JFIF.segment(JFIF.DQT, bytes([table_id]) + values.tobytes()))
+
+        frame = bytes([8]) + height.to_bytes(2, "big") + width.to_bytes(2, "big") + bytes([len(q_methods)])
+        for index, (table_id, (h, v)) in enumerate(zip(table_ids, sampling)):
+            frame += bytes([index + 1, (h << 4) | v, table_id])
+        file.append(JFIF.segment(JFIF.SOF2 if progressive else JFIF.SOF0, frame))
+
+        written = set()
+        for table_id, (dc, ac) in zip(table_ids, huffman_tables):
+            if table_id in written:
+                continue
+            written.add(table_id)
+
+            for table_class, (bits, values) in enumerate((dc, ac)):
+                payload = bytes([(table_class << 4) | table_id]) + bytes(bits) + bytes(values)
+                file.append(JFIF.segment(JFIF.DHT, payload))
+
+        if restart_interval:
+            file.append(JFIF.segment(JFIF.DRI, restart_interval.to_bytes(2, "big")))
+
+        if not progressive:
+            file.append(JFIF.scan_header(list(range(len(q_methods))), table_ids))
+
+        return b"".join(file)
+
+    @staticmethod
+    def scan_header(indices: list[int], table_ids: list[int], band: tuple[int, int] = (0, 63)) -> bytes:
+        """Build the SOS segment of a scan.
+
+        Parameters
+        ----------
+        indices : list[int]
+            The indices of the components coded in the scan, in the order of the frame.
+        table_ids : list[int]
+            The Huffman table slot of every component of the frame, see `table_id`.
+        band : tuple[int, int], optional
+            The first and last zigzag index coded in the scan. The default is (0, 63), a sequential scan.
+            Progressive DC scans only select a DC table and AC scans only an AC table.
+        """
+
+        start, end = band
+        scan = bytes([len(indices)])
+        for index in indices:
+            dc_table = table_ids[index] if start == 0 else 0
+            ac_table = table_ids[index] if end > 0 else 0
+            scan += bytes([index + 1, (dc_table << 4) | ac_table])
+        scan += bytes([start, end, 0])
+
+        return JFIF.segment(JFIF.SOS, scan)
+
+    @staticmethod
+    def component_blocks(shape: tuple[int, int], sampling: list[tuple[int, int]], index: int) -> tuple[int, int]:
+        """The block grid of a component coded in a scan of its own.
+
+        A non-interleaved scan only covers the blocks holding pixels of the component, which
+        may be fewer than the blocks of the component in the MCU grid of an interleaved scan.
+
+        Parameters
+        ----------
+        shape : tuple[int, int]
+            The (height, width) of the image.
+        sampling : list[tuple[int, int]]
+            The (horizontal, vertical) sampling factors of every component.
+        index : int
+            The index of the component.
+
+        Returns
+        -------
+        tuple[int, int]
+            The number of block rows and columns of the component.
+        """
+
+        h_max, v_max = max(h for h, _ in sampling), max(v for _, v in sampling)
+        h, v = sampling[index]
+        rows, cols = -(-shape[0] * v // v_max), -(-shape[1] * h // h_max)
+
+        return -(-rows // 8), -(-cols // 8)
+
+    @staticmethod
+    def write(
+        components: list[np.ndarray],
+        q_methods: list[Literal["luminance", "chroma"]],
+        q_tables: list[np.ndarray],
+        shape: tuple[int, int],
+        huffman_tables: list[HuffmanTables] | None = None,
+        sampling: list[tuple[int, int]] | None = None,
+        progressive: bool = False,
+        bands: tuple[tuple[int, int], ...] | None = None,
+        restart_interval: int = 0,
+        workers: int = 1,
+        optimize: bool = False,
+    ) -> bytes:
+        """Assemble a JFIF file from quantized coefficient blocks.
+
+        A sequential file holds a single interleaved scan of all the coefficients. A progressive file
+        (spectral selection) holds a scan of the DC coefficients of all the components first, enough to show
+        a preview with one flat colour per block, then one scan per band of AC coefficients and component,
+        band after band, each refining the image further, see `read`.
+
+        With a restart interval, the scans are split into intervals separated by restart markers and
+        recorded in a DRI segment. Every interval is coded independently of the others, so the intervals of
+        a scan can be encoded and decoded in parallel, see `EntropyCoding.encode_components`, and a decoder
+        can resume at the next marker after corrupted data.
+
+        Parameters
+        ----------
+        components : list[np.ndarray]
+            Quantized coefficient blocks of every component, see `EntropyCoding.encode_components`.
+            The image must be anchored at the top-left block, see `ImageBlockProcessor.pad`.
+        q_methods : list[Literal["luminance", "chroma"]]
+            The channel type of every component, one luminance component followed by
+            optional chroma components.
+        q_tables : list[np.ndarray]
+            The 8x8 integer quantization matrix used for every component.
+        shape : tuple[int, int]
+            The (height, width) of the image.
+        huffman_tables : list[HuffmanTables], optional
+            The Huffman tables of every component. If None, the standard tables are used.
+        sampling : list[tuple[int, int]], optional
+            The (horizontal, vertical) sampling factors of every component, e.g. (2, 2) for the
+            luminance and (1, 1) for the chroma components in 4:2:0 subsampling.
+            If None, no component is subsampled.
+        progressive : bool, optional
+            If True, a progressive file is written. The default is False.
+        bands : tuple[tuple[int, int], ...], optional
+            The bands of AC coefficients of the scans of a progressive file, which must cover the
+            zigzag indices 1 to 63 in order. The default is `BANDS`.
+        restart_interval : int, optional
+            The number of MCUs between two restart markers, at most 65535. In the scans of a single component
+            of a progressive file, an MCU is a single block. The default is 0, no restart markers.
+        workers : int, optional
+            The number of processes entropy coding the restart intervals of a scan in parallel. The default is 1.
+        optimize : bool, optional
+            If True, Huffman tables fitted to the symbols of the scans are computed in a first pass over the
+            coefficients and replace `huffman_tables`, see `EntropyCoding.optimized_tables`. The default is False.
+
+        Returns
+        -------
+        bytes
+            The content of the .jpg file.
+
+        Raises
+        ------
+        ValueError
+            If the restart interval does not fit the DRI segment, `workers` is smaller than 1,
+            or a quantization step is above 255, see `JPEGCompression.quantization_matrix`.
+        """
+
+        if not 0 <= restart_interval <= 0xFFFF:
+            raise ValueError(f"The restart interval must be between 0 and 65535 MCUs, got {restart_interval}.")
+        bands = JFIF.BANDS if bands is None else bands
+        if optimize and not progressive and workers == 1:
+            # the symbols of a single scan are generated once, for the statistics and for the coding
+            data, huffman_tables = EntropyCoding.encode_optimized(components, q_methods, sampling, restart_interval)
+            header = JFIF.header(
+                q_methods, q_tables, shape, huffman_tables, sampling, restart_interval=restart_interval
+            )
+
+            return b"".join([header, data, bytes([0xFF, JFIF.EOI])])
+
+        if optimize:
+            scan_bands = ((0, 0),) + bands if progressive else ((0, 63),)
+            huffman_tables = EntropyCoding.optimized_tables(
+                components, q_methods, sampling, scan_bands, restart_interval
+            )
+        elif huffman_tables is None:
+            huffman_tables = [EntropyCoding.huffman_table(q_method) for q_method in q_methods]
+
+        if progressive:
+            return JFIF.write_progressive(
+                components,
+                q_methods,
+                q_tables,
+                shape,
+                huffman_tables,
+                sampling,
+                bands,
+                restart_interval,
+                workers,
+            )
+
+        return b"".join(
+            [
+                JFIF.header(q_methods, q_tables, shape, huffman_tables, sampling, restart_interval=restart_interval),
+                EntropyCoding.encode_components(
+                    components, huffman_tables, sampling, restart_interval=restart_interval, workers=workers
+                ),
+                bytes([0xFF, JFIF.EOI]),
+            ]
+        )
+
+    @staticmethod
+    def write_progressive(
+        components: list[np.ndarray],
+        q_methods: list[Literal["luminance", "chroma"]],
+        q_tables: list[np.ndarray],
+        shape: tuple[int, int],
+        huffman_tables: list[HuffmanTables],
+        sampling: list[tuple[int, int]] | None,
+        bands: tuple[tuple[int, int], ...],
+        restart_interval: int = 0,
+        workers: int = 1,
+    ) -> bytes:
+        """Assemble a progressive JFIF file, see `write`."""
+
+        if sampling is None or len(components) == 1:
+            sampling = [(1, 1)] * len(components)
+        table_ids = [JFIF.table_id(q_method) for q_method in q_methods]
+
+        file = [
+            JFIF.header(q_methods, q_tables, shape, huffman_tables, sampling, True, restart_interval),
+            JFIF.scan_header(list(range(len(components))), table_ids, (0, 0)),
+            EntropyCoding.encode_components(
+                components, huffman_tables, sampling, (0, 0), restart_interval=restart_interval, workers=workers
+            ),
+        ]
+
+        for band in bands:
+            for index, blocks in enumerate(components):
+                rows, cols = JFIF.component_blocks(shape, sampling, index)
+                file.append(JFIF.scan_header([index], table_ids, band))
+                file.append(
+                    EntropyCoding.encode_components(
+                        [blocks[:rows, :cols]],
+                        [huffman_tables[index]],
+                        band=band,
+                        restart_interval=restart_interval,
+                        workers=workers,
+                    )
+                )
+
+        file.append(bytes([0xFF, JFIF.EOI]))
+
+        return b"".join(file)
+
+    @staticmethod
+    def scan_end(data: bytes, start: int) -> int:
+        """Find the end of the entropy-coded data starting at `start`, the position of the next marker."""
+
+        position = data.find(b"\xff", start)
+        while position != -1 and position + 1 < len(data):
+            following = data[position + 1]
+            # stuffed zero bytes and restart markers are part of the scan
+            if following != 0x00 and not 0xD0 <= following <= 0xD7:
+                return position
+            position = data.find(b"\xff", position + 2)
+
+        return len(data)
+
+    @staticmethod
+    def read_dqt(payload: bytes, q_tables: dict[int, np.ndarray]) -> None:
+        """Parse the quantization tables of a DQT segment into `q_tables`, by table slot."""
+
+        offset = 0
+        while offset < len(payload):
+            precision, table_id = payload[offset] >> 4, payload[offset] & 0x0F
+            size = 128 if precision else 64
+            dtype = ">u2" if precision else np.uint8
+            values = np.frombuffer(payload[offset + 1 : offset + 1 + size], dtype=dtype)
+            q_tables[table_id] = EntropyCoding.izigzag(values.astype(np.float32))
+            offset += 1 + size
+
+    @staticmethod
+    def default_huffman_tables(table_class: int) -> dict[int, tuple[list[int], list[int]]]:
+        """The DC (0) or AC (1) tables of a file without DHT segments, by table slot.
+
+        Motion-JPEG frames may leave out their Huffman tables, decoders then use the standard tables
+        of T.81 Annex K, luminance in slot 0 and chroma in slot 1, see `remove_segments`.
+        """
+
+        return {
+            0: EntropyCoding.huffman_table("luminance")[table_class],
+            1: EntropyCoding.huffman_table("chroma")[table_class],
+        }
+
+    @staticmethod
+    def read_dht(
+        payload: bytes,
+        dc_tables: dict[int, tuple[list[int], list[int]]],
+        ac_tables: dict[int, tuple[list[int], list[int]]],
+    ) -> None:
+        """Parse the Huffman tables of a DHT segment into `dc_tables` and `ac_tables`, by table slot."""
+
+        offset = 0
+        while offset < len(payload):
+            table_class, table_id = payload[offset] >> 4, payload[offset] & 0x0F
+            bits = list(payload[offset + 1 : offset + 17])
+            values = list(payload[offset + 17 : offset + 17 + sum(bits)])
+            (ac_tables if table_class else dc_tables)[table_id] = (bits, values)
+            offset += 17 + sum(bits)
+
+    @staticmethod
+    def read_sof(payload: bytes) -> tuple[tuple[int, int], list[tuple[int, tuple[int, int], int]]]:
+        """Parse an SOF segment into the (height, width) of the image and the
+        (identifier, (horizontal, vertical) sampling, quantization table slot) of every component."""
+
+        if payload[0] != 8:
+            raise ValueError(f"Unsupported sample precision: {payload[0]} bits.")
+
+        shape = (int.from_bytes(payload[1:3], "big"), int.from_bytes(payload[3:5], "big"))
+        frame = []
+        for index in range(payload[5]):
+            component_id, sampling, table_id = payload[6 + 3 * index : 9 + 3 * index]
+            frame.append((component_id, (sampling >> 4, sampling & 0x0F), table_id))
+
+        return shape, frame
+
+    @staticmethod
+    def read_header(
+        data: bytes,
+    ) -> tuple[tuple[int, int], list[tuple[int, int]], list[np.ndarray], list[HuffmanTables], int]:
+        """Parse the segments of a sequential JPEG file up to the start of its scan, without decoding it.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of the .jpg file.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - `shape` : tuple[int, int]
+                The (height, width) of the image.
+            - `sampling` : list[tuple[int, int]]
+                The (horizontal, vertical) sampling factors of every component, (1, 1) for a grayscale image.
+            - `q_tables` : list[np.ndarray]
+                The 8x8 quantization matrix of every component.
+            - `huffman_tables` : list[HuffmanTables]
+                The DC and AC Huffman tables of every component.
+            - `scan_start` : int
+                The position of the entropy-coded data in `data`.
+
+        Raises
+        ------
+        ValueError
+            If the data is not a JPEG file, is not a sequential Huffman JPEG file, its scan
+            does not hold every component, or it has restart markers.
+        """
+
+        if data[:2] != bytes([0xFF, JFIF.SOI]):
+            raise ValueError("Not a JPEG file: missing SOI marker.")
+
+        q_tables: dict[int, np.ndarray] = {}
+        dc_tables = JFIF.default_huffman_tables(0)
+        ac_tables = JFIF.default_huffman_tables(1)
+        shape, frame = (0, 0), []
+
+        position = 2
+        while position < len(data):
+            while data[position] == 0xFF:
+                position += 1
+            marker = data[position]
+            length = int.from_bytes(data[position + 1 : position + 3], "big")
+            payload = data[position + 3 : position + 1 + length]
+            position += 1 + length
+
+            if marker == JFIF.DQT:
+                JFIF.read_dqt(payload, q_tables)
+            elif marker == JFIF.DHT:
+                JFIF.read_dht(payload, dc_tables, ac_tables)
+            elif marker in (JFIF.SOF0, JFIF.SOF1):
+                shape, frame = JFIF.read_sof(payload)
+            elif 0xC2 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                raise ValueError(f"Not a sequential Huffman JPEG file (SOF marker 0x{marker:02X}).")
+            elif marker == JFIF.DRI and int.from_bytes(payload[:2], "big"):
+                raise ValueError("Files with restart markers are not supported.")
+            elif marker == JFIF.SOS:
+                if payload[0] != len(frame):
+                    raise ValueError("The first scan does not hold every component.")
+
+                ids = [component_id for component_id, _, _ in frame]
+                huffman_tables = [None] * len(frame)
+                for index in range(payload[0]):
+                    component_id, tables = payload[1 + 2 * index : 3 + 2 * index]
+                    huffman_tables[ids.index(component_id)] = (dc_tables[tables >> 4], ac_tables[tables & 0x0F])
+
+                sampling = [component_sampling for _, component_sampling, _ in frame] if len(frame) > 1 else [(1, 1)]
+                component_q_tables = [q_tables[table_id] for _, _, table_id in frame]
+
+                return shape, sampling, component_q_tables, huffman_tables, position
+
+        raise ValueError("The file does not contain any scan.")
+
+    @staticmethod
+    def read(
+        data: bytes, scans: int | None = None, last_index: int = 63, workers: int = 1
+    ) -> tuple[list[np.ndarray], list[np.ndarray], tuple[int, int]]:
+        """Parse a sequential or progressive Huffman JPEG file into its quantized coefficient blocks.
+
+        The coefficients of every scan are added up, so a progressive file can be read from any prefix of its
+        scans: the coefficients of the scans that are not read are left at 0. This is also the case for a
+        progressive file that is cut short, e.g. while it is still being downloaded, where the scans that
+        are not complete are ignored.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of the .jpg file.
+        scans : int, optional
+            The number of scans to read. If None, all of them are read.
+        last_index : int, optional
+            The last zigzag index the caller needs, e.g. 0 to decode at 1/8 scale. The scans of a progressive
+            file holding only higher frequencies are skipped without being decoded, their coefficients are
+            left at 0. The default is 63, all of them.
+        workers : int, optional
+            The number of processes decoding the restart intervals of a scan in parallel, for files with
+            restart markers, see `EntropyCoding.decode_components`. The default is 1.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - `components` : list[np.ndarray]
+                Quantized coefficient blocks of every component, each of shape (n, m, 8, 8).
+                Subsampled components have smaller block grids, covering the same MCU grid.
+            - `q_tables` : list[np.ndarray]
+                The 8x8 quantization matrix of every component.
+            - `shape` : tuple[int, int]
+                The (height, width) of the image.
+
+        Raises
+        ------
+        ValueError
+            If the data is not a JPEG file, or uses a feature that is not supported
+            (arithmetic coding, successive approximation).
+        """
+
+        if data[:2] != bytes([0xFF, JFIF.SOI]):
+            raise ValueError("Not a JPEG file: missing SOI marker.")
+
+        q_tables: dict[int, np.ndarray] = {}
+        dc_tables = JFIF.default_huffman_tables(0)
+        ac_tables = JFIF.default_huffman_tables(1)
+        frame: list[tuple[int, tuple[int, int], int]] = []
+        shape = (0, 0)
+        components: list[np.ndarray] | None = None
+        component_q_tables: list[np.ndarray] = []
+        progressive = False
+        restart_interval = 0
+        read_scans = 0
+        # the tables of a slot a scan does not use, e.g. the AC table of a progressive DC scan
+        unused = ([0] * 16, [])
+
+        position = 2
+        while position < len(data) and (scans is None or read_scans < scans):
+            if data[position] != 0xFF:
+                raise ValueError(f"Expected a marker at byte {position}.")
+            while data[position] == 0xFF:
+                position += 1
+            marker = data[position]
+            position += 1
+
+            if marker == JFIF.EOI:
+                break
+
+            length = int.from_bytes(data[position : position + 2], "big")
+            if position + length > len(data):
+                # a file that is cut short ends in the middle of a segment
+                break
+            payload = data[position + 2 : position + length]
+            position += length
+
+            if marker == JFIF.DQT:
+                JFIF.read_dqt(payload, q_tables)
+
+            elif marker == JFIF.DHT:
+                JFIF.read_dht(payload, dc_tables, ac_tables)
+
+            elif marker in (JFIF.SOF0, JFIF.SOF1, JFIF.SOF2):
+                progressive = marker == JFIF.SOF2
+                shape, frame = JFIF.read_sof(payload)
+
+            elif marker == JFIF.DRI:
+                restart_interval = int.from_bytes(payload[:2], "big")
+
+            elif 0xC3 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                raise ValueError(f"Unsupported JPEG process (SOF marker 0x{marker:02X}).")
+
+            elif marker == JFIF.SOS:
+                n_scan = payload[0]
+                ids = [component_id for component_id, _, _ in frame]
+                indices, scan_tables = [], []
+                for index in range(n_scan):
+                    component_id, tables = payload[1 + 2 * index : 3 + 2 * index]
+                    indices.append(ids.index(component_id))
+                    scan_tables.append((dc_tables.get(tables >> 4, unused), ac_tables.get(tables & 0x0F, unused)))
+                start, end, approximation = payload[1 + 2 * n_scan : 4 + 2 * n_scan]
+                if approximation:
+                    raise ValueError("Progressive files with successive approximation are not supported.")
+
+                end_position = JFIF.scan_end(data, position)
+                if progressive and end_position == len(data):
+                    # the scan is not complete, the file was cut short
+                    break
+                if start > last_index:
+                    position = end_position
+                    read_scans += 1
+                    continue
+
+                sampling = [component_sampling for _, component_sampling, _ in frame]
+                if len(frame) == 1:
+                    sampling = [(1, 1)]
+                # every MCU covers (8 * max vertical) x (8 * max horizontal) pixels
+                h_max, v_max = max(h for h, _ in sampling), max(v for _, v in sampling)
+                grid = (-(-shape[0] // (8 * v_max)), -(-shape[1] // (8 * h_max)))
+
+                if components is None:
+                    components = [np.zeros((grid[0] * v, grid[1] * h, 8, 8), dtype=np.int32) for h, v in sampling]
+                    component_q_tables = [q_tables[table_id] for _, _, table_id in frame]
+
+                scan_data = data[position:end_position]
+                if n_scan > 1:
+                    scan_sampling = [sampling[index] for index in indices]
+                    decoded = EntropyCoding.decode_components(
+                        scan_data,
+                        grid,
+                        scan_tables,
+                        scan_sampling,
+                        (start, end),
+                        restart_interval=restart_interval,
+                        workers=workers,
+                    )
+                    for index, blocks in zip(indices, decoded):
+                        components[index] += blocks
+                else:
+                    # a scan of a single component only covers the blocks holding its pixels
+                    rows, cols = JFIF.component_blocks(shape, sampling, indices[0])
+                    blocks = EntropyCoding.decode_components(
+                        scan_data,
+                        (rows, cols),
+                        scan_tables,
+                        band=(start, end),
+                        restart_interval=restart_interval,
+                        workers=workers,
+                    )
+                    components[indices[0]][:rows, :cols] += blocks[0]
+
+                position = end_position
+                read_scans += 1
+
+        if components is None:
+            raise ValueError("The file does not contain any scan.")
+
+        return components, component_q_tables, shape
@@ -2,8 +2,10 @@ from typing import Literal
 
 import numpy as np
 import scipy
+from jpegzip.compression.transforms import get_transform
 from jpegzip.utils.image import ImageBlockProcessor
-from scipy.fft import idctn
+from jpegzip.utils.precision import compute_dtype
+from jpegzip.utils.profiling import stage
 
 
 class JPEGCompression:
@@ -25,6 +27,13 @@ class JPEGCompression:
 
     Q_DOWNSAMPLING : int
         Downsampling factor applied during preprocessing to reduce high-frequency noise.
+
+    SCALES : tuple[int, ...]
+        The reduction factors `decode_scaled` can decode an image at.
+
+    SCALED_BASES : dict[int, np.ndarray]
+        For every block size k = 8 / scale, the k-point orthonormal DCT-II matrix scaled by sqrt(k / 8),
+        so that the reduced inverse DCT keeps the pixel values of the full one, see `idct_scaled`.
     """
 
     Q_LUMINANCE: list[list[int]] = [
@@ -52,9 +61,228 @@ class JPEGCompression:
     PIXEL_MEAN: int = 128
     Q_DOWNSAMPLING: int = 10
 
+    SCALES: tuple[int, ...] = (1, 2, 4, 8)
+    SCALED_BASES: dict[int, np.ndarray] = {
+        8 // scale: scipy.fft.dct(np.eye(8 // scale), axis=0, norm="ortho") * np.sqrt(1 / scale) for scale in SCALES
+    }
+
+    @staticmethod
+    def quantization_matrix(
+        q_method: Literal["luminance", "chroma"] = "luminance", q_factor: float = 1.0, baseline: bool = False
+    ) -> np.ndarray:
+        """Build the quantization matrix for a channel type, scaled by `q_factor`.
+
+        Parameters
+        ----------
+        q_method : Literal["luminance", "chroma"], optional
+            Selects the `Q_LUMINANCE` or the `Q_CHROMA` matrix. The default is "luminance".
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrix. The default value is 1.
+
+        baseline : bool, optional
+            If True, the steps are clamped to the 8-bit tables of baseline JPEG files. The default is False.
+
+        Returns
+        -------
+        np.ndarray
+            The 8x8 quantization matrix, rounded to integer steps so that it can be stored in a JPEG file.
+            Steps are at least 1, and with `baseline=True` they are clamped to [1, 255]. The steps are computed
+            in double precision, so they do not depend on the compute dtype the matrix is returned in.
+        """
+
+        Q = []
+        if q_method == "luminance":
+            Q = JPEGCompression.Q_LUMINANCE
+        elif q_method == "chroma":
+            Q = JPEGCompression.Q_CHROMA
+        Q = np.astype(np.array(Q), np.float64)
+        Q = np.round(q_factor * Q)
+        Q = np.clip(Q, 1.0, 255.0 if baseline else None)
+
+        return Q.astype(compute_dtype())
+
+    @staticmethod
+    def quantization_matrices(
+        q_methods: list[Literal["luminance", "chroma"]], q_factor: float = 1.0, baseline: bool = False
+    ) -> np.ndarray:
+        """Stack the quantization matrices of several channels, see `quantization_matrix`.
+
+        Parameters
+        ----------
+        q_methods : list[Literal["luminance", "chroma"]]
+            The channel type of every channel.
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrices. The default value is 1.
+
+        baseline : bool, optional
+            If True, the steps are clamped to [1, 255], see `quantization_matrix`. The default is False.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (C, 8, 8) with the quantization matrix of every channel.
+        """
+
+        return np.stack([JPEGCompression.quantization_matrix(q_method, q_factor, baseline) for q_method in q_methods])
+
+    @staticmethod
+    def transform(image: np.ndarray, backend: str | None = None) -> np.ndarray:
+        """Transforms an input image into blocks of DCT coefficients, before quantization.
+
+        The process includes downsampling, centering pixel values to zero and block-wise DCT.
+        The DCT is the orthonormal one, which is the transform the JPEG standard defines the
+        quantization matrices for. Everything is computed in the compute dtype, see `jpegzip.utils.precision`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image represented as a 2D numpy array, or a stack of channels of shape (C, H, W).
+
+        backend : str, optional
+            The name of the DCT backend, see `jpegzip.compression.transforms.TRANSFORMS`.
+            If None, the default backend is used, see `set_transform_backend`.
+
+        Returns
+        -------
+        np.ndarray
+            Float array of shape (n, m, 8, 8), or (C, n, m, 8, 8), holding the DCT coefficients of every 8x8 block.
+            Only `quantize_coefficients` depends on the quantization settings, so these coefficients can
+            be computed once and quantized with several q_factors.
+        """
+
+        # preprocess image by downsampling and centering pixels to 0
+        # the first operation allocates a new contiguous array, so that the blocks are views even when `image`
+        # is a strided view (e.g. the channels of an (H, W, C) image), every following operation works in place
+        # rounding maps 255 to 260, the samples are clamped back to 8 bits so that even with quantization steps
+        # of 1 every DC difference and AC coefficient fits the categories of the baseline entropy coder
+        with stage("preprocess", image.nbytes):
+            x = np.divide(image, JPEGCompression.Q_DOWNSAMPLING, dtype=compute_dtype(), order="C")
+            np.round(x, out=x)
+            np.multiply(x, JPEGCompression.Q_DOWNSAMPLING, out=x)
+            np.minimum(x, 255, out=x)
+            np.subtract(x, JPEGCompression.PIXEL_MEAN, out=x)
+
+        with stage("pad", x.nbytes):
+            x = ImageBlockProcessor.pad(x)
+        x_blocks = ImageBlockProcessor.blocks(x)
+
+        # apply the DCT on the last 2 axes (8x8 blocks)
+        with stage("dct", x.nbytes):
+            y_dctn_blocks = get_transform(backend).dct(x_blocks)
+
+        return y_dctn_blocks
+
+    @staticmethod
+    def quantize_coefficients(
+        coefficients: np.ndarray,
+        q_method: Literal["luminance", "chroma"] = "luminance",
+        q_factor: float = 1.0,
+        baseline: bool = False,
+    ) -> np.ndarray:
+        """Quantizes blocks of DCT coefficients, as returned by `transform`.
+
+        Parameters
+        ----------
+        coefficients : np.ndarray
+            DCT coefficients of shape (..., 8, 8). They are not modified.
+
+        q_method : Literal["luminance", "chroma"], optional
+            The quantization method to use, see `encode`. The default is "luminance".
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrix, see `encode`. The default value is 1.
+
+        baseline : bool, optional
+            If True, the steps are clamped to the ones a baseline JPEG file can store, see `quantization_matrix`.
+            The default is False.
+
+        Returns
+        -------
+        np.ndarray
+            Integer array with the same shape as `coefficients` holding the quantized coefficients.
+        """
+
+        Q = JPEGCompression.quantization_matrix(q_method, q_factor, baseline)
+
+        with stage("quantize", coefficients.nbytes):
+            y_quantized = np.divide(coefficients, Q)
+            np.round(y_quantized, out=y_quantized)
+
+            return y_quantized.astype(np.int32)
+
+    @staticmethod
+    def quantize(
+        image: np.ndarray,
+        q_method: Literal["luminance", "chroma"] = "luminance",
+        q_factor: float = 1.0,
+        backend: str | None = None,
+    ) -> np.ndarray:
+        """Transforms an input image into blocks of quantized DCT coefficients.
+
+        This is `transform` followed by `quantize_coefficients`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image represented as a 2D numpy array.
+
+        q_method : Literal["luminance", "chroma"], optional
+            The quantization method to use, see `encode`. The default is "luminance".
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrix, see `encode`. The default value is 1.
+
+        backend : str, optional
+            The name of the DCT backend, see `jpegzip.compression.transforms.TRANSFORMS`.
+            If None, the default backend is used, see `set_transform_backend`.
+
+        Returns
+        -------
+        np.ndarray
+            Integer array of shape (n, m, 8, 8) holding the quantized coefficients of every 8x8 block.
+            These are the values the entropy coder works on.
+        """
+
+        y_dctn_blocks = JPEGCompression.transform(image, backend=backend)
+
+        return JPEGCompression.quantize_coefficients(y_dctn_blocks, q_method=q_method, q_factor=q_factor)
+
+    @staticmethod
+    def dequantize(
+        blocks: np.ndarray, q_method: Literal["luminance", "chroma"] = "luminance", q_factor: float = 1.0
+    ) -> np.ndarray:
+        """Scales quantized coefficient blocks back by the quantization matrix.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Quantized coefficients of shape (n, m, 8, 8), as returned by `quantize`.
+
+        q_method : Literal["luminance", "chroma"], optional
+            The quantization method used by `quantize`. The default is "luminance".
+
+        q_factor : float, optional
+            The scaling factor used by `quantize`. The default value is 1.
+
+        Returns
+        -------
+        np.ndarray
+            The dequantized DCT coefficients laid out as a 2D image, the input expected by `decode`.
+        """
+
+        Q = JPEGCompression.quantization_matrix(q_method, q_factor)
+
+        with stage("dequantize", blocks.nbytes):
+            return ImageBlockProcessor.iblocks(np.multiply(blocks, Q, dtype=compute_dtype()))
+
     @staticmethod
     def encode(
-        image: np.ndarray, q_method: Literal["luminance", "chroma"] = "luminance", q_factor: float = 1.0
+        image: np.ndarray,
+        q_method: Literal["luminance", "chroma"] = "luminance",
+        q_factor: float = 1.0,
+        backend: str | None = None,
     ) -> np.ndarray:
         """Compresses an input image using JPEG-like encoding.
 
@@ -85,39 +313,105 @@ class JPEGCompression:
             Conversely, lower values reduce the compression and preserve more image
             details. The default value is 1.
 
+        backend : str, optional
+            The name of the DCT backend, see `jpegzip.compression.transforms.TRANSFORMS`.
+            If None, the default backend is used, see `set_transform_backend`.
+
         Returns
         -------
         np.ndarray
             Encoded image represented as a 2D numpy array.
             The output includes quantized DCT coefficients for each 8x8 block.
         """
-        Q = []
-        if q_method == "luminance":
-            Q = JPEGCompression.Q_LUMINANCE
-        elif q_method == "chroma":
-            Q = JPEGCompression.Q_CHROMA
-        Q = np.astype(np.array(Q), np.float32)
-        Q = q_factor * Q
 
-        x = image.copy()
+        y_quantized = JPEGCompression.quantize(image, q_method=q_method, q_factor=q_factor, backend=backend)
+        y = JPEGCompression.dequantize(y_quantized, q_method=q_method, q_factor=q_factor)
 
-        # preprocess image by downsampling and centering pixels to 0
-        x = JPEGCompression.Q_DOWNSAMPLING * np.round(x / JPEGCompression.Q_DOWNSAMPLING)
-        x = np.subtract(x, JPEGCompression.PIXEL_MEAN)
+        return y
 
-        x = ImageBlockProcessor.pad(x)
-        x_blocks = ImageBlockProcessor.blocks(x)
+    @staticmethod
+    def encode_channels(
+        image: np.ndarray,
+        q_methods: list[Literal["luminance", "chroma"]],
+        q_factor: float = 1.0,
+        backend: str | None = None,
+    ) -> np.ndarray:
+        """Compresses all the channels of an image in a single vectorized pass, see `encode`.
 
-        # apply dctn on the last 2 axes (8x8 blocks)
-        y_dctn_blocks = scipy.fft.dctn(x_blocks, axes=(-2, -1))
-        y_dctn_quantized = Q * np.round(y_dctn_blocks / Q)
+        The channels are padded and split into blocks together, transformed by a single DCT call and
+        quantized against a broadcast stack of quantization matrices, in place.
 
-        y = ImageBlockProcessor.iblocks(y_dctn_quantized)
+        Parameters
+        ----------
+        image : np.ndarray
+            Input image of shape (H, W, C), e.g. the Y, Cb and Cr channels of an image.
 
-        return y
+        q_methods : list[Literal["luminance", "chroma"]]
+            The quantization method of every channel, see `encode`.
+
+        q_factor : float, optional
+            A scaling factor for the quantization matrices, see `encode`. The default value is 1.
+
+        backend : str, optional
+            The name of the DCT backend, see `jpegzip.compression.transforms.TRANSFORMS`.
+            If None, the default backend is used, see `set_transform_backend`.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (C, H', W') with the encoded channels, each one as returned by `encode`.
+
+        Raises
+        ------
+        RuntimeError
+            If the number of channels does not match the number of quantization methods.
+        """
+
+        if image.ndim != 3 or image.shape[-1] != len(q_methods):
+            raise RuntimeError(
+                f"Expected an image of shape (H, W, {len(q_methods)}) for {len(q_methods)} channels, got {image.shape}."
+            )
+
+        y_blocks = JPEGCompression.transform(np.moveaxis(image, -1, 0), backend=backend)
+        Q = JPEGCompression.quantization_matrices(q_methods, q_factor)[:, None, None]
+
+        # quantize and dequantize in place, rounding to integers in a float array is exact
+        with stage("quantize", y_blocks.nbytes):
+            np.divide(y_blocks, Q, out=y_blocks)
+            np.round(y_blocks, out=y_blocks)
+            np.multiply(y_blocks, Q, out=y_blocks)
+
+        with stage("iblocks", y_blocks.nbytes):
+            return ImageBlockProcessor.iblocks(y_blocks)
+
+    @staticmethod
+    def decode_channels(
+        image: np.ndarray, shape: tuple[int, int] | None = None, backend: str | None = None
+    ) -> np.ndarray:
+        """Decompresses the channels produced by `encode_channels` in a single vectorized pass, see `decode`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Encoded channels of shape (C, H', W').
+
+        shape : tuple[int, int], optional
+            The (height, width) to crop the decoded channels to. If None, the channels are not cropped.
+
+        backend : str, optional
+            The name of the DCT backend, see `jpegzip.compression.transforms.TRANSFORMS`.
+            If None, the default backend is used, see `set_transform_backend`.
+
+        Returns
+        -------
+        np.ndarray
+            The decoded image of shape (H, W, C). It is a view with the channels as the leading axis in memory.
+        """
+
+        return np.moveaxis(JPEGCompression.decode(image, shape, backend=backend), 0, -1)
 
     @staticmethod
-    def decode(image: np.ndarray, shape: tuple[int, ...] | None = None) -> np.ndarray:
+    def decode(image: np.ndarray, shape: tuple[int, ...] | None = None, backend: str | None = None) -> np.ndarray:
         """Decompresses an encoded image using JPEG-like decoding.
 
         The process includes block-wise IDCT, dequantization, and re-centering pixel values
@@ -127,12 +421,16 @@ class JPEGCompression:
         ----------
         image : np.ndarray
             Encoded image represented as a 2D numpy array,
-            containing quantized DCT coefficients.
+            containing quantized DCT coefficients. Leading axes are treated as a batch of channels.
 
         shape :  (tuple[int, int]), Optional
             The desired shape (width, height) to crop the decoded image to.
             If set to None it will not crop the image.
 
+        backend : str, optional
+            The name of the DCT backend, see `jpegzip.compression.transforms.TRANSFORMS`.
+            If None, the default backend is used, see `set_transform_backend`.
+
         Returns
         -------
         np.ndarray
@@ -140,21 +438,199 @@ class JPEGCompression:
             The output is an approximation of the original image before encoding.
         """
 
-        y_blocks = ImageBlockProcessor.blocks(image)
+        y_blocks = ImageBlockProcessor.blocks(image.astype(compute_dtype(), copy=False))
 
-        y_idctn_blocks = idctn(y_blocks, axes=(-2, -1))
-        y_idctn_blocks = np.round(np.add(y_idctn_blocks, JPEGCompression.PIXEL_MEAN))
+        with stage("idct", y_blocks.nbytes):
+            y_idctn_blocks = get_transform(backend).idct(y_blocks)
+            np.add(y_idctn_blocks, JPEGCompression.PIXEL_MEAN, out=y_idctn_blocks)
+            np.round(y_idctn_blocks, out=y_idctn_blocks)
 
-        y = ImageBlockProcessor.iblocks(y_idctn_blocks)
+        with stage("iblocks", y_idctn_blocks.nbytes):
+            y = ImageBlockProcessor.iblocks(y_idctn_blocks)
 
         if shape is None:
             return y
 
-        height, width = image.shape
+        height, width = image.shape[-2:]
         desired_height, desired_width = shape
         height_crop = (height - desired_height) // 2
         width_crop = (width - desired_width) // 2
 
-        y_cropped = y[height_crop : height_crop + desired_height, width_crop : width_crop + desired_width]
+        y_cropped = y[..., height_crop : height_crop + desired_height, width_crop : width_crop + desired_width]
 
         return y_cropped
+
+    @staticmethod
+    def scaled_block_size(scale: int) -> int:
+        """The size k = 8 / scale of the blocks an image decoded at 1/scale is made of, see `idct_scaled`.
+
+        Raises
+        ------
+        ValueError
+            If the scale is not one of `SCALES`.
+        """
+
+        if scale not in JPEGCompression.SCALES:
+            raise ValueError(f"Unsupported scale: {scale}. Expected one of {JPEGCompression.SCALES}.")
+
+        return ImageBlockProcessor.BLOCK_SIZE // scale
+
+    @staticmethod
+    def idct_scaled(blocks: np.ndarray, scale: int | tuple[int, int]) -> np.ndarray:
+        """Decode blocks of DCT coefficients into blocks of pixels reduced by `scale`.
+
+        Every 8x8 block is decoded into a k x k block, k = 8 / scale, by the k-point inverse DCT of its
+        k x k lowest frequency coefficients, scaled by k / 8 so that a flat block keeps its value. This is
+        the reduced IDCT of libjpeg's scaled decoding: at scale 8 a block becomes its DC term over 8 with
+        no transform at all, and at scales 2 and 4 the transforms are 4 and 16 times smaller. The result
+        is close to averaging the pixels of the full decode over `scale` x `scale` squares.
+
+        Parameters
+        ----------
+        blocks : np.ndarray
+            Dequantized coefficients of shape (..., 8, 8). Only the lowest frequencies are read,
+            so blocks already cut down to the size of the result are accepted as well.
+
+        scale : int | tuple[int, int]
+            The reduction factor, one of `SCALES`, or a (vertical, horizontal) pair of them, e.g. for
+            the blocks of a subsampled component, which cover more pixels than the others.
+
+        Returns
+        -------
+        np.ndarray
+            The pixel blocks of shape (..., 8 / vertical, 8 / horizontal), re-centered and rounded like in `decode`.
+
+        Raises
+        ------
+        ValueError
+            If a scale is not one of `SCALES`.
+        """
+
+        vertical, horizontal = (scale, scale) if isinstance(scale, int) else scale
+        rows, cols = JPEGCompression.scaled_block_size(vertical), JPEGCompression.scaled_block_size(horizontal)
+        y_blocks = blocks[..., :rows, :cols].astype(compute_dtype(), copy=False)
+
+        with stage("idct", y_blocks.nbytes):
+            if rows == cols == 1:
+                y_idctn_blocks = np.divide(y_blocks, ImageBlockProcessor.BLOCK_SIZE)
+            else:
+                left = JPEGCompression.SCALED_BASES[rows].astype(compute_dtype())
+                right = JPEGCompression.SCALED_BASES[cols].astype(compute_dtype())
+                y_idctn_blocks = np.matmul(left.T, np.matmul(y_blocks, right))
+            np.add(y_idctn_blocks, JPEGCompression.PIXEL_MEAN, out=y_idctn_blocks)
+            np.round(y_idctn_blocks, out=y_idctn_blocks)
+
+        return y_idctn_blocks
+
+    @staticmethod
+    def decode_scaled(image: np.ndarray, scale: int, shape: tuple[int, ...] | None = None) -> np.ndarray:
+        """Decompresses an encoded image at a fraction of its resolution, without decoding it in full first.
+
+        Thumbnails and the levels of an image pyramid are decoded from the low frequencies of every
+        block only, see `idct_scaled`.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Encoded image, the input of `decode`. Leading axes are treated as a batch of channels.
+
+        scale : int
+            The reduction factor, one of `SCALES`. 1 is the same as `decode`.
+
+        shape : tuple[int, int], optional
+            The (height, width) of the full resolution image, the decoded image is cropped to
+            the same region as in `decode`, rounded outwards to whole pixels at this scale.
+            If None, the image is not cropped.
+
+        Returns
+        -------
+        np.ndarray
+            Decoded image of shape (..., ceil(height / scale), ceil(width / scale)).
+
+        Raises
+        ------
+        ValueError
+            If the scale is not one of `SCALES`.
+        """
+
+        JPEGCompression.scaled_block_size(scale)
+        if scale == 1:
+            return JPEGCompression.decode(image, shape)
+
+        y_idctn_blocks = JPEGCompression.idct_scaled(ImageBlockProcessor.blocks(image), scale)
+
+        with stage("iblocks", y_idctn_blocks.nbytes):
+            y = ImageBlockProcessor.iblocks(y_idctn_blocks)
+
+        if shape is None:
+            return y
+
+        height, width = image.shape[-2:]
+        desired_height, desired_width = shape
+        height_crop = (height - desired_height) // 2 // scale
+        width_crop = (width - desired_width) // 2 // scale
+
+        return y[
+            ...,
+            height_crop : height_crop + -(-desired_height // scale),
+            width_crop : width_crop + -(-desired_width // scale),
+        ]
+
+    @staticmethod
+    def decode_region(
+        image: np.ndarray, y0: int, x0: int, height: int, width: int, shape: tuple[int, ...] | None = None
+    ) -> np.ndarray:
+        """Decompresses a rectangle of an encoded image, transforming only the blocks that overlap it.
+
+        The blocks of the encoded image are laid out as the pixels of the image, so the blocks of the
+        rectangle are a slice of it and the time taken depends on the size of the rectangle only.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Encoded image, the input of `decode`. Leading axes are treated as a batch of channels.
+
+        y0, x0 : int
+            The top left corner of the rectangle, in the coordinates of the decoded image.
+
+        height, width : int
+            The size of the rectangle.
+
+        shape : tuple[int, int], optional
+            The (height, width) the image is cropped to by `decode`, whose coordinates the rectangle is given in.
+            If None, the rectangle is given in the coordinates of the uncropped image.
+
+        Returns
+        -------
+        np.ndarray
+            The pixels `decode(image, shape)[..., y0 : y0 + height, x0 : x0 + width]`.
+
+        Raises
+        ------
+        ValueError
+            If the rectangle is not inside the image.
+        """
+
+        padded_height, padded_width = image.shape[-2:]
+        image_height, image_width = (padded_height, padded_width) if shape is None else shape
+        if not (0 <= y0 and 0 <= x0 and 0 < height and 0 < width):
+            raise ValueError(f"Invalid region ({y0}, {x0}, {height}, {width}).")
+        if y0 + height > image_height or x0 + width > image_width:
+            raise ValueError(
+                f"The region ({y0}, {x0}, {height}, {width}) is not inside the image of shape "
+                f"({image_height}, {image_width})."
+            )
+
+        # the same offsets as the crop of `decode`
+        top = y0 + (padded_height - image_height) // 2
+        left = x0 + (padded_width - image_width) // 2
+
+        block_size = ImageBlockProcessor.BLOCK_SIZE
+        first_row, first_column = top // block_size * block_size, left // block_size * block_size
+        last_row = -(-(top + height) // block_size) * block_size
+        last_column = -(-(left + width) // block_size) * block_size
+
+        y = JPEGCompression.decode(image[..., first_row:last_row, first_column:last_column])
+        top, left = top - first_row, left - first_column
+
+        return y[..., top : top + height, left : left + width]
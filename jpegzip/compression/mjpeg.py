@@ -0,0 +1,315 @@
+import struct
+from fractions import Fraction
+from typing import BinaryIO, Iterator
+
+
+class MJPEGWriter:
+    """Writes JFIF frames into a Motion-JPEG AVI file, without decoding or re-encoding them.
+
+    The file is an AVI 1.0 (RIFF) file with one video stream: every frame is stored as the unchanged bytes
+    of a `.jpg` file in a `00dc` chunk of the `movi` list, followed by an `idx1` index of all the frames.
+    The headers are written with zero frames when the file is opened and rewritten in place when it is
+    closed, so the frames are streamed to disk as they are produced. Every player and library with an
+    MJPEG decoder (ffmpeg, OpenCV, VLC, browsers through ffmpeg) reads these files.
+
+    Every frame is marked as a keyframe in the index unless it is written with `keyframe=False`, e.g. the
+    frames of `ConditionalReplenishment`, which only hold the MCUs that changed since the previous frame.
+
+    Examples
+    --------
+    >>> with MJPEGWriter("video.avi", fps=25.0, width=640, height=480) as writer:
+    ...     writer.write(ImageCompression.compress_jpeg(frame))
+
+    Parameters
+    ----------
+    path : str
+        The path of the AVI file, overwritten if it exists.
+    fps : float
+        The frames per second of the video.
+    width : int
+        The width of the frames.
+    height : int
+        The height of the frames.
+
+    Attributes
+    ----------
+    MAX_SIZE : int
+        The largest size of an AVI 1.0 file, whose chunk sizes and index offsets are 32-bit.
+    frames : int
+        The number of frames written so far.
+    size : int
+        The number of bytes written so far, headers included.
+    """
+
+    MAX_SIZE: int = 2**32 - 1
+
+    # AVIF_HASINDEX in the main header, AVIIF_KEYFRAME in the index
+    _HAS_INDEX: int = 0x10
+    _KEYFRAME: int = 0x10
+
+    def __init__(self, path: str, fps: float, width: int, height: int):
+        self.path: str = path
+        self.fps: float = fps
+        self.width: int = width
+        self.height: int = height
+        self.frames: int = 0
+
+        self._index: list[tuple[int, int, int]] = []
+        self._largest: int = 0
+        self._file: BinaryIO = open(path, "wb")
+
+        header = self._header()
+        self._file.write(header)
+        # the offsets of the index are relative to the `movi` identifier, 4 bytes before the first chunk
+        self._movi: int = len(header) - 4
+        self.size: int = len(header)
+
+    def _header(self, riff_size: int = 0) -> bytes:
+        """The RIFF headers up to the start of the `movi` list, for the frames written so far."""
+
+        rate = Fraction(self.fps).limit_denominator(1001)
+        micro_seconds = round(1e6 / self.fps) if self.fps > 0 else 0
+        movi_size = 4 + sum(8 + size + size % 2 for _, size, _ in self._index)
+
+        avih = struct.pack(
+            "<14I",
+            micro_seconds,
+            round(self._largest * self.fps),
+            0,
+            MJPEGWriter._HAS_INDEX,
+            self.frames,
+            0,
+            1,
+            self._largest,
+            self.width,
+            self.height,
+            0,
+            0,
+            0,
+            0,
+        )
+        strh = struct.pack(
+            "<4s4sIHHIIIIIIIIHHHH",
+            b"vids",
+            b"MJPG",
+            0,
+            0,
+            0,
+            0,
+            rate.denominator,
+            rate.numerator,
+            0,
+            self.frames,
+            self._largest,
+            0xFFFFFFFF,
+            0,
+            0,
+            0,
+            self.width,
+            self.height,
+        )
+        strf = struct.pack(
+            "<IiiHH4sIiiII", 40, self.width, self.height, 1, 24, b"MJPG", self.width * self.height * 3, 0, 0, 0, 0
+        )
+
+        strl = b"strl" + MJPEGWriter.chunk(b"strh", strh) + MJPEGWriter.chunk(b"strf", strf)
+        hdrl = b"hdrl" + MJPEGWriter.chunk(b"avih", avih) + MJPEGWriter.chunk(b"LIST", strl)
+        body = MJPEGWriter.chunk(b"LIST", hdrl) + b"LIST" + struct.pack("<I", movi_size) + b"movi"
+
+        return b"RIFF" + struct.pack("<I", riff_size) + b"AVI " + body
+
+    @staticmethod
+    def chunk(fourcc: bytes, data: bytes) -> bytes:
+        """Build a RIFF chunk, the data is padded to an even number of bytes."""
+
+        return fourcc + struct.pack("<I", len(data)) + data + b"\x00" * (len(data) % 2)
+
+    def write(self, data: bytes, keyframe: bool = True) -> None:
+        """Append the bytes of a JFIF file as the next frame.
+
+        Parameters
+        ----------
+        data : bytes
+            The content of the .jpg file. An empty frame repeats the previous one.
+        keyframe : bool, optional
+            Whether the frame decodes on its own, so that a reader can start from it. The default is True.
+
+        Raises
+        ------
+        ValueError
+            If the frame would grow the file beyond `MAX_SIZE`, the index included.
+        """
+
+        chunk = MJPEGWriter.chunk(b"00dc", data)
+        if self.size + len(chunk) + 16 * (len(self._index) + 1) + 8 > MJPEGWriter.MAX_SIZE:
+            raise ValueError(f"An AVI file cannot hold more than {MJPEGWriter.MAX_SIZE} bytes.")
+
+        self._index.append((self.size - self._movi, len(data), MJPEGWriter._KEYFRAME if keyframe else 0))
+        self._largest = max(self._largest, len(data))
+        self._file.write(chunk)
+        self.size += len(chunk)
+        self.frames += 1
+
+    def close(self) -> None:
+        """Write the index and the final headers, then close the file."""
+
+        if self._file.closed:
+            return
+
+        index = b"".join(struct.pack("<4sIII", b"00dc", flags, offset, size) for offset, size, flags in self._index)
+        self._file.write(MJPEGWriter.chunk(b"idx1", index))
+
+        # the RIFF size counts everything after its own 8 byte chunk header, up to the end of the index
+        self._file.seek(0)
+        self._file.write(self._header(riff_size=self.size - 8 + 8 + len(index)))
+        self._file.close()
+
+    def __enter__(self) -> "MJPEGWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class MJPEGReader:
+    """Reads the JFIF frames of a Motion-JPEG AVI file, e.g. one written by `MJPEGWriter`.
+
+    Only the container is parsed, the frames are returned as the bytes of `.jpg` files,
+    see `ImageCompression.decompress_jpeg`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the AVI file.
+
+    Attributes
+    ----------
+    fps : float
+        The frames per second of the video stream.
+    frames : int
+        The number of frames in the main header.
+    width : int
+        The width of the frames.
+    height : int
+        The height of the frames.
+    keyframes : list[int]
+        The indices of the frames marked as keyframes in the `idx1` index, all of them if the file has no index.
+
+    Raises
+    ------
+    ValueError
+        If the file is not an AVI file.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+
+        with open(path, "rb") as file:
+            riff, _, form = struct.unpack("<4sI4s", file.read(12))
+            if riff != b"RIFF" or form != b"AVI ":
+                raise ValueError(f"Not an AVI file: {path}.")
+
+            self._movi: tuple[int, int] | None = None
+            self._idx1: bytes | None = None
+            self.fps: float = 0.0
+            self.frames: int = 0
+            self.width: int = 0
+            self.height: int = 0
+            self._parse(file, 12, None)
+
+        if self._movi is None:
+            raise ValueError(f"The AVI file has no movi list: {path}.")
+
+        # the (position, size) of the data of every frame and the indices of the keyframes
+        self._frames: list[tuple[int, int]] = []
+        self.keyframes: list[int] = []
+        self._index()
+
+    def _parse(self, file: BinaryIO, position: int, end: int | None) -> None:
+        """Walk the chunks between `position` and `end`, reading the headers and locating the `movi` list."""
+
+        while end is None or position + 8 <= end:
+            file.seek(position)
+            header = file.read(8)
+            if len(header) < 8:
+                return
+            fourcc, size = struct.unpack("<4sI", header)
+
+            if fourcc == b"LIST":
+                kind = file.read(4)
+                if kind == b"movi":
+                    self._movi = (position + 12, position + 8 + size)
+                else:
+                    self._parse(file, position + 12, position + 8 + size)
+            elif fourcc == b"idx1":
+                self._idx1 = file.read(size)
+            elif fourcc == b"avih":
+                _, _, _, _, self.frames, _, _, _, self.width, self.height = struct.unpack("<10I", file.read(40))
+            elif fourcc == b"strh":
+                data = file.read(32)
+                if data[:4] == b"vids":
+                    scale, rate = struct.unpack("<II", data[20:28])
+                    self.fps = rate / scale if scale else 0.0
+
+            position += 8 + size + size % 2
+
+    def _chunks(self) -> Iterator[tuple[int, int]]:
+        """Walk the `movi` list, yielding the (position, size) of the data of every frame chunk."""
+
+        start, end = self._movi
+        with open(self.path, "rb") as file:
+            position = start
+            while position + 8 <= end:
+                file.seek(position)
+                fourcc, size = struct.unpack("<4sI", file.read(8))
+                # compressed (dc) or uncompressed (db) frames of the first stream, skipping JUNK and other streams
+                if fourcc in (b"00dc", b"00db"):
+                    yield position + 8, size
+                elif fourcc == b"LIST":
+                    # an `rec ` list groups the chunks of one frame, walk into it
+                    position += 12
+                    continue
+
+                position += 8 + size + size % 2
+
+    def _index(self) -> None:
+        """Locate the frames from the `idx1` index, or by walking the `movi` list if the file has none."""
+
+        if self._idx1 is None:
+            self._frames = list(self._chunks())
+            self.keyframes = list(range(len(self._frames)))
+            return
+
+        entries = [struct.unpack("<4sIII", self._idx1[i : i + 16]) for i in range(0, len(self._idx1) - 15, 16)]
+        entries = [(flags, offset, size) for fourcc, flags, offset, size in entries if fourcc in (b"00dc", b"00db")]
+
+        # the offsets are relative to the `movi` identifier, except in some writers where they are absolute
+        base = self._movi[0] - 4
+        if entries and entries[0][1] >= base:
+            base = 0
+
+        for index, (flags, offset, size) in enumerate(entries):
+            self._frames.append((base + offset + 8, size))
+            if flags & MJPEGWriter._KEYFRAME:
+                self.keyframes.append(index)
+
+    def __len__(self) -> int:
+        """The number of frames of the video stream."""
+
+        return len(self._frames)
+
+    def read(self, index: int) -> bytes:
+        """The bytes of the frame at `index`, read without walking the frames before it."""
+
+        position, size = self._frames[index]
+        with open(self.path, "rb") as file:
+            file.seek(position)
+            return file.read(size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Yield the bytes of every frame of the video stream, in order."""
+
+        with open(self.path, "rb") as file:
+            for position, size in self._frames:
+                file.seek(position)
+                yield file.read(size)
@@ -0,0 +1,277 @@
+from contextlib import contextmanager
+from typing import Iterator, Protocol
+
+import numpy as np
+import scipy
+
+
+class TransformBackend(Protocol):
+    """The 8x8 block DCT used by `JPEGCompression`.
+
+    Both methods take an array of shape (..., 8, 8) in the compute dtype and return the orthonormal 2D DCT-II
+    (or its inverse) of every block, as an array of the same shape and dtype. The result may be a view,
+    but never aliases the input.
+    """
+
+    @staticmethod
+    def dct(blocks: np.ndarray) -> np.ndarray: ...
+
+    @staticmethod
+    def idct(blocks: np.ndarray) -> np.ndarray: ...
+
+
+class ScipyTransform:
+    """The reference backend, `scipy.fft.dctn` and `idctn` applied on the last two axes."""
+
+    @staticmethod
+    def dct(blocks: np.ndarray) -> np.ndarray:
+        return scipy.fft.dctn(blocks, axes=(-2, -1), norm="ortho")
+
+    @staticmethod
+    def idct(blocks: np.ndarray) -> np.ndarray:
+        return scipy.fft.idctn(blocks, axes=(-2, -1), norm="ortho")
+
+
+class MatmulTransform:
+    """The DCT as two multiplications by a precomputed 8x8 basis, Y = C X Cᵀ and X = Cᵀ Y C.
+
+    The blocks are processed in the layout of the image they come from: multiplying every row of
+    an (H, W) image by a block diagonal Cᵀ is a single (H * W / 8, 8) @ (8, 8) product, and multiplying
+    every strip of 8 rows by C is a batch of (8, 8) @ (8, W) products. Both run on BLAS, with all its
+    threads, instead of one small FFT per block. Blocks that are not a view of a contiguous image
+    (see `ImageBlockProcessor.blocks`) are first copied into that layout.
+
+    Attributes
+    ----------
+    BASIS : np.ndarray
+        The orthonormal DCT-II matrix C, C[u, x] = c(u) cos((2x + 1) u π / 16).
+    """
+
+    BASIS: np.ndarray = scipy.fft.dct(np.eye(8), axis=0, norm="ortho")
+
+    @staticmethod
+    def _image(blocks: np.ndarray) -> np.ndarray:
+        # (..., n, m, 8, 8) blocks -> (..., n, 8, m, 8) image, a view for the blocks of a contiguous image
+        image = blocks.swapaxes(-3, -2)
+        return image if image.flags.c_contiguous else np.ascontiguousarray(image)
+
+    @staticmethod
+    def _multiply(blocks: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        """Compute `left @ block @ right` for every 8x8 block."""
+
+        left = left.astype(blocks.dtype, copy=False)
+        right = right.astype(blocks.dtype, copy=False)
+
+        image = MatmulTransform._image(blocks)
+        *batch, n, _, m, _ = image.shape
+
+        # the rows of every block times `right`, then every column of blocks times `left`
+        rows = np.matmul(image.reshape(*batch, n * 8, m, 8), right)
+        result = np.matmul(left, rows.reshape(*batch, n, 8, m * 8))
+
+        return result.reshape(*batch, n, 8, m, 8).swapaxes(-3, -2)
+
+    @staticmethod
+    def dct(blocks: np.ndarray) -> np.ndarray:
+        return MatmulTransform._multiply(blocks, MatmulTransform.BASIS, MatmulTransform.BASIS.T)
+
+    @staticmethod
+    def idct(blocks: np.ndarray) -> np.ndarray:
+        return MatmulTransform._multiply(blocks, MatmulTransform.BASIS.T, MatmulTransform.BASIS)
+
+
+class AANTransform:
+    """The fixed-point Arai-Agui-Nakajima (AAN) fast DCT, the "ifast" transform of libjpeg.
+
+    Each 8-point pass takes 5 multiplications and 29 additions on 32-bit integers, with the constants
+    stored with `CONST_BITS` fractional bits and the data with `PASS_BITS` extra bits of precision.
+    AAN leaves every coefficient scaled by 8 a(u) a(v), with a(0) = 1 and a(k) = √2 cos(kπ/16). libjpeg folds
+    this scale into its quantization tables, here it is undone by one multiplication so that the backend returns
+    orthonormal coefficients like the others. The input of `dct` is rounded to integers. On 8-bit blocks the
+    coefficients of `dct` are within 1.3 of the exact transform. The error of `idct` grows with the magnitude of
+    the coefficients, it reaches 1.8 on the coefficients of 8-bit blocks and 2.1 over the whole baseline range.
+
+    The backend exists only for determinism: the integer arithmetic makes the results identical on every
+    platform. In NumPy the passes cost more than one FFT per block, so it is slower than `ScipyTransform` and
+    is not in `TRANSFORMS` by default. Select it after `register_transform("aan", AANTransform)`.
+
+    Attributes
+    ----------
+    CONST_BITS : int
+        The number of fractional bits of the multiplication constants.
+    PASS_BITS : int
+        The number of fractional bits kept on the data between the two passes.
+    CHUNK_BLOCKS : int
+        The number of blocks transformed at a time, so that the temporaries of a pass stay in cache.
+    SCALE : np.ndarray
+        The 8x8 matrix of the AAN scale factors 8 a(u) a(v).
+    """
+
+    CONST_BITS: int = 11
+    PASS_BITS: int = 2
+    CHUNK_BLOCKS: int = 2048
+
+    SCALE: np.ndarray = 8 * np.outer(*2 * [np.r_[1.0, np.sqrt(2) * np.cos(np.arange(1, 8) * np.pi / 16)]])
+
+    @staticmethod
+    def _fix(value: float) -> int:
+        return int(round(value * (1 << AANTransform.CONST_BITS)))
+
+    @staticmethod
+    def _multiply(values: np.ndarray, constant: int) -> np.ndarray:
+        return (values * constant + (1 << (AANTransform.CONST_BITS - 1))) >> AANTransform.CONST_BITS
+
+    @staticmethod
+    def forward(d: list[np.ndarray]) -> list[np.ndarray]:
+        """One pass of the forward transform over the 8 samples `d`, libjpeg's `jpeg_fdct_ifast`."""
+
+        fix, multiply = AANTransform._fix, AANTransform._multiply
+
+        tmp0, tmp7 = d[0] + d[7], d[0] - d[7]
+        tmp1, tmp6 = d[1] + d[6], d[1] - d[6]
+        tmp2, tmp5 = d[2] + d[5], d[2] - d[5]
+        tmp3, tmp4 = d[3] + d[4], d[3] - d[4]
+
+        # even part
+        tmp10, tmp13 = tmp0 + tmp3, tmp0 - tmp3
+        tmp11, tmp12 = tmp1 + tmp2, tmp1 - tmp2
+        out0, out4 = tmp10 + tmp11, tmp10 - tmp11
+        z1 = multiply(tmp12 + tmp13, fix(0.707106781))
+
+        # odd part
+        tmp10, tmp11, tmp12 = tmp4 + tmp5, tmp5 + tmp6, tmp6 + tmp7
+        z5 = multiply(tmp10 - tmp12, fix(0.382683433))
+        z2 = multiply(tmp10, fix(0.541196100)) + z5
+        z4 = multiply(tmp12, fix(1.306562965)) + z5
+        z3 = multiply(tmp11, fix(0.707106781))
+        z11, z13 = tmp7 + z3, tmp7 - z3
+
+        return [out0, z11 + z4, tmp13 + z1, z13 - z2, out4, z13 + z2, tmp13 - z1, z11 - z4]
+
+    @staticmethod
+    def inverse(d: list[np.ndarray]) -> list[np.ndarray]:
+        """One pass of the inverse transform over the 8 coefficients `d`, libjpeg's `jpeg_idct_ifast`."""
+
+        fix, multiply = AANTransform._fix, AANTransform._multiply
+
+        # even part
+        tmp10, tmp11 = d[0] + d[4], d[0] - d[4]
+        tmp13 = d[2] + d[6]
+        tmp12 = multiply(d[2] - d[6], fix(1.414213562)) - tmp13
+        tmp0, tmp3 = tmp10 + tmp13, tmp10 - tmp13
+        tmp1, tmp2 = tmp11 + tmp12, tmp11 - tmp12
+
+        # odd part
+        z13, z10 = d[5] + d[3], d[5] - d[3]
+        z11, z12 = d[1] + d[7], d[1] - d[7]
+        tmp7 = z11 + z13
+        tmp11 = multiply(z11 - z13, fix(1.414213562))
+        z5 = multiply(z10 + z12, fix(1.847759065))
+        tmp10 = multiply(z12, fix(1.082392200)) - z5
+        tmp12 = z5 - multiply(z10, fix(2.613125930))
+        tmp6 = tmp12 - tmp7
+        tmp5 = tmp11 - tmp6
+        tmp4 = tmp10 + tmp5
+
+        return [tmp0 + tmp7, tmp1 + tmp6, tmp2 + tmp5, tmp3 - tmp4, tmp3 + tmp4, tmp2 - tmp5, tmp1 - tmp6, tmp0 - tmp7]
+
+    @staticmethod
+    def _transform(blocks: np.ndarray, inverse: bool) -> np.ndarray:
+        one_pass = AANTransform.inverse if inverse else AANTransform.forward
+        scale = AANTransform.SCALE * (1 << AANTransform.PASS_BITS)
+        shift = 3 + AANTransform.PASS_BITS
+
+        flat = blocks.reshape(-1, 64)
+        out = np.empty(flat.shape, dtype=blocks.dtype)
+
+        for start in range(0, flat.shape[0], AANTransform.CHUNK_BLOCKS):
+            # (64, chunk): every coefficient of the chunk is a contiguous row
+            x = flat[start : start + AANTransform.CHUNK_BLOCKS].T
+            if inverse:
+                x = np.rint(x * (scale.reshape(64, 1) / 8).astype(blocks.dtype)).astype(np.int32)
+            else:
+                x = np.rint(x).astype(np.int32) << AANTransform.PASS_BITS
+            x = x.reshape(8, 8, -1)
+
+            # along the rows of the blocks, then along their columns
+            rows = np.stack(one_pass([x[:, k] for k in range(8)]), axis=1)
+            y = np.stack(one_pass([rows[k] for k in range(8)])).reshape(64, -1)
+
+            if inverse:
+                out[start : start + AANTransform.CHUNK_BLOCKS] = ((y + (1 << (shift - 1))) >> shift).T
+            else:
+                np.multiply(y.T, (1 / scale.reshape(64)).astype(blocks.dtype), out=out[start : start + y.shape[1]])
+
+        return out.reshape(blocks.shape)
+
+    @staticmethod
+    def dct(blocks: np.ndarray) -> np.ndarray:
+        return AANTransform._transform(blocks, inverse=False)
+
+    @staticmethod
+    def idct(blocks: np.ndarray) -> np.ndarray:
+        return AANTransform._transform(blocks, inverse=True)
+
+
+TRANSFORMS: dict[str, TransformBackend] = {
+    "scipy": ScipyTransform,
+    "matmul": MatmulTransform,
+}
+
+# the backend used when a call does not select one
+_transform_backend: str = "scipy"
+
+
+def transform_backend() -> str:
+    """The name of the default DCT backend, "scipy" unless changed by `set_transform_backend`."""
+
+    return _transform_backend
+
+
+def set_transform_backend(name: str) -> None:
+    """Select the default DCT backend, see `TRANSFORMS`.
+
+    Raises
+    ------
+    ValueError
+        If no backend is registered under `name`.
+    """
+
+    global _transform_backend
+
+    get_transform(name)
+    _transform_backend = name
+
+
+@contextmanager
+def use_transform_backend(name: str) -> Iterator[None]:
+    """Temporarily select the default DCT backend, see `set_transform_backend`."""
+
+    previous = transform_backend()
+    set_transform_backend(name)
+    try:
+        yield
+    finally:
+        set_transform_backend(previous)
+
+
+def register_transform(name: str, backend: TransformBackend) -> None:
+    """Make a DCT backend selectable by name, e.g. from the `--transform` option of the CLI."""
+
+    TRANSFORMS[name] = backend
+
+
+def get_transform(name: str | None = None) -> TransformBackend:
+    """The backend registered under `name`, or the default backend if `name` is None.
+
+    Raises
+    ------
+    ValueError
+        If no backend is registered under `name`.
+    """
+
+    name = transform_backend() if name is None else name
+    if name not in TRANSFORMS:
+        raise ValueError(f"Unknown transform backend: {name}. Expected one of {list(TRANSFORMS)}.")
+
+    return TRANSFORMS[name]
@@ -1,49 +1,844 @@
 import os
+import struct
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterable, Iterator
 
 import cv2 as cv
 import numpy as np
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.jfif import JFIF
+from jpegzip.compression.mjpeg import MJPEGReader, MJPEGWriter
+from jpegzip.compression.transforms import set_transform_backend, transform_backend
+from jpegzip.utils.file_system import BASE_OUTPUT_DIR, logger, video_frames, video_properties
+from jpegzip.utils.image import CHROMA_SUBSAMPLING, Subsampling
+from jpegzip.utils.precision import compute_dtype, set_compute_dtype
+from jpegzip.utils.profiling import active_profile, profile, stage
+from jpegzip.utils.streaming import prefetch
 from skimage.metrics import mean_squared_error
-from utils.file_system import BASE_OUTPUT_DIR, load_video, logger
 
-from compression.image_compression import ImageCompression
+# per-process state of a pool worker, set up once by `_init_worker`: views into the shared frame buffers,
+# the target MSE, the chroma subsampling mode, the q_factor of the last frame compressed by this worker,
+# whether the parent is profiling (None) or not, with or without memory tracing (False, True)
+# and whether the frames are encoded into JFIF files
+_shared_frames: tuple[SharedMemory, SharedMemory, np.ndarray, np.ndarray] | None = None
+_target_mse: float | None = None
+_subsampling: Subsampling = "4:4:4"
+_q_factor: float = 1.0
+_profile_memory: bool | None = None
+_jpeg: bool = False
+
+
+def compress_frame(
+    frame: np.ndarray, target_mse: float | None = None, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+) -> tuple[np.ndarray, float, float, int]:
+    """Compress a single frame, either with a fixed quality factor or to a target MSE.
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        The RGB frame to compress.
+    target_mse : float, optional
+        The target MSE of the frame. If None, the frame is compressed with `q_factor`.
+    q_factor : float, optional
+        The quality factor, or the starting point of the search when `target_mse` is set.
+    subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+        The chroma subsampling mode, see `ImageCompression.compress_rgb`.
+
+    Returns
+    -------
+    tuple
+        A tuple `(compressed_frame, mse, q_factor, iterations)` with the quality factor that was used
+        and the number of compressions that were needed to find it.
+    """
+
+    with stage("compress_frame", frame.nbytes):
+        if target_mse is None:
+            compressed_frame = ImageCompression.compress_rgb(frame, q_factor=q_factor, subsampling=subsampling)
+
+            return compressed_frame, mean_squared_error(frame, compressed_frame), q_factor, 1
+
+        compressed_frame, q_factor, mse, iterations = ImageCompression.search_q_factor(
+            frame, target_mse, q_factor=q_factor, subsampling=subsampling
+        )
+
+        return compressed_frame, mse, q_factor, iterations
+
+
+def encode_frame(
+    frame: np.ndarray, target_mse: float | None = None, q_factor: float = 1.0, subsampling: Subsampling = "4:4:4"
+) -> tuple[bytes, float, float, int]:
+    """Compress a single frame into the bytes of a JFIF file, see `compress_frame`.
+
+    In target MSE mode the file is searched with `ImageCompression.search_q_factor_jpeg`, on the images
+    decoded from the candidate files. The MSE is the one of the decoded JFIF file, which is reconstructed
+    from its quantized coefficients.
+
+    Returns
+    -------
+    tuple
+        A tuple `(data, mse, q_factor, iterations)` with the content of the .jpg file, its MSE, the quality
+        factor that was used and the number of reconstructions that were needed.
+    """
+
+    with stage("compress_frame", frame.nbytes):
+        if target_mse is not None:
+            data, _, q_factor, mse, iterations = ImageCompression.search_q_factor_jpeg(
+                frame, target_mse, q_factor=q_factor, subsampling=subsampling
+            )
+
+            return data, mse, q_factor, iterations
+
+        data, compressed_frame = ImageCompression.encode_jpeg(frame, q_factor=q_factor, subsampling=subsampling)
+
+        return data, mean_squared_error(frame, compressed_frame), q_factor, 1
+
+
+def _init_worker(
+    frames_name: str,
+    compressed_name: str,
+    shape: tuple[int, ...],
+    target_mse: float | None,
+    q_factor: float,
+    subsampling: Subsampling,
+    dtype: str,
+    transform: str = "scipy",
+    profile_memory: bool | None = None,
+    jpeg: bool = False,
+) -> None:
+    """Attach a pool worker to the shared input and output frame buffers,
+    computing in the parent's dtype with the parent's DCT backend."""
+
+    global _shared_frames, _target_mse, _q_factor, _subsampling, _profile_memory, _jpeg
+
+    frames_memory = SharedMemory(name=frames_name)
+    compressed_memory = SharedMemory(name=compressed_name)
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=frames_memory.buf)
+    compressed = np.ndarray(shape, dtype=np.uint8, buffer=compressed_memory.buf)
+
+    _shared_frames = (frames_memory, compressed_memory, frames, compressed)
+    _target_mse = target_mse
+    _q_factor = q_factor
+    _subsampling = subsampling
+    _profile_memory = profile_memory
+    _jpeg = jpeg
+    set_compute_dtype(dtype)
+    set_transform_backend(transform)
+
+
+def _compress_slot(slot: int) -> tuple[float, int, dict | None, bytes | None]:
+    """Compress the frame stored in `slot` of the shared input buffer into the same slot of the output buffer.
+
+    Only the slot index, the resulting MSE and the number of search iterations cross the process boundary,
+    the pixels stay in shared memory. In target MSE mode every worker warm starts from the q_factor of the
+    last frame it compressed. When the parent is profiling, the stage statistics of the frame are returned too,
+    to be merged into the parent's profile. When the frames are encoded into JFIF files, the bytes of the
+    file are returned instead of filling the output slot.
+    """
+
+    global _q_factor
+
+    _, _, frames, compressed = _shared_frames
+    data = None
+    with nullcontext() if _profile_memory is None else profile(memory=_profile_memory) as collected:
+        if _jpeg:
+            data, mse, _q_factor, iterations = encode_frame(frames[slot], _target_mse, _q_factor, _subsampling)
+        else:
+            compressed[slot], mse, _q_factor, iterations = compress_frame(
+                frames[slot], _target_mse, _q_factor, _subsampling
+            )
+
+    return mse, iterations, None if collected is None else collected.stages, data
+
+
+class ConditionalReplenishment:
+    """Compresses a sequence of frames, re-coding only the MCUs that changed since they were last coded.
+
+    Every `keyframe_interval` frames, a keyframe is compressed as a whole, which refreshes the MCUs whose small
+    changes stayed under the threshold. In between, the mean absolute difference of every MCU (the 8x8, 8x16 or
+    16x16 pixels of all channels that share their chroma blocks) to the pixels it was last coded from is measured.
+    MCUs that changed by more than `change_threshold` are laid out in rows of `grid[1]` MCUs, compressed as one
+    image and scattered into the output frame, the other MCUs keep their previous reconstruction and skip the
+    colour conversion, DCT, quantization and IDCT altogether. Comparing against the pixels of the last coded
+    version, not the previous frame, keeps slow changes from accumulating unnoticed.
+
+    Frames are padded to whole MCUs by repeating their edge pixels, so that the blocks of a strip are exactly
+    the blocks of the whole frame.
+
+    `encode` stores every frame as a JFIF file for a Motion-JPEG file. A keyframe is the file of the whole frame.
+    Any other frame is the file of its strip of changed MCUs, without the standard Huffman tables and with their
+    (n, m) mask of skip flags in an `APP15` segment, see `SKIP_IDENTIFIER`, or no bytes at all when no MCU
+    changed. `decode` rebuilds the frames from these files, starting from any keyframe.
+
+    Parameters
+    ----------
+    shape : tuple[int, int]
+        The (height, width) of the frames.
+    keyframe_interval : int, optional
+        The number of frames between two keyframes. The default is `KEYFRAME_INTERVAL`.
+    change_threshold : float, optional
+        The mean absolute pixel difference above which an MCU is re-coded. The default is `CHANGE_THRESHOLD`.
+    q_factor : float, optional
+        The quality factor, or the starting point of the search in target MSE mode.
+    target_mse : float, optional
+        If set, the changed MCUs of every frame are compressed to this MSE.
+    subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+        The chroma subsampling mode, which also sets the size of the MCUs. The default is "4:4:4".
+
+    Attributes
+    ----------
+    KEYFRAME_INTERVAL : int
+        The default number of frames between two keyframes.
+    CHANGE_THRESHOLD : float
+        The default mean absolute difference above which an MCU is re-coded, a little above sensor noise.
+    SKIP_IDENTIFIER : bytes
+        The start of the `APP15` segment of the frames that are not keyframes, followed by the MCU height
+        and width (1 byte each), the rows and columns of the grid of MCUs (2 bytes each, big-endian)
+        and the flags of the changed MCUs, 8 per byte in row-major order.
+    mcu : tuple[int, int]
+        The (height, width) of the MCUs.
+    grid : tuple[int, int]
+        The number of rows and columns of MCUs of the padded frames.
+    frame_index : int
+        The number of frames compressed so far.
+    """
+
+    KEYFRAME_INTERVAL: int = 30
+    CHANGE_THRESHOLD: float = 2.0
+    SKIP_IDENTIFIER: bytes = b"JPEGZIP SKIP\x00"
+
+    def __init__(
+        self,
+        shape: tuple[int, int],
+        keyframe_interval: int | None = None,
+        change_threshold: float | None = None,
+        q_factor: float = 1.0,
+        target_mse: float | None = None,
+        subsampling: Subsampling = "4:4:4",
+    ):
+        """Initializes the state of the sequence, the first frame is always a keyframe.
+
+        Raises
+        ------
+        ValueError
+            If `keyframe_interval` is smaller than 1.
+        """
+
+        keyframe_interval = (
+            ConditionalReplenishment.KEYFRAME_INTERVAL if keyframe_interval is None else keyframe_interval
+        )
+        if keyframe_interval < 1:
+            raise ValueError(f"The keyframe interval must be at least 1, got {keyframe_interval}.")
+
+        vertical, horizontal = CHROMA_SUBSAMPLING[subsampling]
+
+        self.shape: tuple[int, int] = shape
+        self.mcu: tuple[int, int] = (8 * vertical, 8 * horizontal)
+        self.keyframe_interval: int = keyframe_interval
+        self.change_threshold: float = (
+            ConditionalReplenishment.CHANGE_THRESHOLD if change_threshold is None else change_threshold
+        )
+        self.q_factor: float = q_factor
+        self.target_mse: float | None = target_mse
+        self.subsampling: Subsampling = subsampling
+        self.frame_index: int = 0
+
+        # the number of MCU rows and columns of the padded frames
+        self.grid: tuple[int, int] = (-(-shape[0] // self.mcu[0]), -(-shape[1] // self.mcu[1]))
+
+        padded_shape = (self.grid[0] * self.mcu[0], self.grid[1] * self.mcu[1], 3)
+        # the pixels every MCU was last coded from, and the current reconstruction of the frame
+        self.reference: np.ndarray = np.zeros(padded_shape, dtype=np.uint8)
+        self.reconstruction: np.ndarray = np.zeros(padded_shape, dtype=np.uint8)
+
+    def mcus(self, frame: np.ndarray) -> np.ndarray:
+        """A view of a padded frame as an (n, m, mcu height, mcu width, 3) array of MCUs."""
+
+        return frame.reshape(self.grid[0], self.mcu[0], self.grid[1], self.mcu[1], 3).swapaxes(1, 2)
+
+    def changed(self, frame: np.ndarray) -> np.ndarray:
+        """The (n, m) mask of the MCUs of a padded frame that differ from the reference by more than the threshold."""
+
+        with stage("compare", frame.nbytes):
+            difference = np.abs(self.mcus(frame).astype(np.int16) - self.mcus(self.reference))
+            return difference.mean(axis=(2, 3, 4)) > self.change_threshold
+
+    @staticmethod
+    def strip(mcus: np.ndarray, columns: int) -> np.ndarray:
+        """Lay out a (k, mcu height, mcu width, 3) array of MCUs as an image of at most `columns` MCUs per row.
+
+        The last row is filled up with copies of the last MCU, see `unstrip`.
+        """
+
+        count, height, width, _ = mcus.shape
+        columns = min(count, columns)
+        rows = -(-count // columns)
+        mcus = np.concatenate([mcus, np.repeat(mcus[-1:], rows * columns - count, axis=0)])
+
+        return mcus.reshape(rows, columns, height, width, 3).swapaxes(1, 2).reshape(rows * height, columns * width, 3)
+
+    @staticmethod
+    def unstrip(image: np.ndarray, mcu: tuple[int, int], count: int) -> np.ndarray:
+        """The first `count` MCUs of an image laid out by `strip`."""
+
+        height, width = mcu
+        rows, columns = image.shape[0] // height, image.shape[1] // width
+
+        return image.reshape(rows, height, columns, width, 3).swapaxes(1, 2).reshape(-1, height, width, 3)[:count]
+
+    def _compress_image(self, image: np.ndarray, jpeg: bool) -> tuple[np.ndarray, bytes, int]:
+        """Compress a frame or a strip, returning its reconstruction, its JFIF file with `jpeg` and the compressions."""
+
+        if not jpeg:
+            compressed_image, _, self.q_factor, iterations = compress_frame(
+                image, self.target_mse, self.q_factor, self.subsampling
+            )
+            return compressed_image, b"", iterations
+
+        with stage("compress_frame", image.nbytes):
+            if self.target_mse is None:
+                data, compressed_image = ImageCompression.encode_jpeg(image, self.q_factor, self.subsampling)
+                return compressed_image, data, 1
+
+            data, compressed_image, self.q_factor, _, iterations = ImageCompression.search_q_factor_jpeg(
+                image, self.target_mse, q_factor=self.q_factor, subsampling=self.subsampling
+            )
+            return compressed_image, data, iterations
+
+    def _replenish(self, frame: np.ndarray, jpeg: bool) -> tuple[np.ndarray, bytes, float, int, int]:
+        """Compress the next frame of the sequence, see `compress` and `encode`."""
+
+        rows, cols = self.shape
+        padded_rows, padded_cols, _ = self.reference.shape
+        padded = np.pad(frame, ((0, padded_rows - rows), (0, padded_cols - cols), (0, 0)), mode="edge")
+
+        keyframe = self.frame_index % self.keyframe_interval == 0
+        self.frame_index += 1
+
+        if keyframe:
+            # a JFIF file pads the frame to whole MCUs itself, and its keyframes must be the frame's size
+            compressed_image, data, iterations = self._compress_image(frame if jpeg else padded, jpeg)
+            self.reconstruction[: compressed_image.shape[0], : compressed_image.shape[1]] = compressed_image
+            self.reference[:] = padded
+            coded = self.grid[0] * self.grid[1]
+        else:
+            mask = self.changed(padded)
+            coded = int(mask.sum())
+            data, iterations = b"", 0
+
+            if coded:
+                # the changed MCUs laid out side by side form an image of whole blocks and chroma boxes,
+                # which compresses exactly like the same MCUs of the whole frame
+                changed = self.mcus(padded)[mask]
+                compressed_image, data, iterations = self._compress_image(
+                    ConditionalReplenishment.strip(changed, self.grid[1]), jpeg
+                )
+
+                self.mcus(self.reconstruction)[mask] = ConditionalReplenishment.unstrip(
+                    compressed_image, self.mcu, coded
+                )
+                self.mcus(self.reference)[mask] = changed
+
+                if jpeg:
+                    # the strip is coded with the standard Huffman tables, which decoders of MJPEG frames assume
+                    skip = struct.pack(">BBHH", *self.mcu, *self.grid) + np.packbits(mask).tobytes()
+                    data = JFIF.remove_segments(data, JFIF.DHT)
+                    data = JFIF.insert_segment(data, JFIF.APP15, ConditionalReplenishment.SKIP_IDENTIFIER + skip)
+
+        compressed_frame = self.reconstruction[:rows, :cols].copy()
+
+        return compressed_frame, data, mean_squared_error(frame, compressed_frame), iterations, coded
+
+    def compress(self, frame: np.ndarray) -> tuple[np.ndarray, float, int, int]:
+        """Compress the next frame of the sequence.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The RGB frame of shape (height, width, 3).
+
+        Returns
+        -------
+        tuple
+            A tuple `(compressed_frame, mse, iterations, coded)` with the reconstructed frame, its MSE to
+            `frame`, the number of compressions spent in the q_factor search and the number of MCUs coded.
+        """
+
+        compressed_frame, _, mse, iterations, coded = self._replenish(frame, jpeg=False)
+
+        return compressed_frame, mse, iterations, coded
+
+    def encode(self, frame: np.ndarray) -> tuple[bytes, float, int, int]:
+        """JPEG version of `compress`, which stores the next frame of the sequence as a JFIF file.
+
+        Returns
+        -------
+        tuple
+            A tuple `(data, mse, iterations, coded)` with the content of the frame's file, empty if no MCU
+            changed, the MSE of the frame `decode` rebuilds from it, the number of compressions and the
+            number of MCUs coded.
+        """
+
+        _, data, mse, iterations, coded = self._replenish(frame, jpeg=True)
+
+        return data, mse, iterations, coded
+
+    @staticmethod
+    def is_keyframe(data: bytes) -> bool:
+        """Whether a file written by `encode` decodes on its own, without the frames before it."""
+
+        return bool(data) and JFIF.find_segment(data, JFIF.APP15, ConditionalReplenishment.SKIP_IDENTIFIER) is None
+
+    @staticmethod
+    def decode(frames: Iterable[bytes], shape: tuple[int, int]) -> Iterator[np.ndarray]:
+        """Rebuild the RGB frames of a sequence from the files written by `encode`.
+
+        Parameters
+        ----------
+        frames : Iterable[bytes]
+            The files of consecutive frames, starting with a keyframe.
+        shape : tuple[int, int]
+            The (height, width) of the frames.
+
+        Yields
+        ------
+        np.ndarray
+            Every decoded frame, the same as the reconstruction of `encode`.
+
+        Raises
+        ------
+        ValueError
+            If the first frame is not a keyframe.
+        """
+
+        rows, cols = shape
+        reconstruction, padded = None, None
+
+        for data in frames:
+            skip = JFIF.find_segment(data, JFIF.APP15, ConditionalReplenishment.SKIP_IDENTIFIER) if data else None
+            keyframe = bool(data) and skip is None
+            if reconstruction is None and not keyframe:
+                raise ValueError("The first frame of a sequence must be a keyframe.")
+
+            if keyframe:
+                reconstruction, padded = ImageCompression.decompress_jpeg(data), None
+            elif data:
+                mcu_rows, mcu_cols, grid_rows, grid_cols = struct.unpack(">BBHH", skip[:6])
+                mask = np.unpackbits(np.frombuffer(skip[6:], dtype=np.uint8), count=grid_rows * grid_cols)
+                mask = mask.reshape(grid_rows, grid_cols).astype(bool)
+
+                # the decoded keyframe is padded to whole MCUs once, the following frames are replenished in place
+                if padded is None:
+                    padding = ((0, grid_rows * mcu_rows - rows), (0, grid_cols * mcu_cols - cols), (0, 0))
+                    padded = reconstruction = np.pad(reconstruction, padding, mode="edge")
+
+                mcus = padded.reshape(grid_rows, mcu_rows, grid_cols, mcu_cols, 3).swapaxes(1, 2)
+                mcus[mask] = ConditionalReplenishment.unstrip(
+                    ImageCompression.decompress_jpeg(data), (mcu_rows, mcu_cols), int(mask.sum())
+                )
+
+            yield reconstruction[:rows, :cols].copy()
 
 
 class VideoCompression:
     """A class to handle video compression by compressing each frame using the
     ImageCompression utility and saving the compressed video.
 
+    The video is processed as a pipeline of three stages (read, compress, write) running
+    concurrently and connected by bounded queues, so only a few frames are held in memory
+    at any time, no matter how long the video is.
+
     Parameters
     ----------
     name : str
         The name of the video file to be compressed, from the `input` directory.
+    workers : int, optional
+        The number of processes compressing frames in parallel. The default is 1, which compresses
+        the frames in a background thread of the current process.
+    q_factor : float, optional
+        The quality factor of every frame. In target MSE mode, the starting point of the search. The default is 1.
+    target_mse : float, optional
+        If set, every frame is compressed to this MSE (constant quality), instead of using a fixed `q_factor`.
+        The search for each frame starts from the q_factor found for the previous one.
+    subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+        The chroma subsampling mode of every frame, see `ImageCompression.compress_rgb`. The default is "4:4:4".
+    temporal : bool, optional
+        If True, only the MCUs that changed since they were last coded are compressed, with a full keyframe
+        every `keyframe_interval` frames, see `ConditionalReplenishment`. With `jpeg`, only these MCUs are
+        stored, see `decode_mjpeg`. The default is False.
+    keyframe_interval : int, optional
+        The number of frames between two keyframes in temporal mode.
+    change_threshold : float, optional
+        The mean absolute pixel difference above which an MCU is re-coded in temporal mode.
+    jpeg : bool, optional
+        If True, every frame is encoded into a JFIF file and the files are stored as they are in a Motion-JPEG
+        AVI file, see `MJPEGWriter`. The default is False, which decodes the frames and re-encodes them with
+        the `mp4v` codec.
 
     Attributes
     ----------
-    video : numpy.ndarray
-        A 4D numpy array representing the video frames with shape (frames, height, width, channels).
+    QUEUE_SIZE : int
+        The maximum number of frames buffered between two consecutive stages of the pipeline.
+    FRAMES_PER_WORKER : int
+        The number of frames in flight per worker process in parallel mode.
+    name : str
+        The name of the video file to be compressed.
+    workers : int
+        The number of processes compressing frames.
+    q_factor : float
+        The quality factor of the frames. In target MSE mode, the one found for the last compressed frame.
+    target_mse : float | None
+        The target MSE of every frame, or None to compress with a fixed `q_factor`.
+    subsampling : Literal["4:4:4", "4:2:2", "4:2:0"]
+        The chroma subsampling mode of every frame.
     fps : float
         The frames per second of the input video.
+    frames : int
+        The number of frames reported by the input video container.
+    height : int
+        The height of the video frames.
+    width : int
+        The width of the video frames.
     output_path : str
         The file path for saving the compressed video.
+    average_mse : float
+        Running average of the per-frame mean squared error of the last compression.
+    compressed_frames : int
+        The number of frames processed by the last compression.
+    throughput : float
+        The number of frames per second processed by the last compression.
+    search_iterations : int
+        The number of frame compressions performed by the last compression, including the ones spent
+        searching the q_factor in target MSE mode.
+    temporal : bool
+        Whether only the changed MCUs of every frame are compressed.
+    jpeg : bool
+        Whether the frames are stored as JFIF files in a Motion-JPEG AVI file.
+    output_bytes : int
+        The size of the output video written by the last compression.
+    coded_blocks : int
+        The number of MCUs compressed by the last compression.
+    total_blocks : int
+        The number of MCUs of all the frames of the last compression, coded or not.
     """
 
-    def __init__(self, name: str):
-        """Initializes the VideoCompression class by loading the video, extracting
-        its frames per second (fps), and setting up the output path for the compressed video.
+    QUEUE_SIZE: int = 4
+    FRAMES_PER_WORKER: int = 2
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = 1,
+        q_factor: float = 1.0,
+        target_mse: float | None = None,
+        subsampling: Subsampling = "4:4:4",
+        temporal: bool = False,
+        keyframe_interval: int | None = None,
+        change_threshold: float | None = None,
+        jpeg: bool = False,
+    ):
+        """Initializes the VideoCompression class by reading the properties of the video,
+        such as its frames per second (fps) and frame size, and setting up the output path for the compressed video.
+        No frames are decoded until `compress` is called.
 
         Parameters
         ----------
         name : str
             The name of the video file to be compressed that is located in the `input` directory.
+        workers : int, optional
+            The number of processes compressing frames in parallel. The default is 1.
+        q_factor : float, optional
+            The quality factor of every frame, or the starting point of the search in target MSE mode.
+        target_mse : float, optional
+            If set, every frame is compressed to this MSE instead of using a fixed `q_factor`.
+        subsampling : Literal["4:4:4", "4:2:2", "4:2:0"], optional
+            The chroma subsampling mode of every frame. The default is "4:4:4".
+        temporal : bool, optional
+            If True, only the MCUs that changed since they were last coded are compressed. The default is False.
+        keyframe_interval : int, optional
+            The number of frames between two keyframes in temporal mode.
+            The default is `ConditionalReplenishment.KEYFRAME_INTERVAL`.
+        change_threshold : float, optional
+            The mean absolute pixel difference above which an MCU is re-coded in temporal mode.
+            The default is `ConditionalReplenishment.CHANGE_THRESHOLD`.
+        jpeg : bool, optional
+            If True, the frames are stored as JFIF files in a Motion-JPEG AVI file, with the `.avi` extension.
+            The default is False.
+
+        Raises
+        ------
+        ValueError
+            If `workers` is smaller than 1, or larger than 1 in temporal mode, where every frame
+            depends on the previous one.
         """
 
-        video, fps = load_video(name)
+        if workers < 1:
+            raise ValueError(f"The number of workers must be at least 1, got {workers}.")
+        if temporal and workers > 1:
+            raise ValueError("Temporal mode compresses every frame against the previous one and needs 1 worker.")
+
+        fps, frames, height, width = video_properties(name)
 
-        self.video: np.ndarray = video
+        self.name: str = name
+        self.workers: int = workers
+        self.q_factor: float = q_factor
+        self.target_mse: float | None = target_mse
+        self.subsampling: Subsampling = subsampling
         self.fps: float = fps
+        self.frames: int = frames
+        self.height: int = height
+        self.width: int = width
+
+        root, extension = os.path.splitext(name)
+        self.output_path: str = os.path.join(BASE_OUTPUT_DIR, f"{root}_compressed{'.avi' if jpeg else extension}")
+
+        self.average_mse: float = 0.0
+        self.compressed_frames: int = 0
+        self.throughput: float = 0.0
+        self.search_iterations: int = 0
+        self.output_bytes: int = 0
+
+        self.jpeg: bool = jpeg
+        self.temporal: bool = temporal
+        self.keyframe_interval: int | None = keyframe_interval
+        self.change_threshold: float | None = change_threshold
+        self.coded_blocks: int = 0
+        self.total_blocks: int = 0
+
+    def read(self) -> Iterator[np.ndarray]:
+        """First stage of the pipeline, lazily reads the RGB frames of the input video."""
+
+        return video_frames(self.name)
+
+    def compress_frames(self, frames: Iterable[np.ndarray]) -> Iterator[tuple[np.ndarray | bytes, float]]:
+        """Second stage of the pipeline, compresses every frame using `compress_frame`,
+        or `encode_frame` when the frames are stored as JFIF files.
+
+        In target MSE mode, the q_factor found for each frame is the starting point of the next search.
+        In temporal mode, the frames are compressed by a `ConditionalReplenishment` of the whole video.
+
+        Parameters
+        ----------
+        frames : Iterable[np.ndarray]
+            The RGB frames to compress.
+
+        Yields
+        ------
+        tuple[np.ndarray | bytes, float]
+            The compressed frame, or the content of its JFIF file, and its mean squared error (MSE)
+            to the original frame.
+        """
+
+        if self.temporal:
+            yield from self.compress_frames_temporal(frames)
+            return
+
+        compress = encode_frame if self.jpeg else compress_frame
+        for frame in frames:
+            compressed_frame, mse, self.q_factor, iterations = compress(
+                frame, self.target_mse, self.q_factor, self.subsampling
+            )
+            self.search_iterations += iterations
+
+            yield compressed_frame, mse
+
+    def compress_frames_temporal(self, frames: Iterable[np.ndarray]) -> Iterator[tuple[np.ndarray | bytes, float]]:
+        """Temporal version of `compress_frames`, which only compresses the MCUs that changed.
+
+        Parameters
+        ----------
+        frames : Iterable[np.ndarray]
+            The RGB frames to compress.
+
+        Yields
+        ------
+        tuple[np.ndarray | bytes, float]
+            The compressed frame and its mean squared error (MSE) to the original frame. When the frames are
+            stored as JFIF files, the content of the file of `ConditionalReplenishment.encode` instead.
+        """
+
+        sequence = ConditionalReplenishment(
+            (self.height, self.width),
+            keyframe_interval=self.keyframe_interval,
+            change_threshold=self.change_threshold,
+            q_factor=self.q_factor,
+            target_mse=self.target_mse,
+            subsampling=self.subsampling,
+        )
+        blocks = sequence.grid[0] * sequence.grid[1]
+        compress = sequence.encode if self.jpeg else sequence.compress
+
+        for frame in frames:
+            compressed_frame, mse, iterations, coded = compress(frame)
+            self.q_factor = sequence.q_factor
+            self.search_iterations += iterations
+            self.coded_blocks += coded
+            self.total_blocks += blocks
 
-        name_compressed = f"{name.split('.')[0]}_compressed.{name.split('.')[1]}"
-        self.output_path: str = os.path.join(BASE_OUTPUT_DIR, name_compressed)
+            yield compressed_frame, mse
+
+    def compress_frames_parallel(self, frames: Iterable[np.ndarray]) -> Iterator[tuple[np.ndarray | bytes, float]]:
+        """Parallel version of `compress_frames`, which spreads the frames over a pool of `workers` processes.
+
+        Frames are copied into a ring of slots in shared memory, so that only slot indices are sent to
+        the workers, and every worker writes its result into the matching slot of an output ring.
+        Results are yielded in the original frame order. At most `FRAMES_PER_WORKER * workers` frames are
+        in flight: once the ring is full, no new frame is read before the oldest one has been consumed.
+
+        Parameters
+        ----------
+        frames : Iterable[np.ndarray]
+            The RGB frames to compress.
+
+        Yields
+        ------
+        tuple[np.ndarray | bytes, float]
+            The compressed frame and its mean squared error (MSE) to the original frame.
+            The frame is a view into the output ring, it is only valid until the next item is requested.
+            When the frames are stored as JFIF files, the content of the file is yielded instead.
+        """
+
+        slots = VideoCompression.FRAMES_PER_WORKER * self.workers
+        shape = (slots, self.height, self.width, 3)
+        size = int(np.prod(shape))
+
+        frames_memory = SharedMemory(create=True, size=size)
+        compressed_memory = SharedMemory(create=True, size=size)
+
+        try:
+            ring = np.ndarray(shape, dtype=np.uint8, buffer=frames_memory.buf)
+            compressed_ring = np.ndarray(shape, dtype=np.uint8, buffer=compressed_memory.buf)
+
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(
+                    frames_memory.name,
+                    compressed_memory.name,
+                    shape,
+                    self.target_mse,
+                    self.q_factor,
+                    self.subsampling,
+                    compute_dtype().name,
+                    transform_backend(),
+                    None if active_profile() is None else active_profile().memory,
+                    self.jpeg,
+                ),
+            ) as pool:
+                pending: deque[tuple[int, Future]] = deque()
+
+                for index, frame in enumerate(frames):
+                    if len(pending) == slots:
+                        slot, future = pending.popleft()
+                        mse, iterations, stages, data = future.result()
+                        self.search_iterations += iterations
+                        if stages is not None:
+                            active_profile().merge(stages)
+                        yield compressed_ring[slot] if data is None else data, mse
+
+                    slot = index % slots
+                    ring[slot] = frame
+                    pending.append((slot, pool.submit(_compress_slot, slot)))
+
+                while pending:
+                    slot, future = pending.popleft()
+                    mse, iterations, stages, data = future.result()
+                    self.search_iterations += iterations
+                    if stages is not None:
+                        active_profile().merge(stages)
+                    yield compressed_ring[slot] if data is None else data, mse
+
+            # the arrays must not outlive the buffers they point into
+            del ring, compressed_ring
+        finally:
+            frames_memory.close()
+            frames_memory.unlink()
+            compressed_memory.close()
+            compressed_memory.unlink()
+
+    def write(self, compressed_frames: Iterable[tuple[np.ndarray | bytes, float]]) -> None:
+        """Last stage of the pipeline, writes the compressed frames to the output video
+        and keeps the running average of their MSE.
+
+        Parameters
+        ----------
+        compressed_frames : Iterable[tuple[np.ndarray | bytes, float]]
+            The compressed RGB frames and their MSE, as produced by `compress_frames`.
+            When the frames are stored as JFIF files, the content of the files, see `write_mjpeg`.
+        """
+
+        if self.jpeg:
+            self.write_mjpeg(compressed_frames)
+            return
+
+        # video codec for mp4 file
+        fourcc = cv.VideoWriter_fourcc(*"mp4v")
+        out_video = cv.VideoWriter(self.output_path, fourcc, self.fps, (self.width, self.height))
+
+        try:
+            for index, (compressed_frame, mse) in enumerate(compressed_frames):
+                with stage("write", compressed_frame.nbytes):
+                    compressed_frame_bgr = cv.cvtColor(compressed_frame, cv.COLOR_RGB2BGR)
+                    out_video.write(compressed_frame_bgr)
+
+                self.compressed_frames += 1
+                self.average_mse += (mse - self.average_mse) / self.compressed_frames
+
+                logger.info(f" Current frame: {index:4}/{self.frames:4}")
+        finally:
+            out_video.release()
+
+    def write_mjpeg(self, compressed_frames: Iterable[tuple[bytes, float]]) -> None:
+        """JPEG version of `write`, which stores the JFIF files of the frames in a Motion-JPEG AVI file
+        as they are, without decoding them or compressing them a second time. In temporal mode, only
+        the keyframes of `ConditionalReplenishment` are marked as keyframes in the index.
+
+        Parameters
+        ----------
+        compressed_frames : Iterable[tuple[bytes, float]]
+            The content of the JFIF file of every frame and its MSE, as produced by `compress_frames`.
+        """
+
+        with MJPEGWriter(self.output_path, self.fps, self.width, self.height) as writer:
+            for index, (data, mse) in enumerate(compressed_frames):
+                with stage("write", len(data)):
+                    writer.write(data, keyframe=not self.temporal or ConditionalReplenishment.is_keyframe(data))
+
+                self.compressed_frames += 1
+                self.average_mse += (mse - self.average_mse) / self.compressed_frames
+
+                logger.info(f" Current frame: {index:4}/{self.frames:4}")
+
+    @staticmethod
+    def decode_mjpeg(path: str, start: int = 0) -> Iterator[np.ndarray]:
+        """Decode the RGB frames of a Motion-JPEG file written with `jpeg`, in temporal mode or not.
+
+        Decoding starts from the last keyframe at or before `start`, so seeking only decodes the frames
+        since that keyframe, see `ConditionalReplenishment.decode`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the AVI file.
+        start : int, optional
+            The index of the first frame to yield. The default is 0.
+
+        Yields
+        ------
+        np.ndarray
+            The frames from `start` to the end of the video.
+        """
+
+        reader = MJPEGReader(path)
+        keyframe = max((index for index in reader.keyframes if index <= start), default=0)
+
+        files = (reader.read(index) for index in range(keyframe, len(reader)))
+        for index, frame in enumerate(ConditionalReplenishment.decode(files, (reader.height, reader.width))):
+            if index >= start - keyframe:
+                yield frame
 
     def compress(self) -> float:
         """Compresses the video frame by frame using the ImageCompression utility.
@@ -57,26 +852,58 @@ class VideoCompression:
 
         Notes
         -----
-        Each frame is compressed using the `ImageCompression.compress_rgb` method.
-        The video is saved in MP4 format with the codec 'mp4v'.
+        Each frame is compressed using the `ImageCompression.compress_rgb` method, or
+        `ImageCompression.search_q_factor` in target MSE mode.
+        The video is saved in MP4 format with the codec 'mp4v', or with `jpeg` as the JFIF files
+        of the frames in a Motion-JPEG AVI file.
+        The read and compress stages run in background threads, each one at most `QUEUE_SIZE`
+        frames ahead of the next stage. With more than one worker, frames are compressed by
+        a process pool, see `compress_frames_parallel`. In temporal mode, unchanged MCUs are
+        not compressed again, see `compress_frames_temporal`.
         """
 
-        frames, height, width, _ = self.video.shape
+        self.average_mse = 0.0
+        self.compressed_frames = 0
+        self.search_iterations = 0
+        self.output_bytes = 0
+        self.coded_blocks = 0
+        self.total_blocks = 0
 
-        # video codec for mp4 file
-        fourcc = cv.VideoWriter_fourcc(*"mp4v")
-        out_video = cv.VideoWriter(self.output_path, fourcc, self.fps, (width, height))
-        mses: list[float] = []
+        start = time.perf_counter()
+        frames = prefetch(self.read(), maxsize=VideoCompression.QUEUE_SIZE)
 
-        for index, frame in enumerate(self.video):
-            compressed_frame = ImageCompression.compress_rgb(frame)
-            compressed_frame_bgr = cv.cvtColor(compressed_frame, cv.COLOR_RGB2BGR)
-            out_video.write(compressed_frame_bgr)
+        if self.workers > 1:
+            # the output ring slots are reused as soon as the writer asks for the next frame,
+            # so no queue may be placed between the parallel stage and the writer
+            compressed_frames = self.compress_frames_parallel(frames)
+        else:
+            compressed_frames = prefetch(self.compress_frames(frames), maxsize=VideoCompression.QUEUE_SIZE)
 
-            mses.append(mean_squared_error(frame, compressed_frame))
+        self.write(compressed_frames)
 
-            logger.info(f" Current frame: {index:4}/{frames:4}")
+        elapsed = time.perf_counter() - start
+        self.output_bytes = os.path.getsize(self.output_path)
+        self.throughput = self.compressed_frames / elapsed if elapsed > 0 else 0.0
+        megabytes = self.compressed_frames * self.height * self.width * 3 / 1e6
+        logger.info(
+            f" Workers: {self.workers}, Frames: {self.compressed_frames}, Time: {elapsed:.2f}s, "
+            f"Throughput: {self.throughput:.2f} frames/s ({megabytes / elapsed if elapsed > 0 else 0.0:.2f} MB/s)"
+        )
+        if self.compressed_frames:
+            logger.info(
+                f" Output: {self.output_path}, {self.output_bytes / 1e6:.2f} MB, "
+                f"{8 * self.output_bytes / (self.compressed_frames * self.height * self.width):.3f} bits/pixel"
+            )
+        if self.target_mse is not None and self.compressed_frames:
+            logger.info(
+                f" Target MSE: {self.target_mse:.4f}, "
+                f"Compressions per frame: {self.search_iterations / self.compressed_frames:.2f}"
+            )
 
-        out_video.release()
+        if self.temporal and self.total_blocks:
+            logger.info(
+                f" Temporal: coded {self.coded_blocks}/{self.total_blocks} MCUs "
+                f"({self.coded_blocks / self.total_blocks:.1%})"
+            )
 
-        return np.mean(mses)
+        return self.average_mse
@@ -1,5 +1,7 @@
 import argparse
 import logging
+import os
+import time
 from argparse import ArgumentParser
 from typing import Optional
 
@@ -8,17 +10,22 @@ import scipy
 from skimage.metrics import mean_squared_error
 
 from compression.video_compression import VideoCompression
+from jpegzip.compression.batch_compression import BatchCompression
 from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.transforms import TRANSFORMS, set_transform_backend
+from jpegzip.utils.image import CHROMA_SUBSAMPLING, Subsampling
 from jpegzip.utils.plots import plot_compression
-from utils.file_system import load_image, save_image
+from jpegzip.utils.precision import SUPPORTED_DTYPES, set_compute_dtype
+from jpegzip.utils.profiling import profile
+from utils.file_system import BASE_OUTPUT_DIR, load_image, load_image_memmap, save_bytes, save_image
 
 logger = logging.getLogger(__name__)
 
 
-def compress(image: Optional[np.ndarray] = None) -> np.ndarray:
+def compress(image: Optional[np.ndarray] = None, subsampling: Subsampling = "4:4:4") -> np.ndarray:
     if image is None:
         image = scipy.datasets.face()
-    compressed_image = ImageCompression.compress_rgb(image)
+    compressed_image = ImageCompression.compress_rgb(image, subsampling=subsampling)
 
     plot_compression("RGB Image Compression", image, compressed_image)
 
@@ -28,13 +35,78 @@ def compress(image: Optional[np.ndarray] = None) -> np.ndarray:
     return compressed_image
 
 
-def compress_to_target_mse(target_mse: float | None = None, image: Optional[np.ndarray] = None) -> np.ndarray:
+def compress_jpeg(
+    image: Optional[np.ndarray] = None,
+    subsampling: Subsampling = "4:4:4",
+    progressive: bool = False,
+    restart_interval: int = 0,
+    workers: int = 1,
+    optimize: bool = False,
+) -> tuple[np.ndarray, bytes]:
+    if image is None:
+        image = scipy.datasets.face()
+    data = ImageCompression.compress_jpeg(
+        image,
+        subsampling=subsampling,
+        progressive=progressive,
+        restart_interval=restart_interval,
+        workers=workers,
+        optimize=optimize,
+    )
+    compressed_image = ImageCompression.decompress_jpeg(data, workers=workers)
+
+    plot_compression("JPEG File Compression", image, compressed_image)
+
+    mse = mean_squared_error(image, compressed_image)
+    logger.info(
+        f" Mean Squared Error: {mse:.4f}, Size: {len(data)} bytes ({8 * len(data) / (image.shape[0] * image.shape[1]):.4f} bpp)"
+    )
+
+    return compressed_image, data
+
+
+def compress_to_size(
+    max_bytes: int, image: Optional[np.ndarray] = None, subsampling: Subsampling = "4:4:4"
+) -> tuple[np.ndarray, bytes]:
+    if image is None:
+        image = scipy.datasets.face()
+    data, q_factor, mse = ImageCompression.compress_to_size(image, max_bytes, subsampling=subsampling)
+    compressed_image = ImageCompression.decompress_jpeg(data)
+
+    plot_compression("Target Size Compression", image, compressed_image)
+
+    logger.info(
+        f" Budget: {max_bytes} bytes, Size: {len(data)} bytes ({8 * len(data) / (image.shape[0] * image.shape[1]):.4f} bpp), Q Factor: {q_factor:.4f}, Mean Squared Error: {mse:.4f}"
+    )
+
+    return compressed_image, data
+
+
+def compress_ladder(
+    q_factors: list[float], image: Optional[np.ndarray] = None, subsampling: Subsampling = "4:4:4"
+) -> list[bytes]:
+    if image is None:
+        image = scipy.datasets.face()
+    renditions = ImageCompression.compress_ladder(image, q_factors, subsampling=subsampling, decode=True)
+
+    for q_factor, (data, compressed_image) in zip(q_factors, renditions):
+        mse = mean_squared_error(image, compressed_image)
+        logger.info(
+            f" Q Factor: {q_factor:.4f}, Size: {len(data)} bytes ({8 * len(data) / (image.shape[0] * image.shape[1]):.4f} bpp), Mean Squared Error: {mse:.4f}"
+        )
+
+    return [data for data, _ in renditions]
+
+
+def compress_to_target_mse(
+    target_mse: float | None = None, image: Optional[np.ndarray] = None, subsampling: Subsampling = "4:4:4"
+) -> np.ndarray:
     if target_mse is None:
         raise ValueError("Target MSE must be specified and cannot be None. Please provide a valid value.")
 
     if image is None:
         image = scipy.datasets.face()
-    compressed_image = ImageCompression.compress_to_mse(image, target_mse=target_mse)
+    compressed_image = ImageCompression.compress_to_mse(image, target_mse=target_mse, subsampling=subsampling)
 
     plot_compression("Target MSE Compression", image, compressed_image)
 
@@ -44,8 +116,68 @@ def compress_to_target_mse(target_mse: float | None = None, image: Optional[np.n
     return compressed_image
 
 
-def compress_video() -> None:
-    compressor = VideoCompression("sample_video.mp4")
+def compress_tiled(
+    name: str, shape: tuple[int, ...] | None = None, tile_rows: int | None = None, subsampling: Subsampling = "4:4:4"
+) -> None:
+    image = load_image_memmap(name, shape)
+    path = os.path.join(BASE_OUTPUT_DIR, f"{os.path.splitext(name)[0]}_compressed.jpg")
+
+    start = time.perf_counter()
+    with open(path, "wb") as file:
+        size = ImageCompression.compress_jpeg_tiled(image, file, tile_rows=tile_rows, subsampling=subsampling)
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        f" Shape: {image.shape}, Size: {size} bytes ({8 * size / (image.shape[0] * image.shape[1]):.4f} bpp), "
+        f"Time: {elapsed:.2f}s ({image.size / elapsed / 1e6:.2f} MB/s)"
+    )
+
+
+def compress_batch(
+    pattern: str,
+    output_dir: str,
+    workers: int = 1,
+    target_mse: float | None = None,
+    jpeg: bool = False,
+    subsampling: Subsampling = "4:4:4",
+    q_factor: float = 1.0,
+) -> None:
+    paths = BatchCompression.find_images(pattern)
+    if not paths:
+        logger.info(f" No images found for {pattern}.")
+        return
+
+    compressor = BatchCompression(
+        paths,
+        output_dir,
+        workers=workers,
+        q_factor=q_factor,
+        target_mse=target_mse,
+        subsampling=subsampling,
+        jpeg=jpeg,
+    )
+    compressor.compress()
+
+
+def compress_video(
+    workers: int = 1,
+    target_mse: float | None = None,
+    subsampling: Subsampling = "4:4:4",
+    temporal: bool = False,
+    keyframe_interval: int | None = None,
+    change_threshold: float | None = None,
+    jpeg: bool = False,
+) -> None:
+    compressor = VideoCompression(
+        "sample_video.mp4",
+        workers=workers,
+        target_mse=target_mse,
+        subsampling=subsampling,
+        temporal=temporal,
+        keyframe_interval=keyframe_interval,
+        change_threshold=change_threshold,
+        jpeg=jpeg,
+    )
     average_mse = compressor.compress()
 
     logger.info(f" Average MSE: {average_mse:3.4f}")
@@ -53,19 +185,134 @@ def compress_video() -> None:
 
 def add_arguments(parser: ArgumentParser) -> ArgumentParser:
     parser.add_argument("--load", type=str, help="Name of the image to load for compression from folder `input`.")
+    parser.add_argument(
+        "--subsampling",
+        choices=list(CHROMA_SUBSAMPLING),
+        default="4:4:4",
+        help="Chroma subsampling mode of the colour images and videos.",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=[dtype.name for dtype in SUPPORTED_DTYPES],
+        default="float32",
+        help="Floating point type of the intermediate arrays of the codec.",
+    )
+    parser.add_argument(
+        "--transform",
+        choices=list(TRANSFORMS),
+        default="scipy",
+        help="Backend of the 8x8 DCT: the scipy FFT or a precomputed basis multiplied on BLAS.",
+    )
+    parser.add_argument("--profile", action="store_true", help="Print the time spent in every stage of the codec.")
+    parser.add_argument(
+        "--profile-memory", action="store_true", help="Also trace the memory allocated by every stage (slower)."
+    )
+    parser.add_argument(
+        "--profile-json", type=str, default=None, help="Write the stage statistics of `--profile` to this JSON file."
+    )
 
     subparsers = parser.add_subparsers(dest="operation", help="Choose the compression operation.")
 
-    subparsers.add_parser("compress", help="Compress using the basic RGB compression.")
+    compress_parser = subparsers.add_parser("compress", help="Compress using the basic RGB compression.")
+    compress_parser.add_argument(
+        "--jpeg", action="store_true", help="Save the result as a baseline JFIF `.jpg` file instead of a decoded image."
+    )
+    compress_parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="With --jpeg, write a progressive file whose first scan decodes to a preview.",
+    )
+    compress_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="With --jpeg, code the file with Huffman tables fitted to the image, which makes it smaller.",
+    )
+    compress_parser.add_argument(
+        "--restart-interval",
+        type=int,
+        default=0,
+        help="With --jpeg, insert a restart marker every this many MCUs, so the file can be coded in parallel.",
+    )
+    compress_parser.add_argument(
+        "--workers", type=int, default=1, help="Number of processes coding the restart intervals in parallel."
+    )
     compress_to_target_mse_parser = subparsers.add_parser(
         "compress-to-target-mse", help="Compress to a specified target MSE."
     )
     compress_to_target_mse_parser.add_argument(
         "--target-mse", type=float, required=True, help="Target MSE for the compression."
     )
-    subparsers.add_parser(
+    compress_to_size_parser = subparsers.add_parser(
+        "compress-to-size", help="Compress into the best quality `.jpg` file that fits a size budget."
+    )
+    budget = compress_to_size_parser.add_mutually_exclusive_group(required=True)
+    budget.add_argument("--max-bytes", type=int, help="Maximum size of the `.jpg` file in bytes.")
+    budget.add_argument("--bpp", type=float, help="Maximum size of the `.jpg` file in bits per pixel.")
+    compress_ladder_parser = subparsers.add_parser(
+        "compress-ladder", help="Compress into one `.jpg` file per quality factor, sharing the DCT between them."
+    )
+    compress_ladder_parser.add_argument(
+        "--q-factors", type=float, nargs="+", required=True, help="The q_factor of every rendition."
+    )
+    compress_tiled_parser = subparsers.add_parser(
+        "compress-tiled",
+        help="Compress a `.npy` or raw image loaded with `--load` into a `.jpg` file strip by strip, without reading "
+        "it into memory.",
+    )
+    compress_tiled_parser.add_argument(
+        "--shape", type=int, nargs="+", help="Height, width and optionally channels of a raw 8 bit image."
+    )
+    compress_tiled_parser.add_argument(
+        "--tile-rows", type=int, default=None, help="Number of image rows compressed at a time."
+    )
+    compress_batch_parser = subparsers.add_parser(
+        "compress-batch", help="Compress every image of a directory or glob pattern with a pool of processes."
+    )
+    compress_batch_parser.add_argument(
+        "--input", type=str, required=True, help="Directory or glob pattern (e.g. `input/*.png`) of the images."
+    )
+    compress_batch_parser.add_argument(
+        "--output", type=str, required=True, help="Directory the compressed images are written to."
+    )
+    compress_batch_parser.add_argument(
+        "--workers", type=int, default=1, help="Number of processes compressing images in parallel."
+    )
+    compress_batch_parser.add_argument(
+        "--q-factor",
+        type=float,
+        default=1.0,
+        help="Quality factor of every image, or the starting point of the search with --target-mse.",
+    )
+    compress_batch_parser.add_argument(
+        "--target-mse", type=float, default=None, help="Compress every image to this target MSE."
+    )
+    compress_batch_parser.add_argument(
+        "--jpeg", action="store_true", help="Save baseline JFIF `.jpg` files instead of decoded images."
+    )
+    compress_video_parser = subparsers.add_parser(
         "compress-video", help="Compress the `sample_video.mp4` located inside the `input` directory."
     )
+    compress_video_parser.add_argument(
+        "--workers", type=int, default=1, help="Number of processes compressing frames in parallel."
+    )
+    compress_video_parser.add_argument(
+        "--target-mse", type=float, default=None, help="Compress every frame to this target MSE (constant quality)."
+    )
+    compress_video_parser.add_argument(
+        "--temporal", action="store_true", help="Only compress the blocks that changed since they were last compressed."
+    )
+    compress_video_parser.add_argument(
+        "--keyframe-interval", type=int, default=None, help="Frames between two full keyframes in temporal mode."
+    )
+    compress_video_parser.add_argument(
+        "--change-threshold",
+        type=float,
+        default=None,
+        help="Mean absolute pixel difference above which a block is compressed again in temporal mode.",
+    )
+    compress_video_parser.add_argument(
+        "--jpeg", action="store_true", help="Store the JPEG frames in a Motion-JPEG `.avi` file instead of mp4v."
+    )
 
     return parser
 
@@ -75,18 +322,76 @@ def main() -> None:
     parser = add_arguments(parser)
 
     args = parser.parse_args()
+    set_compute_dtype(args.precision)
+    set_transform_backend(args.transform)
+
+    if not (args.profile or args.profile_memory or args.profile_json):
+        run(parser, args)
+        return
+
+    with profile(memory=args.profile_memory) as collected:
+        run(parser, args)
+
+    logger.info(f" Stage profile:\n{collected.report()}")
+    if args.profile_json is not None:
+        with open(args.profile_json, "w") as file:
+            file.write(collected.to_json())
+        logger.info(f" Stage profile written to {args.profile_json}")
+
+
+def run(parser: ArgumentParser, args: argparse.Namespace) -> None:
+    if args.operation == "compress-batch":
+        compress_batch(
+            args.input, args.output, args.workers, args.target_mse, args.jpeg, args.subsampling, args.q_factor
+        )
+        return
+
+    if args.operation == "compress-tiled":
+        if not args.load:
+            parser.error("compress-tiled requires --load.")
+        compress_tiled(args.load, tuple(args.shape) if args.shape else None, args.tile_rows, args.subsampling)
+        return
 
     image = None
     if args.load:
         image = load_image(args.load)
 
     compressed_image = None
-    if args.operation == "compress":
-        compressed_image = compress(image)
+    if args.operation == "compress" and args.jpeg:
+        _, data = compress_jpeg(
+            image, args.subsampling, args.progressive, args.restart_interval, args.workers, args.optimize
+        )
+        image_name = f"{args.load.split('.')[0]}_compressed.jpg" if args.load else "raccoon_compressed.jpg"
+        save_bytes(data, image_name)
+        return
+    elif args.operation == "compress-to-size":
+        if image is None:
+            image = scipy.datasets.face()
+        max_bytes = args.max_bytes if args.bpp is None else int(args.bpp * image.shape[0] * image.shape[1] / 8)
+        _, data = compress_to_size(max_bytes, image, args.subsampling)
+        image_name = f"{args.load.split('.')[0]}_compressed.jpg" if args.load else "raccoon_compressed.jpg"
+        save_bytes(data, image_name)
+        return
+    elif args.operation == "compress-ladder":
+        renditions = compress_ladder(args.q_factors, image, args.subsampling)
+        name = args.load.split(".")[0] if args.load else "raccoon"
+        for q_factor, data in zip(args.q_factors, renditions):
+            save_bytes(data, f"{name}_q{q_factor:g}.jpg")
+        return
+    elif args.operation == "compress":
+        compressed_image = compress(image, args.subsampling)
     elif args.operation == "compress-to-target-mse":
-        compressed_image = compress_to_target_mse(args.target_mse, image)
+        compressed_image = compress_to_target_mse(args.target_mse, image, args.subsampling)
     elif args.operation == "compress-video":
-        compress_video()
+        compress_video(
+            args.workers,
+            args.target_mse,
+            args.subsampling,
+            args.temporal,
+            args.keyframe_interval,
+            args.change_threshold,
+            args.jpeg,
+        )
         return
 
     image_name = None
@@ -1,8 +1,10 @@
 import logging
 import os
+from typing import Iterator
 
 import cv2 as cv
 import numpy as np
+from jpegzip.utils.profiling import stage
 
 logger = logging.getLogger(__name__)
 BASE_INPUT_DIR = os.path.join(os.getcwd(), "input")
@@ -68,22 +70,117 @@ def save_image(image: np.ndarray, name: str) -> None:
         raise
 
 
-def load_video(name: str) -> tuple[np.ndarray, float]:
-    """Load a video file, extract all frames in RGB format, and return them along with the video FPS.
+def save_bytes(data: bytes, name: str) -> None:
+    """Save an encoded file (e.g. a .jpg produced by `ImageCompression.compress_jpeg`) to the `output` directory.
 
     Parameters
     ----------
+    data : bytes
+        The content of the file.
+
     name : str
-        The name of the video file to load. The path will be constructed using the `BASE_INPUT_DIR` directory.
+        The name of the file. It will be saved in the 'output' directory,
+        relative to the current working directory.
+
+    Raises
+    ------
+    Exception
+        If the file cannot be saved, an error is logged, and the exception is raised.
+    """
+
+    path = os.path.join(BASE_OUTPUT_DIR, name)
+
+    try:
+        with open(path, "wb") as file:
+            file.write(data)
+    except Exception as e:
+        logger.error(f"Error writing file with path {path}: {e}")
+        raise
+
+
+def load_bytes(name: str) -> bytes:
+    """Load the raw content of an encoded file from the `input` directory.
+
+    Parameters
+    ----------
+    name : str
+        The name of the file to load. The file should be located
+        in the 'input' directory, relative to the current working directory.
 
     Returns
     -------
-    tuple
-        A tuple containing:
-        - `frames_array` : numpy.ndarray
-            A 4D NumPy array of shape `(num_frames, height, width, 3)` where each frame is an RGB image.
-        - `fps` : float
-            The frames per second (FPS) of the video.
+    bytes
+        The content of the file.
+
+    Raises
+    ------
+    Exception
+        If the file cannot be loaded, an error is logged, and the exception is raised.
+    """
+
+    path = os.path.join(BASE_INPUT_DIR, name)
+
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except Exception as e:
+        logger.error(f"Error loading file with path {path}: {e}")
+        raise
+
+
+def load_image_memmap(name: str, shape: tuple[int, ...] | None = None) -> np.ndarray:
+    """Map an uncompressed image from the `input` directory into memory without reading it.
+
+    Pixels are only read from disk when they are accessed, so slicing a strip of rows out of the
+    returned array costs as much memory as the strip, no matter how large the image is.
+
+    Parameters
+    ----------
+    name : str
+        The name of the image file. A `.npy` file carries its own shape, any other file is read
+        as raw 8 bit pixels in row-major order.
+    shape : tuple[int, ...], optional
+        The (height, width) or (height, width, 3) shape of a raw image. Ignored for `.npy` files.
+
+    Returns
+    -------
+    np.ndarray
+        A read-only memory-mapped array of shape (H, W) or (H, W, 3), in RGB format.
+
+    Raises
+    ------
+    ValueError
+        If the shape of a raw image is not given.
+    Exception
+        If the image cannot be mapped, an error is logged, and the exception is raised.
+    """
+
+    path = os.path.join(BASE_INPUT_DIR, name)
+
+    if not name.endswith(".npy") and shape is None:
+        raise ValueError(f"The shape of the raw image {name} must be specified.")
+
+    try:
+        if name.endswith(".npy"):
+            return np.load(path, mmap_mode="r")
+        return np.memmap(path, dtype=np.uint8, mode="r", shape=shape)
+    except Exception as e:
+        logger.error(f"Error mapping image with path {path}: {e}")
+        raise
+
+
+def open_video(name: str) -> cv.VideoCapture:
+    """Open a video file from the `input` directory.
+
+    Parameters
+    ----------
+    name : str
+        The name of the video file to open. The path will be constructed using the `BASE_INPUT_DIR` directory.
+
+    Returns
+    -------
+    cv.VideoCapture
+        The opened video capture.
 
     Raises
     ------
@@ -93,23 +190,100 @@ def load_video(name: str) -> tuple[np.ndarray, float]:
 
     path = os.path.join(BASE_INPUT_DIR, name)
     video = cv.VideoCapture(path)
-    fps = video.get(cv.CAP_PROP_FPS)
 
     if not video.isOpened():
         logger.error(f"Error loading video with path: {path}")
         exit()
 
-    frames = []
-    while True:
-        ret, frame = video.read()
+    return video
+
+
+def video_properties(name: str) -> tuple[float, int, int, int]:
+    """Read the properties of a video file without decoding its frames.
+
+    Parameters
+    ----------
+    name : str
+        The name of the video file. The path will be constructed using the `BASE_INPUT_DIR` directory.
+
+    Returns
+    -------
+    tuple
+        A tuple `(fps, frames, height, width)`. The frame count is the one stored in the
+        container and may be approximate for some formats.
+    """
 
-        if not ret:
-            break
+    video = open_video(name)
 
-        rgb_frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
-        frames.append(rgb_frame)
+    fps = video.get(cv.CAP_PROP_FPS)
+    frames = int(video.get(cv.CAP_PROP_FRAME_COUNT))
+    height = int(video.get(cv.CAP_PROP_FRAME_HEIGHT))
+    width = int(video.get(cv.CAP_PROP_FRAME_WIDTH))
 
     video.release()
 
-    frames_array = np.array(frames)
+    return fps, frames, height, width
+
+
+def video_frames(name: str) -> Iterator[np.ndarray]:
+    """Lazily read the frames of a video file in RGB format, one at a time.
+
+    Only the current frame is kept in memory, which makes this suitable for videos of any length.
+
+    Parameters
+    ----------
+    name : str
+        The name of the video file to load. The path will be constructed using the `BASE_INPUT_DIR` directory.
+
+    Yields
+    ------
+    np.ndarray
+        The next frame as an RGB image of shape `(height, width, 3)`.
+    """
+
+    video = open_video(name)
+
+    try:
+        while True:
+            with stage("read"):
+                ret, frame = video.read()
+                if ret:
+                    frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
+
+            if not ret:
+                break
+
+            yield frame
+    finally:
+        video.release()
+
+
+def load_video(name: str) -> tuple[np.ndarray, float]:
+    """Load a video file, extract all frames in RGB format, and return them along with the video FPS.
+
+    The whole video is decoded into memory, use `video_frames` to stream long videos.
+
+    Parameters
+    ----------
+    name : str
+        The name of the video file to load. The path will be constructed using the `BASE_INPUT_DIR` directory.
+
+    Returns
+    -------
+    tuple
+        A tuple containing:
+        - `frames_array` : numpy.ndarray
+            A 4D NumPy array of shape `(num_frames, height, width, 3)` where each frame is an RGB image.
+        - `fps` : float
+            The frames per second (FPS) of the video.
+
+    Raises
+    ------
+    SystemExit
+        If the video cannot be opened, the function will log an error and exit the program.
+    """
+
+    fps, _, _, _ = video_properties(name)
+    frames_array = np.array(list(video_frames(name)))
+
     return frames_array, fps
@@ -1,35 +1,77 @@
+from typing import Literal
+
 import numpy as np
+from jpegzip.utils.precision import compute_dtype
+from jpegzip.utils.profiling import stage
+
+Subsampling = Literal["4:4:4", "4:2:2", "4:2:0"]
+
+# (vertical, horizontal) factors by which the chroma channels are downsampled
+CHROMA_SUBSAMPLING: dict[str, tuple[int, int]] = {
+    "4:4:4": (1, 1),
+    "4:2:2": (1, 2),
+    "4:2:0": (2, 2),
+}
+
+# the JFIF colour conversion, YCbCr = RGB_TO_YCBCR @ RGB + YCBCR_BIAS and RGB = YCBCR_TO_RGB @ (YCbCr - YCBCR_BIAS)
+RGB_TO_YCBCR: np.ndarray = np.array(
+    [
+        [0.299, 0.587, 0.114],
+        [-0.168736, -0.331264, 0.5],
+        [0.5, -0.418688, -0.081312],
+    ]
+)
+YCBCR_TO_RGB: np.ndarray = np.array(
+    [
+        [1, 0, 1.402],
+        [1, -0.344136, -0.714136],
+        [1, 1.772, 0],
+    ]
+)
+YCBCR_BIAS: np.ndarray = np.array([0, 128, 128])
+
+# the number of pixels the colour conversions process at a time, their float buffers then stay in the CPU cache
+COLOUR_CHUNK: int = 1 << 16
 
 
 class ImageBlockProcessor:
     BLOCK_SIZE: int = 8
 
     @staticmethod
-    def pad(image: np.ndarray) -> np.ndarray:
+    def pad(image: np.ndarray, anchor: Literal["center", "top-left"] = "center", mode: str = "constant") -> np.ndarray:
         """Pad the input image to the nearest multiple of BLOCK_SIZE in both dimensions (height and width).
 
         This function adds padding to the input image such that the resulting image
-        has dimensions that are multiples of BLOCK_SIZE. The padding is applied symmetrically
+        has dimensions that are multiples of BLOCK_SIZE. By default the padding is applied symmetrically
         to the top, bottom, left, and right sides of the image.
 
         Parameters
         ----------
         image : np.ndarray
-            A 2D NumPy array representing the input image to be padded.
+            A NumPy array of shape (..., H, W) representing the input image to be padded.
+            Leading axes (channels, frames) are left untouched, only the last two axes are padded.
+
+        anchor : Literal["center", "top-left"], optional
+            Where the image is placed inside the padded one. "top-left" only pads the bottom and
+            right sides, which is the layout JPEG files use. The default is "center".
+
+        mode : str, optional
+            The `np.pad` mode used to fill the padding. The default is "constant".
 
         Returns
         -------
         np.ndarray
-            A 2D NumPy array representing the padded image with dimensions
+            A NumPy array of shape (..., H', W') representing the padded image with dimensions
             that are multiples of BLOCK_SIZE in both height and width.
 
         Notes
         -----
-        - If the input image's dimensions are already multiples of BLOCK_SIZE, no padding will be applied.
-        - The padding is applied using a constant value of 0 (black padding) around the edges.
+        - If the input image's dimensions are already multiples of BLOCK_SIZE, no padding will be applied
+          and the input array itself is returned, without making a copy.
+        - By default the padding is applied using a constant value of 0 (black padding) around the edges.
         """
 
-        rows, cols = image.shape
+        rows, cols = image.shape[-2:]
 
         pad_rows = (
             ImageBlockProcessor.BLOCK_SIZE - (rows % ImageBlockProcessor.BLOCK_SIZE)
@@ -38,12 +80,16 @@ class ImageBlockProcessor:
             ImageBlockProcessor.BLOCK_SIZE - (cols % ImageBlockProcessor.BLOCK_SIZE)
         ) % ImageBlockProcessor.BLOCK_SIZE
 
-        top = pad_rows // 2
+        top = pad_rows // 2 if anchor == "center" else 0
         bottom = pad_rows - top
-        left = pad_cols // 2
+        left = pad_cols // 2 if anchor == "center" else 0
         right = pad_cols - left
 
-        padded_image = np.pad(image, ((top, bottom), (left, right)), mode="constant")
+        if pad_rows == 0 and pad_cols == 0:
+            return image
+
+        pad_width = [(0, 0)] * (image.ndim - 2) + [(top, bottom), (left, right)]
+        padded_image = np.pad(image, pad_width, mode=mode)
 
         return padded_image
 
@@ -54,17 +100,22 @@ class ImageBlockProcessor:
         Parameters
         ----------
         image : np.ndarray
-            The input image as a 2D NumPy array.
+            The input image as a NumPy array of shape (..., H, W).
 
         Raises
         ------
+        RuntimeError
+            If the image has less than 2 dimensions.
         RuntimeError
             If the image is empty (either rows or columns are 0), raises an error indicating the image is empty.
         RuntimeError
             If the shape of the image is not divisible by `BLOCK_SIZE` on both axes, raises an error.
         """
 
-        rows, cols = image.shape
+        if image.ndim < 2:
+            raise RuntimeError(f"Invalid image dimensions: {image.ndim}. Expected at least a 2D image.")
+
+        rows, cols = image.shape[-2:]
 
         if rows == 0 or cols == 0:
             raise RuntimeError(f"Image is empty! Image shape: {image.shape}.")
@@ -76,16 +127,20 @@ class ImageBlockProcessor:
     def blocks(image: np.ndarray) -> np.ndarray:
         """Split an image into non-overlapping BLOCK_SIZE x BLOCK_SIZE blocks.
 
+        The blocks are returned as a strided view into `image`, no pixel data is copied.
+        Writing into the returned array therefore writes into the input image.
+
         Parameters
         ----------
         image : np.ndarray
-           Input image to be split. Should be a 2D array where each element represents a pixel in the image.
-           The shape of the image must be divisible by BLOCK_SIZE in both dimensions.
+           Input image to be split, of shape (..., H, W). Leading axes are treated as a batch
+           (e.g. channels or video frames) and are kept in front of the block axes.
+           The shape of the image must be divisible by BLOCK_SIZE in both H and W.
 
         Returns
         -------
         np.ndarray
-           A 4D array of shape (n, m, BLOCK_SIZE, BLOCK_SIZE),
+           An array of shape (..., n, m, BLOCK_SIZE, BLOCK_SIZE),
            where each element in the matrix is a 2D block of size BLOCK_SIZE x BLOCK_SIZE extracted from the input image.
 
         Notes
@@ -96,114 +151,258 @@ class ImageBlockProcessor:
 
         ImageBlockProcessor.is_image_shape_divisible_block_size(image)
 
-        rows, cols = image.shape
+        *batch, rows, cols = image.shape
 
         # how many BLOCK_SIZE x BLOCK_SIZE non-intersecting blocks can fit in the rows and columns provided
         n_row_split = rows // ImageBlockProcessor.BLOCK_SIZE
         n_col_split = cols // ImageBlockProcessor.BLOCK_SIZE
 
-        # np.split returns a view into the array
-        image_copy = image.copy()
-        # split rows in segments of size BLOCK_SIZE
-        image_sliced = np.split(image_copy, n_row_split, axis=0)
-        # split the resulting rows in columns of size BLOCK_SIZE, thus resulting in an array of shape: (n_row_split, n_col_split, BLOCK_SIZE, BLOCK_SIZE)
-        image_blocks = np.array([np.split(img_slice, n_col_split, axis=1) for img_slice in image_sliced])
+        # splitting an axis in two never requires a copy, so this reshape is always a view:
+        # (..., rows, cols) -> (..., n_row_split, BLOCK_SIZE, n_col_split, BLOCK_SIZE)
+        image_split = image.reshape(
+            *batch, n_row_split, ImageBlockProcessor.BLOCK_SIZE, n_col_split, ImageBlockProcessor.BLOCK_SIZE
+        )
+        # swapping the two middle axes only permutes the strides, resulting in a view of shape:
+        # (..., n_row_split, n_col_split, BLOCK_SIZE, BLOCK_SIZE)
+        image_blocks = image_split.swapaxes(-3, -2)
 
         return image_blocks
 
     @staticmethod
-    def iblocks(blocks: np.ndarray) -> np.ndarray:
+    def iblocks(blocks: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
         """Reconstruct an image from its block decomposition.
 
-        This function takes a 4D array of image blocks and reconstructs the original image by
-        concatenating the blocks. The blocks must be of size (BLOCK_SIZE, BLOCK_SIZE).
+        This function takes an array of image blocks and reconstructs the original image by
+        writing every block at its position in the output image. The blocks must be of size (BLOCK_SIZE, BLOCK_SIZE).
 
         Parameters
         ----------
         blocks : numpy.ndarray
-            A 4D array of shape (n, m, BLOCK_SIZE, BLOCK_SIZE) where each sub-array represents
-            a block of the image.
+            An array of shape (..., n, m, BLOCK_SIZE, BLOCK_SIZE) where each sub-array represents
+            a block of the image. Leading axes are treated as a batch.
+
+        out : numpy.ndarray, optional
+            Preallocated array of shape (..., n * BLOCK_SIZE, m * BLOCK_SIZE) to write the image into.
+            If None, a new array with the same dtype as `blocks` is allocated.
 
         Returns
         -------
         numpy.ndarray
-            The reconstructed image as a 2D numpy array.
+            The reconstructed image as an array of shape (..., n * BLOCK_SIZE, m * BLOCK_SIZE).
+            If `out` was provided, it is returned.
 
         Raises
         ------
         RuntimeError
-            If the input array does not have four dimensions, or if the blocks are not square.
+            If the input array has less than four dimensions, or if the blocks are not square.
+        RuntimeError
+            If `out` does not have the shape of the reconstructed image.
         """
 
-        if blocks.ndim != 4 or blocks.shape[2] != blocks.shape[3]:
+        if blocks.ndim < 4 or blocks.shape[-2] != blocks.shape[-1]:
             raise RuntimeError(
                 f"Input blocks are not of shape (n, m, BLOCK_SIZE, BLOCK_SIZE). As a result the image cannot be reconstructed."
             )
 
-        # reconstruct rows by concatenating blocks along the columns
-        reconstructed_rows = [np.concatenate(row_blocks, axis=1) for row_blocks in blocks]
-        # reconstruct the entire image by concatenating the rows
-        reconstructed_image = np.concatenate(reconstructed_rows, axis=0)
+        *batch, n, m, block_rows, block_cols = blocks.shape
+        shape = (*batch, n * block_rows, m * block_cols)
+
+        if out is None:
+            out = np.empty(shape, dtype=blocks.dtype)
+        elif out.shape != shape:
+            raise RuntimeError(f"Output array has shape {out.shape}, expected {shape}.")
 
-        return reconstructed_image
+        # same view as in `blocks`, assigning through it scatters every block into `out`
+        out.reshape(*batch, n, block_rows, m, block_cols).swapaxes(-3, -2)[...] = blocks
 
+        return out
 
-def rgb_to_ycbcr(image: np.ndarray) -> np.ndarray:
+
+def rgb_to_ycbcr(image: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
     """Convert an RGB image to YCbCr color space.
 
+    The pixels are converted `COLOUR_CHUNK` at a time, on float buffers allocated once and small enough to stay
+    in the CPU cache, and written straight into the uint8 result. Every chunk goes through the same operations
+    as `rgb_to_ycbcr_reference`, so the result is the same, without its four full size float temporaries.
+
     Parameters
     ----------
     image : np.ndarray
         A numpy array of shape (H, W, 3) representing an RGB image.
         Each pixel is a 3-element array with red, green, and blue components.
+    out : np.ndarray, optional
+        A uint8 array of shape (H, W, 3) to write the result to, e.g. the buffer of the previous video frame.
 
     Returns
     -------
     np.ndarray
         A numpy array of shape (H, W, 3) representing the corresponding YCbCr image.
         Each pixel is a 3-element array with Y, Cb, and Cr components.
-    """
-
-    transform_matrix = np.array(
-        [
-            [0.299, 0.587, 0.114],
-            [-0.168736, -0.331264, 0.5],
-            [0.5, -0.418688, -0.081312],
-        ]
-    )
-    bias = np.array([0, 128, 128])
 
-    ycbcr_image = image @ transform_matrix.T + bias
+    Raises
+    ------
+    ValueError
+        If `out` is not a uint8 array of the shape of the image.
+    """
 
-    return np.clip(ycbcr_image, 0, 255).astype(np.uint8)
+    with stage("rgb_to_ycbcr", image.nbytes):
+        return _convert_colours(image, RGB_TO_YCBCR, None, YCBCR_BIAS, out)
 
 
-def ycbcr_to_rgb(image: np.ndarray) -> np.ndarray:
+def ycbcr_to_rgb(image: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
     """Convert a YCbCr image to RGB color space.
 
+    The pixels are converted in chunks, like `rgb_to_ycbcr`, with the same result as `ycbcr_to_rgb_reference`.
+
     Parameters
     ----------
     image : np.ndarray
         A numpy array of shape (H, W, 3) representing a YCbCr image.
         Each pixel is a 3-element array with Y, Cb, and Cr components.
+    out : np.ndarray, optional
+        A uint8 array of shape (H, W, 3) to write the result to.
 
     Returns
     -------
     np.ndarray
         A numpy array of shape (H, W, 3) representing the corresponding RGB image.
         Each pixel is a 3-element array with red, green, and blue components.
+
+    Raises
+    ------
+    ValueError
+        If `out` is not a uint8 array of the shape of the image.
     """
 
-    itransform_matrix = np.array(
-        [
-            [1, 0, 1.402],
-            [1, -0.344136, -0.714136],
-            [1, 1.772, 0],
-        ]
-    )
-    bias = np.array([0, 128, 128])
+    with stage("ycbcr_to_rgb", image.nbytes):
+        return _convert_colours(image, YCBCR_TO_RGB, YCBCR_BIAS, None, out)
+
+
+def _convert_colours(
+    image: np.ndarray,
+    matrix: np.ndarray,
+    bias_in: np.ndarray | None,
+    bias_out: np.ndarray | None,
+    out: np.ndarray | None,
+) -> np.ndarray:
+    """Compute `clip(matrix @ (pixel - bias_in) + bias_out, 0, 255)` for every pixel of an (H, W, 3) image,
+    in the compute dtype and `COLOUR_CHUNK` pixels at a time, and truncate it into a uint8 array."""
+
+    if out is None:
+        out = np.empty(image.shape, dtype=np.uint8)
+    elif out.shape != image.shape or out.dtype != np.uint8:
+        raise ValueError(f"Expected a uint8 output of shape {image.shape}, got {out.dtype} of shape {out.shape}.")
+
+    width = image.shape[1]
+    chunk_rows = max(1, COLOUR_CHUNK // max(width, 1))
+
+    matrix = matrix.T.astype(compute_dtype())
+    bias_in = None if bias_in is None else bias_in.astype(compute_dtype())
+    bias_out = None if bias_out is None else bias_out.astype(compute_dtype())
+    x = np.empty((chunk_rows * width, 3), dtype=compute_dtype())
+    y = np.empty_like(x)
+
+    for start in range(0, image.shape[0], chunk_rows):
+        chunk = image[start : start + chunk_rows]
+        x_chunk, y_chunk = x[: chunk.shape[0] * width], y[: chunk.shape[0] * width]
+
+        x_chunk.reshape(chunk.shape)[...] = chunk
+        if bias_in is not None:
+            np.subtract(x_chunk, bias_in, out=x_chunk)
+
+        np.matmul(x_chunk, matrix, out=y_chunk)
+        if bias_out is not None:
+            np.add(y_chunk, bias_out, out=y_chunk)
+
+        np.clip(y_chunk, 0, 255, out=y_chunk)
+        out[start : start + chunk_rows] = y_chunk.reshape(chunk.shape)
+
+    return out
+
+
+def rgb_to_ycbcr_reference(image: np.ndarray) -> np.ndarray:
+    """The whole-image conversion `rgb_to_ycbcr` is checked and benchmarked against, see `rgb_to_ycbcr`."""
+
+    transform_matrix = RGB_TO_YCBCR.astype(compute_dtype())
+    bias = YCBCR_BIAS.astype(compute_dtype())
+
+    ycbcr_image = image @ transform_matrix.T
+    np.add(ycbcr_image, bias, out=ycbcr_image)
 
-    ycbcr_image = image.astype(np.float32) - bias
+    return np.clip(ycbcr_image, 0, 255).astype(np.uint8)
+
+
+def ycbcr_to_rgb_reference(image: np.ndarray) -> np.ndarray:
+    """The whole-image conversion `ycbcr_to_rgb` is checked and benchmarked against, see `ycbcr_to_rgb`."""
+
+    itransform_matrix = YCBCR_TO_RGB.astype(compute_dtype())
+    bias = YCBCR_BIAS.astype(compute_dtype())
+
+    ycbcr_image = image.astype(compute_dtype()) - bias
     rgb_image = ycbcr_image @ itransform_matrix.T
 
     return np.clip(rgb_image, 0, 255).astype(np.uint8)
+
+
+def downsample(channel: np.ndarray, factors: tuple[int, int]) -> np.ndarray:
+    """Downsample a channel by averaging non-overlapping boxes of pixels.
+
+    Parameters
+    ----------
+    channel : np.ndarray
+        A numpy array of shape (H, W), or (H, W, C) to downsample several channels at once.
+    factors : tuple[int, int]
+        The (vertical, horizontal) size of the boxes, see `CHROMA_SUBSAMPLING`.
+
+    Returns
+    -------
+    np.ndarray
+        An array of shape (ceil(H / vertical), ceil(W / horizontal), ...) in the compute dtype. The last row and column
+        of boxes are completed by repeating the edge pixels.
+    """
+
+    vertical, horizontal = factors
+    if factors == (1, 1):
+        return channel
+
+    with stage("downsample", channel.nbytes):
+        rows, cols, *channels = channel.shape
+        if rows % vertical or cols % horizontal:
+            pad_width = [(0, -rows % vertical), (0, -cols % horizontal)] + [(0, 0)] * len(channels)
+            channel = np.pad(channel, pad_width, mode="edge")
+
+        # summing the strided pixels of every box position is much faster than a mean over the box axes
+        boxes = np.zeros((channel.shape[0] // vertical, channel.shape[1] // horizontal, *channels), compute_dtype())
+        for row in range(vertical):
+            for col in range(horizontal):
+                np.add(boxes, channel[row::vertical, col::horizontal], out=boxes)
+
+        return np.divide(boxes, vertical * horizontal, out=boxes)
+
+
+def upsample(channel: np.ndarray, factors: tuple[int, int], shape: tuple[int, int]) -> np.ndarray:
+    """Upsample a channel produced by `downsample` back to its full resolution, by repeating every pixel.
+
+    Parameters
+    ----------
+    channel : np.ndarray
+        A numpy array of shape (h, w), or (h, w, C).
+    factors : tuple[int, int]
+        The (vertical, horizontal) factors the channel was downsampled by.
+    shape : tuple[int, int]
+        The (H, W) shape of the full resolution channel, the upsampled channel is cropped to it.
+
+    Returns
+    -------
+    np.ndarray
+        A numpy array of shape (H, W), or (H, W, C).
+    """
+
+    vertical, horizontal = factors
+    if factors == (1, 1):
+        return channel[: shape[0], : shape[1]]
+
+    with stage("upsample", channel.nbytes):
+        rows = np.repeat(channel[: -(-shape[0] // vertical)], vertical, axis=0)
+
+        return np.repeat(rows[:, : -(-shape[1] // horizontal)], horizontal, axis=1)[: shape[0], : shape[1]]
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from typing import Iterator
+
+import numpy as np
+
+# floating point type of the intermediate arrays of the codec (colour conversion, DCT, quantization),
+# single precision is plenty for 8 bit images and halves the memory traffic of every temporary
+_compute_dtype: np.dtype = np.dtype(np.float32)
+
+SUPPORTED_DTYPES: tuple[np.dtype, ...] = (np.dtype(np.float32), np.dtype(np.float64))
+
+
+def compute_dtype() -> np.dtype:
+    """The floating point type the codec computes in, float32 unless changed by `set_compute_dtype`."""
+
+    return _compute_dtype
+
+
+def set_compute_dtype(dtype: str | type | np.dtype) -> None:
+    """Select the floating point type the codec computes in.
+
+    Parameters
+    ----------
+    dtype : str | type | np.dtype
+        Either float32 (the default) or float64, e.g. "float64" or `np.float64`.
+
+    Raises
+    ------
+    ValueError
+        If `dtype` is not one of the supported floating point types.
+    """
+
+    global _compute_dtype
+
+    dtype = np.dtype(dtype)
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported compute dtype: {dtype}. Expected one of {[str(d) for d in SUPPORTED_DTYPES]}.")
+
+    _compute_dtype = dtype
+
+
+@contextmanager
+def compute_precision(dtype: str | type | np.dtype) -> Iterator[None]:
+    """Temporarily select the floating point type the codec computes in, see `set_compute_dtype`."""
+
+    previous = compute_dtype()
+    set_compute_dtype(dtype)
+    try:
+        yield
+    finally:
+        set_compute_dtype(previous)
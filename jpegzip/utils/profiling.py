@@ -0,0 +1,234 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Iterator
+
+# the profile the pipeline reports into, None while profiling is disabled, see `profile`
+_profile: "Profile | None" = None
+
+# returned by `stage` while profiling is disabled, entering and leaving it does nothing
+_DISABLED: ContextManager[None] = nullcontext()
+
+# the snapshots of the memory profile leave out the allocations of the profiler itself
+_SNAPSHOT_FILTERS: list[tracemalloc.Filter] = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+class Profile:
+    """Per-stage statistics of the codec, collected while a `profile` context is active.
+
+    For every stage name, the number of calls, the total wall time, the total number of input bytes
+    and, when memory tracing is on, the largest amount of memory allocated by a single call on top of
+    what was allocated before it and the largest number of memory blocks a single call allocated and
+    still held when it returned. Stages may be nested (e.g. `compress_frame` contains `dct`), the time
+    and memory of an outer stage include the ones of its inner stages.
+
+    Memory is only recorded for the stages of the main thread. `tracemalloc` traces the whole process,
+    so the figures of a stage also include what other threads allocated meanwhile, e.g. the frames read
+    ahead by `jpegzip.utils.streaming.prefetch` while a video is compressed, and are only exact while
+    no other thread allocates.
+
+    Parameters
+    ----------
+    memory : bool, optional
+        If True, allocations are traced with `tracemalloc`. Tracing slows every allocation down and the
+        blocks are counted by comparing snapshots of all traced memory, so the times of a memory profile
+        are inflated. The default is False.
+
+    Attributes
+    ----------
+    stages : dict[str, dict[str, float]]
+        The statistics of every stage, as `{"calls", "seconds", "bytes", "allocated_bytes", "allocated_blocks"}`.
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory: bool = memory
+        self.stages: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(
+        self, name: str, seconds: float, nbytes: int = 0, allocated_bytes: int = 0, allocated_blocks: int = 0
+    ) -> None:
+        """Add one call of a stage to the statistics."""
+
+        with self._lock:
+            stats = self._stats(name)
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["bytes"] += nbytes
+            stats["allocated_bytes"] = max(stats["allocated_bytes"], allocated_bytes)
+            stats["allocated_blocks"] = max(stats["allocated_blocks"], allocated_blocks)
+
+    def merge(self, stages: dict[str, dict[str, float]]) -> None:
+        """Add the statistics collected by another profile, e.g. the one of a worker process."""
+
+        with self._lock:
+            for name, other in stages.items():
+                stats = self._stats(name)
+                stats["calls"] += other["calls"]
+                stats["seconds"] += other["seconds"]
+                stats["bytes"] += other["bytes"]
+                stats["allocated_bytes"] = max(stats["allocated_bytes"], other["allocated_bytes"])
+                stats["allocated_blocks"] = max(stats["allocated_blocks"], other["allocated_blocks"])
+
+    def as_dict(self) -> dict:
+        """The statistics as a JSON serializable dict, `{"memory": bool, "stages": {name: stats}}`."""
+
+        with self._lock:
+            return {"memory": self.memory, "stages": {name: dict(stats) for name, stats in self.stages.items()}}
+
+    def to_json(self, indent: int | None = 2) -> str:
+        """The statistics of `as_dict` as a JSON document."""
+
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def report(self) -> str:
+        """A table of the statistics, with the slowest stages first."""
+
+        # fmt: off
+        lines = [f"{'Stage':20} {'Calls':>8} {'Time (s)':>10} {'ms/call':>10} {'MB/s':>10} {'Alloc (MB)':>11} {'Blocks':>8}"]
+        # fmt: on
+        for name, stats in sorted(self.as_dict()["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            per_call = 1e3 * stats["seconds"] / stats["calls"]
+            throughput = stats["bytes"] / stats["seconds"] / 1e6 if stats["seconds"] > 0 else 0.0
+            if self.memory:
+                allocated = f"{stats['allocated_bytes'] / 1e6:11.2f} {stats['allocated_blocks']:8}"
+            else:
+                allocated = f"{'-':>11} {'-':>8}"
+            lines.append(
+                f"{name:20} {stats['calls']:8} {stats['seconds']:10.4f} {per_call:10.3f} {throughput:10.2f} {allocated}"
+            )
+
+        return "\n".join(lines)
+
+    def _stats(self, name: str) -> dict[str, float]:
+        # the statistics of a stage, created empty on its first call, the lock must be held
+        return self.stages.setdefault(
+            name, {"calls": 0, "seconds": 0.0, "bytes": 0, "allocated_bytes": 0, "allocated_blocks": 0}
+        )
+
+    def _stack(self) -> list[list]:
+        # the open stages of the calling thread, as
+        # [traced memory at entry, peak traced memory seen so far, snapshot of the traced blocks at entry]
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _traces_memory(self) -> bool:
+        # the peak of tracemalloc is process-wide and reset by every stage, only the main thread may use it
+        return self.memory and tracemalloc.is_tracing() and threading.current_thread() is threading.main_thread()
+
+
+class _Stage:
+    """Times one call of a stage and reports it into a `Profile`, see `stage`."""
+
+    __slots__ = ("profile", "name", "nbytes", "start")
+
+    def __init__(self, profile: Profile, name: str, nbytes: int):
+        self.profile = profile
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self) -> None:
+        if self.profile._traces_memory():
+            stack = self.profile._stack()
+            # the snapshot is not traced itself, it is only filtered when the stage ends
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak is reset for every stage, hand the one seen so far over to the enclosing stage first
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            stack.append([current, current, snapshot])
+
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.start
+        allocated_bytes = 0
+        allocated_blocks = 0
+
+        if self.profile._traces_memory():
+            stack = self.profile._stack()
+            start, peak, snapshot = stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            allocated_bytes = peak - start
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+
+            current = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            differences = current.compare_to(snapshot.filter_traces(_SNAPSHOT_FILTERS), "traceback")
+            allocated_blocks = sum(max(difference.count_diff, 0) for difference in differences)
+            tracemalloc.reset_peak()
+
+        self.profile.record(self.name, seconds, self.nbytes, allocated_bytes, allocated_blocks)
+
+
+def active_profile() -> Profile | None:
+    """The profile the pipeline currently reports into, or None if profiling is disabled."""
+
+    return _profile
+
+
+def stage(name: str, nbytes: int = 0) -> ContextManager[None]:
+    """Measure a stage of the pipeline, e.g. `with stage("dct", image.nbytes): ...`.
+
+    While no `profile` is active this returns a shared context manager that does nothing,
+    so an instrumented stage costs a function call and a global lookup.
+
+    Parameters
+    ----------
+    name : str
+        The name the statistics of the stage are collected under.
+    nbytes : int, optional
+        The number of bytes the stage processes, usually the size of its input. The default is 0.
+    """
+
+    if _profile is None:
+        return _DISABLED
+
+    return _Stage(_profile, name, nbytes)
+
+
+@contextmanager
+def profile(memory: bool = False) -> Iterator[Profile]:
+    """Collect the statistics of every stage run inside the context.
+
+    Examples
+    --------
+    >>> with profile() as collected:
+    ...     ImageCompression.compress_rgb(image)
+    >>> print(collected.report())
+
+    Parameters
+    ----------
+    memory : bool, optional
+        If True, also trace the memory allocated by every stage, see `Profile`. The default is False.
+
+    Yields
+    ------
+    Profile
+        The profile the statistics are collected into. It stays readable after the context exits.
+    """
+
+    global _profile
+
+    previous = _profile
+    collected = Profile(memory=memory)
+    started = memory and not tracemalloc.is_tracing()
+
+    if started:
+        tracemalloc.start()
+
+    _profile = collected
+    try:
+        yield collected
+    finally:
+        _profile = previous
+        if started:
+            tracemalloc.stop()
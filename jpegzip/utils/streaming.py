@@ -0,0 +1,68 @@
+import threading
+from queue import Queue
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+
+
+def prefetch(iterable: Iterable[T], maxsize: int = 4) -> Iterator[T]:
+    """Run an iterable in a background thread and yield its items through a bounded queue.
+
+    Chaining generators with `prefetch` turns them into a pipeline where every stage runs
+    concurrently with the next one, while the bounded queue applies backpressure: a producer
+    that gets ahead by `maxsize` items blocks until the consumer catches up, so the number of
+    items alive at once never depends on the length of the stream.
+
+    Parameters
+    ----------
+    iterable : Iterable[T]
+        The producer stage, e.g. a generator reading video frames.
+
+    maxsize : int, optional
+        The maximum number of items buffered between the producer and the consumer. The default is 4.
+
+    Returns
+    -------
+    Iterator[T]
+        The items of `iterable`, in order.
+
+    Raises
+    ------
+    Exception
+        Any exception raised by the producer is re-raised in the consumer.
+    """
+
+    queue: Queue = Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                queue.put(item)
+        except Exception as e:
+            queue.put(e)
+            return
+        queue.put(_END)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = queue.get()
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # unblock the producer if the consumer stopped early
+        stop.set()
+        while thread.is_alive():
+            while not queue.empty():
+                queue.get_nowait()
+            thread.join(timeout=0.01)
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def sample_image() -> np.ndarray:
+    """A 77x101 RGB image with smooth gradients and some texture."""
+
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:77, 0:101]
+    image = np.stack([x * 2.5, y * 3, 128 + 60 * np.sin(x / 5) * np.cos(y / 7)], axis=-1)
+
+    return np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8)
@@ -0,0 +1,130 @@
+import cv2 as cv
+import numpy as np
+import pytest
+from jpegzip.compression.batch_compression import BatchCompression, compress_file
+from jpegzip.compression.image_compression import ImageCompression
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """A directory with three small PNG images, one corrupt PNG and one non-image file."""
+
+    rng = np.random.default_rng(3)
+    y, x = np.mgrid[0:40, 0:56]
+    for i in range(3):
+        image = np.stack([x * 4, y * 5, 128 + 60 * np.sin((x + 7 * i) / 5)], axis=-1)
+        image = np.clip(image + rng.normal(0, 6, image.shape), 0, 255).astype(np.uint8)
+        cv.imwrite(str(tmp_path / f"image{i}.png"), image)
+
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    (tmp_path / "notes.txt").write_text("not listed")
+
+    return tmp_path
+
+
+class TestBatchCompression:
+    def test_find_images(self, image_dir):
+        """Test listing a directory by extension and a glob pattern"""
+
+        names = [path.rsplit("/", 1)[-1] for path in BatchCompression.find_images(str(image_dir))]
+        assert names == ["broken.png", "image0.png", "image1.png", "image2.png"]
+
+        assert len(BatchCompression.find_images(str(image_dir / "image*.png"))) == 3
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_failure_does_not_abort(self, image_dir, tmp_path_factory, workers):
+        """Test that a corrupt file is counted as failed while the others are compressed"""
+
+        output_dir = tmp_path_factory.mktemp("output")
+        compressor = BatchCompression(BatchCompression.find_images(str(image_dir)), str(output_dir), workers=workers)
+
+        assert compressor.compress() == (3, 1)
+        assert list(compressor.failures) == [str(image_dir / "broken.png")]
+        assert sorted(path.name for path in output_dir.iterdir()) == [
+            "image0_compressed.png",
+            "image1_compressed.png",
+            "image2_compressed.png",
+        ]
+        assert compressor.throughput > 0
+
+    def test_same_result_as_compress_rgb(self, image_dir, tmp_path_factory):
+        """Test that a compressed file holds the image of `compress_rgb`"""
+
+        output_dir = tmp_path_factory.mktemp("output")
+        pixels, _, output_bytes, mse = compress_file(str(image_dir / "image0.png"), str(output_dir), q_factor=2.0)
+
+        image = cv.cvtColor(cv.imread(str(image_dir / "image0.png")), cv.COLOR_BGR2RGB)
+        expected = ImageCompression.compress_rgb(image, q_factor=2.0)
+        compressed = cv.cvtColor(cv.imread(str(output_dir / "image0_compressed.png")), cv.COLOR_BGR2RGB)
+
+        assert pixels == 40 * 56
+        assert output_bytes == (output_dir / "image0_compressed.png").stat().st_size
+        np.testing.assert_array_equal(compressed, expected)
+        assert mse == pytest.approx(np.mean((image.astype(np.float64) - expected) ** 2))
+
+    def test_target_mse_jpeg(self, image_dir, tmp_path_factory):
+        """Test writing JFIF files compressed to a target MSE"""
+
+        output_dir = tmp_path_factory.mktemp("output")
+        compressor = BatchCompression(
+            BatchCompression.find_images(str(image_dir / "image*.png")),
+            str(output_dir),
+            target_mse=100,
+            subsampling="4:2:0",
+            jpeg=True,
+        )
+
+        assert compressor.compress() == (3, 0)
+        for path, (_, _, output_bytes, mse) in compressor.results.items():
+            data = (output_dir / path.rsplit("/", 1)[-1].replace(".png", "_compressed.jpg")).read_bytes()
+            image = cv.cvtColor(cv.imread(path), cv.COLOR_BGR2RGB)
+            decoded = ImageCompression.decompress_jpeg(data)
+
+            assert data[:2] == b"\xff\xd8" and len(data) == output_bytes
+            assert mse == pytest.approx(np.mean((image.astype(np.float64) - decoded) ** 2))
+            assert abs(mse - 100) <= ImageCompression.MSE_TOLERANCE
+
+    def test_target_mse_jpeg_unreachable(self, image_dir, tmp_path_factory):
+        """Test that a file whose target MSE is above what its JFIF file can reach is counted as failed"""
+
+        output_dir = tmp_path_factory.mktemp("output")
+        compressor = BatchCompression([str(image_dir / "image0.png")], str(output_dir), target_mse=5000, jpeg=True)
+
+        assert compressor.compress() == (0, 1)
+        assert "target MSE" in compressor.failures[str(image_dir / "image0.png")]
+
+    def test_jpeg_mse(self, image_dir, tmp_path_factory, monkeypatch):
+        """Test that a JFIF file at a fixed q_factor is encoded once, and reports the MSE of its decoded image"""
+
+        def compress_rgb(*args, **kwargs):
+            raise AssertionError("compress_rgb must not run when writing JFIF files")
+
+        monkeypatch.setattr(ImageCompression, "compress_rgb", compress_rgb)
+        output_dir = tmp_path_factory.mktemp("output")
+        _, _, _, mse = compress_file(str(image_dir / "image0.png"), str(output_dir), q_factor=2.0, jpeg=True)
+
+        image = cv.cvtColor(cv.imread(str(image_dir / "image0.png")), cv.COLOR_BGR2RGB)
+        decoded = ImageCompression.decompress_jpeg((output_dir / "image0_compressed.jpg").read_bytes())
+        assert mse == pytest.approx(np.mean((image.astype(np.float64) - decoded) ** 2))
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_output_collision(self, image_dir, tmp_path_factory, workers):
+        """Test that a file whose output is the one of an earlier file fails instead of overwriting it"""
+
+        cv.imwrite(str(image_dir / "image0.jpg"), cv.imread(str(image_dir / "image1.png")))
+        paths = [str(image_dir / "image0.png"), str(image_dir / "image0.jpg")]
+        output_dir = tmp_path_factory.mktemp("output")
+
+        compressor = BatchCompression(paths, str(output_dir), workers=workers, q_factor=2.0, jpeg=True)
+
+        assert compressor.compress() == (1, 1)
+        assert list(compressor.results) == [paths[0]] and list(compressor.failures) == [paths[1]]
+        assert (output_dir / "image0_compressed.jpg").read_bytes() == ImageCompression.compress_jpeg(
+            cv.cvtColor(cv.imread(paths[0]), cv.COLOR_BGR2RGB), q_factor=2.0
+        )
+
+    def test_invalid_workers(self):
+        """Test that at least one worker is required"""
+
+        with pytest.raises(ValueError):
+            BatchCompression([], "output", workers=0)
@@ -63,6 +63,37 @@ class TestBlock:
 
         assert np.array_equal(block_ground_truth, blocks_generated[1][0])
 
+    def test_block_is_view(self):
+        """Test that blocks are a view into the image and no data is copied"""
+        n = 16
+
+        image_16x16 = np.arange(n**2).reshape(n, n)
+        blocks = ImageBlockProcessor.blocks(image_16x16)
+
+        assert np.shares_memory(blocks, image_16x16)
+
+        blocks[1, 0, 0, 0] = -1
+        assert image_16x16[8, 0] == -1
+
+    def test_block_batch(self):
+        """Test a batch of 3 channels of shape 16x24 split in one call"""
+
+        image = np.arange(3 * 16 * 24).reshape(3, 16, 24)
+        blocks = ImageBlockProcessor.blocks(image)
+
+        assert blocks.shape == (3, 2, 3, TestBlock.BLOCK_SIZE, TestBlock.BLOCK_SIZE)
+
+        for channel in range(3):
+            np.testing.assert_array_equal(blocks[channel], ImageBlockProcessor.blocks(image[channel]))
+
+    def test_block_non_contiguous_channel(self):
+        """Test splitting a strided channel of an (H, W, 3) image"""
+
+        image = np.arange(16 * 16 * 3).reshape(16, 16, 3)
+        blocks = ImageBlockProcessor.blocks(image[:, :, 1])
+
+        np.testing.assert_array_equal(blocks[1, 1], image[8:16, 8:16, 1])
+
     def test_invalid_image_shape(self):
         # Test case where image shape is not divisible by 8
 
@@ -0,0 +1,107 @@
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+from jpegzip.compression.block_index import BlockIndex
+from jpegzip.compression.image_compression import ImageCompression
+
+REGIONS = [(0, 0, 83, 141), (5, 7, 40, 33), (50, 100, 33, 41), (82, 140, 1, 1), (17, 0, 9, 141)]
+
+
+@pytest.fixture
+def sample_image() -> np.ndarray:
+    """An 83x141 RGB image with texture, whose sides are not multiples of the MCU size."""
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:83, 0:141]
+    image = np.stack([x * 1.8, y * 3, 128 + 60 * np.sin(x / 5) * np.cos(y / 7)], axis=-1)
+
+    return np.clip(image + rng.normal(0, 12, image.shape), 0, 255).astype(np.uint8)
+
+
+class TestBlockIndex:
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    @pytest.mark.parametrize("interval", [1, 3, 100])
+    def test_region_matches_full_decode(self, sample_image, subsampling, interval):
+        """Test that every region is decoded to the pixels of the full decode"""
+
+        data = ImageCompression.compress_jpeg(sample_image, subsampling=subsampling)
+        full = ImageCompression.decompress_jpeg(data)
+        index = BlockIndex.build(data, interval=interval)
+
+        for y0, x0, height, width in REGIONS:
+            np.testing.assert_array_equal(
+                ImageCompression.decompress_jpeg_region(data, y0, x0, height, width, index),
+                full[y0 : y0 + height, x0 : x0 + width],
+            )
+
+    def test_grayscale(self, sample_image):
+        """Test a single component file"""
+
+        data = ImageCompression.compress_jpeg(sample_image[:, :, 0])
+
+        np.testing.assert_array_equal(
+            ImageCompression.decompress_jpeg_region(data, 10, 20, 50, 60),
+            ImageCompression.decompress_jpeg(data)[10:60, 20:80],
+        )
+
+    def test_libjpeg_file(self, sample_image):
+        """Test a file written by libjpeg, with byte stuffing and its default 4:2:0 subsampling"""
+
+        _, encoded = cv.imencode(".jpg", sample_image, [cv.IMWRITE_JPEG_QUALITY, 95])
+        data = encoded.tobytes()
+
+        assert b"\xff\x00" in data
+        np.testing.assert_array_equal(
+            ImageCompression.decompress_jpeg_region(data, 30, 45, 40, 70),
+            ImageCompression.decompress_jpeg(data)[30:70, 45:115],
+        )
+
+    def test_sidecar(self, tmp_path, sample_image):
+        """Test that an index written to a sidecar file is read back unchanged"""
+
+        data = ImageCompression.compress_jpeg(sample_image, subsampling="4:2:0")
+        index = BlockIndex.build(data)
+        path = os.path.join(tmp_path, "image.jpg.npz")
+
+        index.save(path)
+        loaded = BlockIndex.load(path)
+
+        assert (loaded.grid, loaded.interval) == (index.grid, index.interval)
+        np.testing.assert_array_equal(loaded.positions, index.positions)
+        np.testing.assert_array_equal(loaded.predictors, index.predictors)
+        np.testing.assert_array_equal(
+            ImageCompression.decompress_jpeg_region(data, 20, 30, 16, 16, loaded),
+            ImageCompression.decompress_jpeg_region(data, 20, 30, 16, 16, index),
+        )
+
+    def test_invalid_region(self, sample_image):
+        """Test that regions outside of the image are rejected"""
+
+        data = ImageCompression.compress_jpeg(sample_image)
+        index = BlockIndex.build(data)
+
+        for y0, x0, height, width in [(-1, 0, 10, 10), (0, 0, 0, 10), (80, 0, 10, 10), (0, 100, 10, 42)]:
+            with pytest.raises(ValueError):
+                ImageCompression.decompress_jpeg_region(data, y0, x0, height, width, index)
+
+    def test_mismatched_index(self, sample_image):
+        """Test that the index of another file is rejected"""
+
+        index = BlockIndex.build(ImageCompression.compress_jpeg(sample_image[:40]))
+
+        with pytest.raises(ValueError):
+            ImageCompression.decompress_jpeg_region(ImageCompression.compress_jpeg(sample_image), 0, 0, 8, 8, index)
+
+    def test_progressive_file(self, sample_image):
+        """Test that progressive files, whose first scan does not hold every coefficient, cannot be indexed"""
+
+        with pytest.raises(ValueError):
+            BlockIndex.build(ImageCompression.compress_jpeg(sample_image, progressive=True))
+
+    def test_restart_file(self, sample_image):
+        """Test that files with restart markers, whose bit positions the index does not map, cannot be indexed"""
+
+        with pytest.raises(ValueError):
+            BlockIndex.build(ImageCompression.compress_jpeg(sample_image, restart_interval=4))
@@ -1,8 +1,22 @@
+import jpegzip.utils.image
+import numpy as np
+import pytest
 import scipy
-from jpegzip.utils.image import rgb_to_ycbcr, ycbcr_to_rgb
+from jpegzip.utils.image import rgb_to_ycbcr, rgb_to_ycbcr_reference, ycbcr_to_rgb, ycbcr_to_rgb_reference
+from jpegzip.utils.precision import compute_precision
 from skimage.metrics import mean_squared_error
 
 
+@pytest.fixture(scope="module")
+def all_colours() -> np.ndarray:
+    """Every 8-bit RGB colour, as a 4096x4096 image."""
+
+    colour = np.arange(1 << 24, dtype=np.uint32)
+    image = np.stack([colour >> 16, (colour >> 8) & 0xFF, colour & 0xFF], axis=-1)
+
+    return image.astype(np.uint8).reshape(4096, 4096, 3)
+
+
 class TestConversion:
     """A test class to validate the accuracy and integrity of RGB to YCbCr color conversion
     and its inverse (YCbCr to RGB) using Mean Squared Error (MSE) as a metric.
@@ -36,3 +50,42 @@ class TestConversion:
         mse = mean_squared_error(image, rgb)
 
         assert mse < TestConversion.MSE_THRESHOLD
+
+    def test_matches_reference(self, all_colours):
+        """Test that the chunked conversions give exactly the reference result for every 8-bit colour"""
+
+        np.testing.assert_array_equal(rgb_to_ycbcr(all_colours), rgb_to_ycbcr_reference(all_colours))
+        np.testing.assert_array_equal(ycbcr_to_rgb(all_colours), ycbcr_to_rgb_reference(all_colours))
+
+    def test_matches_reference_float64(self, all_colours):
+        """Test the float64 policy on every 16th row of colours"""
+
+        image = all_colours[::16]
+        with compute_precision("float64"):
+            np.testing.assert_array_equal(rgb_to_ycbcr(image), rgb_to_ycbcr_reference(image))
+            np.testing.assert_array_equal(ycbcr_to_rgb(image), ycbcr_to_rgb_reference(image))
+
+    def test_partial_chunks(self, all_colours, monkeypatch):
+        """Test strided views, float input out of range and chunks that do not divide the image"""
+
+        monkeypatch.setattr(jpegzip.utils.image, "COLOUR_CHUNK", 1000)
+
+        view = all_colours[7:300:3, 11:1000:2]
+        decoded = all_colours[:97, :211].astype(np.float32) * 1.5 - 60
+
+        np.testing.assert_array_equal(rgb_to_ycbcr(view), rgb_to_ycbcr_reference(view))
+        np.testing.assert_array_equal(ycbcr_to_rgb(decoded), ycbcr_to_rgb_reference(decoded))
+
+    def test_out(self, all_colours):
+        """Test that the result is written to a given buffer, which must be a uint8 array of the image shape"""
+
+        image = all_colours[:64, :80]
+        out = np.empty(image.shape, dtype=np.uint8)
+
+        assert rgb_to_ycbcr(image, out=out) is out
+        np.testing.assert_array_equal(out, rgb_to_ycbcr_reference(image))
+
+        with pytest.raises(ValueError):
+            ycbcr_to_rgb(image, out=np.empty(image.shape, dtype=np.float32))
+        with pytest.raises(ValueError):
+            ycbcr_to_rgb(image, out=np.empty((64, 81, 3), dtype=np.uint8))
@@ -0,0 +1,274 @@
+import re
+
+import numpy as np
+import pytest
+from jpegzip.compression.entropy_coding import EntropyCoding, ScanEncoder
+from jpegzip.compression.jpeg_compression import JPEGCompression
+
+
+class TestEntropyCoding:
+    @staticmethod
+    def random_blocks(shape: tuple[int, int], density: float, seed: int = 0) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+
+        blocks = np.round(rng.laplace(0, 4, size=(*shape, 8, 8))) * (rng.random((*shape, 8, 8)) < density)
+        blocks[..., 0, 0] = rng.integers(-1000, 1000, size=shape)
+
+        return blocks.astype(np.int32)
+
+    def test_zigzag_order(self):
+        """Test the first coefficients of the zigzag scan and its inverse"""
+
+        block = np.arange(64).reshape(8, 8)
+        coefficients = EntropyCoding.zigzag(block)
+
+        np.testing.assert_array_equal(coefficients[:6], [0, 1, 8, 16, 9, 2])
+        np.testing.assert_array_equal(EntropyCoding.izigzag(coefficients), block)
+
+    def test_huffman_codes_prefix_free(self):
+        """Test that the canonical codes of the standard AC table are prefix free"""
+
+        codes, lengths = EntropyCoding.huffman_codes(EntropyCoding.AC_LUMINANCE_BITS, EntropyCoding.AC_LUMINANCE_VALUES)
+        words = sorted(format(codes[symbol], f"0{lengths[symbol]}b") for symbol in EntropyCoding.AC_LUMINANCE_VALUES)
+
+        assert all(not b.startswith(a) for a, b in zip(words, words[1:]))
+
+    @pytest.mark.parametrize("q_method", ["luminance", "chroma"])
+    @pytest.mark.parametrize("density", [0.0, 0.05, 0.5, 1.0])
+    def test_round_trip(self, q_method, density):
+        """Test that decoding the stream gives back the quantized blocks"""
+
+        blocks = TestEntropyCoding.random_blocks((6, 9), density)
+
+        data = EntropyCoding.encode(blocks, q_method)
+        decoded = EntropyCoding.decode(data, (6, 9), q_method)
+
+        np.testing.assert_array_equal(decoded, blocks)
+
+    def test_round_trip_long_runs(self):
+        """Test zero runs longer than 16 (ZRL) and a block without EOB"""
+
+        blocks = np.zeros((1, 3, 8, 8), dtype=np.int32)
+        blocks[0, 0, 7, 7] = 5
+        blocks[0, 1, 4, 4] = -3
+        blocks[0, 2, 7, 6] = 1
+        blocks[0, 2, 7, 7] = 1
+
+        data = EntropyCoding.encode(blocks)
+
+        np.testing.assert_array_equal(EntropyCoding.decode(data, (1, 3)), blocks)
+
+    def test_byte_stuffing(self):
+        """Test that every 0xFF byte in the stream is followed by a stuffed 0x00"""
+
+        blocks = TestEntropyCoding.random_blocks((16, 16), 0.8, seed=3)
+        data = EntropyCoding.encode(blocks)
+
+        positions = [i for i, byte in enumerate(data) if byte == 0xFF]
+        assert positions and all(data[i + 1] == 0 for i in positions)
+
+    def test_components_round_trip(self):
+        """Test an interleaved stream of one luminance and two chroma components"""
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        components = [TestEntropyCoding.random_blocks((4, 5), 0.2, seed=seed) for seed in range(3)]
+
+        data = EntropyCoding.encode_components(components, q_methods)
+        decoded = EntropyCoding.decode_components(data, (4, 5), q_methods)
+
+        for component, decoded_component in zip(components, decoded):
+            np.testing.assert_array_equal(decoded_component, component)
+
+    @pytest.mark.parametrize("sampling", [[(2, 2), (1, 1), (1, 1)], [(2, 1), (1, 1), (1, 1)]])
+    def test_subsampled_components_round_trip(self, sampling):
+        """Test an interleaved stream whose MCU holds several luminance blocks"""
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        grid = (3, 4)
+        components = [
+            TestEntropyCoding.random_blocks((grid[0] * v, grid[1] * h), 0.2, seed=seed)
+            for seed, (h, v) in enumerate(sampling)
+        ]
+
+        data = EntropyCoding.encode_components(components, q_methods, sampling)
+        decoded = EntropyCoding.decode_components(data, grid, q_methods, sampling)
+
+        for component, decoded_component in zip(components, decoded):
+            np.testing.assert_array_equal(decoded_component, component)
+
+    @pytest.mark.parametrize("band", [(0, 0), (1, 5), (6, 63)])
+    @pytest.mark.parametrize("sampling", [None, [(2, 2), (1, 1), (1, 1)]])
+    def test_band_round_trip(self, band, sampling):
+        """Test that a spectral band stream decodes to the coefficients of the band only"""
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        factors = sampling or [(1, 1)] * 3
+        components = [
+            TestEntropyCoding.random_blocks((3 * v, 4 * h), 0.3, seed=seed) for seed, (h, v) in enumerate(factors)
+        ]
+
+        data = EntropyCoding.encode_components(components, q_methods, sampling, band=band)
+        decoded = EntropyCoding.decode_components(data, (3, 4), q_methods, sampling, band=band)
+
+        mask = np.zeros(64, dtype=bool)
+        mask[EntropyCoding.ZIGZAG[band[0] : band[1] + 1]] = True
+        for component, decoded_component in zip(components, decoded):
+            np.testing.assert_array_equal(decoded_component, component * mask.reshape(8, 8))
+
+    @pytest.mark.parametrize("restart_interval", [1, 5, 12])
+    @pytest.mark.parametrize("sampling", [None, [(2, 2), (1, 1), (1, 1)]])
+    def test_restart_round_trip(self, restart_interval, sampling):
+        """Test that a stream with restart markers decodes the same serially and in parallel"""
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        factors = sampling or [(1, 1)] * 3
+        components = [
+            TestEntropyCoding.random_blocks((3 * v, 4 * h), 0.3, seed=seed) for seed, (h, v) in enumerate(factors)
+        ]
+
+        data = EntropyCoding.encode_components(components, q_methods, sampling, restart_interval=restart_interval)
+
+        # the markers RST0 to RST7 follow every interval but the last one, numbered modulo 8
+        n_intervals = -(-12 // restart_interval)
+        markers = [bytes([0xFF, 0xD0 + interval % 8]) for interval in range(n_intervals - 1)]
+        assert re.findall(rb"\xff[\xd0-\xd7]", data) == markers
+        assert data == EntropyCoding.encode_components(
+            components, q_methods, sampling, restart_interval=restart_interval, workers=2
+        )
+
+        for workers in [1, 2]:
+            decoded = EntropyCoding.decode_components(
+                data, (3, 4), q_methods, sampling, restart_interval=restart_interval, workers=workers
+            )
+            for component, decoded_component in zip(components, decoded):
+                np.testing.assert_array_equal(decoded_component, component)
+
+    def test_missing_restart_marker(self):
+        """Test that a stream whose markers do not match the restart interval is rejected"""
+
+        blocks = TestEntropyCoding.random_blocks((4, 4), 0.3)
+        data = EntropyCoding.encode_components([blocks], ["luminance"], restart_interval=4)
+
+        for workers in [1, 2]:
+            with pytest.raises(ValueError):
+                EntropyCoding.decode_components(data, (4, 4), ["luminance"], restart_interval=5, workers=workers)
+
+    @pytest.mark.parametrize(
+        "frequencies",
+        [
+            [1000, 500, 250, 10, 10, 3],
+            [7],
+            # Fibonacci frequencies give a Huffman tree as deep as the number of symbols
+            [1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610, 987, 1597, 2584, 4181, 6765, 10946, 17711],
+        ],
+    )
+    def test_optimal_table(self, frequencies):
+        """Test that a fitted table codes every symbol that occurs, with codes of at most 16 bits, never all 1 bits"""
+
+        counts = np.zeros(256, dtype=np.int64)
+        symbols = np.arange(len(frequencies)) * 7 + 1
+        counts[symbols] = frequencies
+
+        bits, values = EntropyCoding.optimal_table(counts)
+        codes, lengths = EntropyCoding.huffman_codes(bits, values)
+
+        assert len(bits) == 16 and sorted(values) == symbols.tolist()
+        assert 0 < lengths[symbols].min() and lengths[symbols].max() <= 16
+        assert np.all(codes[symbols] != (1 << lengths[symbols]) - 1)
+        # the most frequent symbol gets one of the shortest codes
+        assert lengths[symbols[np.argmax(frequencies)]] == lengths[symbols].min()
+
+    @pytest.mark.parametrize("sampling", [None, [(2, 2), (1, 1), (1, 1)]])
+    def test_optimized_tables_round_trip(self, sampling):
+        """Test that a stream coded with fitted tables is smaller and decodes to the same coefficients"""
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        factors = sampling or [(1, 1)] * 3
+        components = [
+            TestEntropyCoding.random_blocks((6 * v, 8 * h), 0.1, seed=seed) for seed, (h, v) in enumerate(factors)
+        ]
+
+        data, tables = EntropyCoding.encode_optimized(components, q_methods, sampling)
+        decoded = EntropyCoding.decode_components(data, (6, 8), tables, sampling)
+
+        assert tables[1] == tables[2]
+        assert tables == EntropyCoding.optimized_tables(components, q_methods, sampling)
+        assert len(data) < len(EntropyCoding.encode_components(components, q_methods, sampling))
+        for component, decoded_component in zip(components, decoded):
+            np.testing.assert_array_equal(decoded_component, component)
+
+    def test_dc_band_invalid_code(self):
+        """Test that a DC scan holding an invalid Huffman code is rejected"""
+
+        with pytest.raises(ValueError):
+            EntropyCoding.decode_components(b"\xff\x00" * 8, (2, 2), ["luminance"], band=(0, 0))
+
+    @pytest.mark.parametrize("sampling", [None, [(2, 2), (1, 1), (1, 1)]])
+    def test_scan_encoder_matches_single_pass(self, sampling):
+        """Test that coding the MCU rows in several calls gives the same stream as coding them at once"""
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        factors = sampling or [(1, 1)] * 3
+        components = [
+            TestEntropyCoding.random_blocks((7 * v, 5 * h), 0.3, seed=seed) for seed, (h, v) in enumerate(factors)
+        ]
+
+        encoder = ScanEncoder(q_methods, sampling)
+        data = b""
+        for start, stop in [(0, 1), (1, 4), (4, 7)]:
+            data += encoder.encode([component[start * v : stop * v] for component, (_, v) in zip(components, factors)])
+        data += encoder.flush()
+
+        assert data == EntropyCoding.encode_components(components, q_methods, sampling)
+
+    def test_subsampled_grid_mismatch(self):
+        """Test that block grids not matching the sampling factors are rejected"""
+
+        components = [TestEntropyCoding.random_blocks((4, 4), 0.2), TestEntropyCoding.random_blocks((3, 2), 0.2)]
+
+        with pytest.raises(RuntimeError):
+            EntropyCoding.encode_components(components, ["luminance", "chroma"], [(2, 2), (1, 1)])
+
+    @pytest.mark.parametrize("q_factor", [0.25, 1.0, 4.0])
+    def test_estimate_size(self, q_factor):
+        """Test that the estimated size of an interleaved stream is close to the encoded one"""
+
+        rng = np.random.default_rng(0)
+        x = np.linspace(0, 255, 96 * 80).reshape(96, 80)
+        image = np.round(x + 20 * np.sin(x / 7) + rng.normal(0, 6, x.shape)).clip(0, 255).astype(np.uint8)
+
+        q_methods = ["luminance", "chroma", "chroma"]
+        components = [
+            JPEGCompression.quantize(channel, q_method=q_method, q_factor=q_factor)
+            for channel, q_method in zip([image, np.flip(image), 255 - image], q_methods)
+        ]
+
+        data = EntropyCoding.encode_components(components, q_methods)
+        estimate = EntropyCoding.estimate_size(components, q_methods)
+
+        assert abs(estimate - len(data)) <= 0.02 * len(data)
+
+    def test_image_round_trip(self):
+        """Test that the entropy coded output is smaller than the input and decodes to the same image"""
+
+        x = np.linspace(0, 255, 64 * 48).reshape(64, 48)
+        image = np.round(x + 20 * np.sin(x / 7)).clip(0, 255).astype(np.uint8)
+
+        blocks = JPEGCompression.quantize(image)
+        data = EntropyCoding.encode(blocks)
+        decoded = EntropyCoding.decode(data, blocks.shape[:2])
+
+        assert len(data) < image.nbytes
+        np.testing.assert_array_equal(
+            JPEGCompression.decode(JPEGCompression.dequantize(decoded)),
+            JPEGCompression.decode(JPEGCompression.encode(image)),
+        )
+
+    def test_coefficient_out_of_range(self):
+        """Test that a coefficient outside of the baseline categories raises an error"""
+
+        blocks = np.zeros((1, 1, 8, 8), dtype=np.int32)
+        blocks[0, 0, 0, 1] = 4096
+
+        with pytest.raises(ValueError):
+            EntropyCoding.encode(blocks)
@@ -45,3 +45,31 @@ class TestIBlock:
         reconstructed_image = ImageBlockProcessor.iblocks(blocks)
 
         np.testing.assert_array_equal(reconstructed_image, block)
+
+    def test_iblocks_reconstruction_batch(self):
+        """Test reconstruction of a batch of 2 frames with 3 channels each"""
+
+        image = np.arange(2 * 3 * 16 * 24).reshape(2, 3, 16, 24)
+        blocks = ImageBlockProcessor.blocks(image)
+        reconstructed_image = ImageBlockProcessor.iblocks(blocks)
+
+        np.testing.assert_array_equal(reconstructed_image, image)
+
+    def test_iblocks_reconstruction_out(self):
+        """Test reconstruction into a preallocated buffer"""
+
+        image = np.arange(256, dtype=np.float32).reshape(16, 16)
+        blocks = ImageBlockProcessor.blocks(image)
+
+        out = np.empty_like(image)
+        reconstructed_image = ImageBlockProcessor.iblocks(blocks, out=out)
+
+        assert reconstructed_image is out
+        np.testing.assert_array_equal(out, image)
+
+    def test_iblocks_reconstruction_out_wrong_shape(self):
+        """Test that iblocks raises an error when the output buffer has the wrong shape"""
+
+        blocks = np.ones((2, 2, 8, 8))
+        with pytest.raises(RuntimeError):
+            ImageBlockProcessor.iblocks(blocks, out=np.empty((16, 8)))
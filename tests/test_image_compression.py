@@ -0,0 +1,253 @@
+import numpy as np
+import pytest
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.jpeg_compression import JPEGCompression
+from jpegzip.utils.image import rgb_to_ycbcr
+from skimage.metrics import mean_squared_error
+
+
+@pytest.fixture
+def sample_image() -> np.ndarray:
+    """A 96x128 RGB image with smooth gradients and some texture."""
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:96, 0:128]
+    image = np.stack([x * 2, y * 2, 128 + 60 * np.sin(x / 5) * np.cos(y / 7)], axis=-1)
+
+    return np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8)
+
+
+class TestImageCompression:
+    @pytest.mark.parametrize("target_mse", [60.0, 150.0])
+    def test_search_q_factor(self, sample_image, target_mse):
+        """Test that the search reaches the target within the tolerance"""
+
+        compressed_image, q_factor, mse, iterations = ImageCompression.search_q_factor(sample_image, target_mse)
+
+        assert np.abs(mse - target_mse) <= ImageCompression.MSE_TOLERANCE
+        assert mse == pytest.approx(mean_squared_error(sample_image, compressed_image))
+        assert iterations <= ImageCompression.MAX_ITERATIONS
+
+    def test_search_q_factor_warm_start(self, sample_image):
+        """Test that starting from a converged q_factor takes a single compression"""
+
+        _, q_factor, _, _ = ImageCompression.search_q_factor(sample_image, 100.0)
+        _, _, _, iterations = ImageCompression.search_q_factor(sample_image, 100.0, q_factor=q_factor)
+
+        assert iterations == 1
+
+    def test_search_q_factor_tight_tolerance(self, sample_image, monkeypatch):
+        """Test that the bracketing search terminates even when the tolerance cannot be met exactly"""
+
+        monkeypatch.setattr(ImageCompression, "MSE_TOLERANCE", 1e-6)
+
+        _, q_factor, mse, iterations = ImageCompression.search_q_factor(sample_image, 100.0)
+
+        assert iterations < ImageCompression.MAX_ITERATIONS
+        assert np.abs(mse - 100.0) < 10.0
+
+    def test_search_q_factor_unreachable(self, sample_image):
+        """Test that a target below the smallest reachable MSE raises an error"""
+
+        with pytest.raises(RuntimeError):
+            ImageCompression.search_q_factor(sample_image, 0.01)
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    def test_mse_model(self, sample_image, subsampling):
+        """Test that the model decodes like `compress_rgb`, also with padding, and estimates its MSE closely"""
+
+        _, compress = ImageCompression.mse_model(sample_image[:90, :125], subsampling)
+        estimate, _ = ImageCompression.mse_model(sample_image, subsampling)
+
+        for q_factor in [0.25, 1.0, 4.0, 16.0]:
+            np.testing.assert_array_equal(
+                compress(q_factor),
+                ImageCompression.compress_rgb(sample_image[:90, :125], q_factor=q_factor, subsampling=subsampling),
+            )
+
+            compressed_image = ImageCompression.compress_rgb(sample_image, q_factor=q_factor, subsampling=subsampling)
+            assert estimate(q_factor) == pytest.approx(mean_squared_error(sample_image, compressed_image), rel=0.15)
+
+    def test_mse_model_grayscale(self, sample_image):
+        """Test the model of a grayscale image, whose estimate only misses the clipping"""
+
+        image = sample_image[:, :, 0]
+        estimate, compress = ImageCompression.mse_model(image)
+
+        for q_factor in [0.25, 1.0, 4.0]:
+            compressed_image = ImageCompression.compress_rgb(image, q_factor=q_factor)
+
+            np.testing.assert_array_equal(compress(q_factor), compressed_image)
+            assert estimate(q_factor) == pytest.approx(mean_squared_error(image, compressed_image), rel=0.02)
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    def test_search_q_factor_compressions(self, sample_image, subsampling):
+        """Test that searching on the estimate only needs one or two compressions"""
+
+        for target_mse in [100.0, 200.0, 300.0]:
+            _, _, mse, iterations = ImageCompression.search_q_factor(sample_image, target_mse, subsampling=subsampling)
+
+            assert np.abs(mse - target_mse) <= ImageCompression.MSE_TOLERANCE
+            assert iterations <= 2
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    def test_search_q_factor_jpeg(self, sample_image, subsampling):
+        """Test that the file found by the search decodes to the target MSE, also where the steps are clamped"""
+
+        for target_mse in [60.0, 150.0, 300.0]:
+            data, compressed_image, q_factor, mse, _ = ImageCompression.search_q_factor_jpeg(
+                sample_image, target_mse, subsampling=subsampling
+            )
+
+            np.testing.assert_array_equal(ImageCompression.decompress_jpeg(data), compressed_image)
+            assert data == ImageCompression.compress_jpeg(sample_image, q_factor, subsampling)
+            assert mse == pytest.approx(mean_squared_error(sample_image, compressed_image))
+            assert np.abs(mse - target_mse) <= ImageCompression.MSE_TOLERANCE
+
+        with pytest.raises(RuntimeError):
+            ImageCompression.search_q_factor_jpeg(sample_image, 5000.0, subsampling=subsampling)
+
+    def test_solve_q_factor(self):
+        """Test the bracketing search on a known function, and that it stops at the bounds"""
+
+        q_factor, mse, evaluations = ImageCompression.solve_q_factor(lambda q: 10 * q**2, 250.0, tolerance=1e-3)
+
+        assert q_factor == pytest.approx(5.0, rel=1e-4)
+        assert mse == pytest.approx(250.0, abs=1e-3)
+        assert evaluations < ImageCompression.MAX_ITERATIONS
+
+        q_factor, _, _ = ImageCompression.solve_q_factor(lambda q: 10 * q**2, 250.0, bounds=(1.0, 2.0))
+        assert q_factor == 2.0
+
+    def test_encode_channels_matches_single_channel(self, sample_image):
+        """Test that the batched pass gives the same result as encoding every channel on its own"""
+
+        image_ycbcr = rgb_to_ycbcr(sample_image)[:90, :125]
+        q_methods = ["luminance", "chroma", "chroma"]
+
+        decoded = JPEGCompression.decode_channels(
+            JPEGCompression.encode_channels(image_ycbcr, q_methods, q_factor=1.5), image_ycbcr.shape[:2]
+        )
+
+        for index, q_method in enumerate(q_methods):
+            channel = image_ycbcr[:, :, index]
+            expected = JPEGCompression.decode(JPEGCompression.encode(channel, q_method, q_factor=1.5), channel.shape)
+            np.testing.assert_array_equal(decoded[:, :, index], expected)
+
+    @pytest.mark.parametrize("scale", [2, 4, 8])
+    def test_decode_scaled(self, sample_image, scale):
+        """Test that a reduced decode is close to the full decode averaged over scale x scale squares"""
+
+        channel = sample_image[:, :, 0]
+        encoded = JPEGCompression.encode(channel)
+
+        decoded = JPEGCompression.decode_scaled(encoded, scale, channel.shape)
+        expected = JPEGCompression.decode(encoded, channel.shape).reshape(96 // scale, scale, 128 // scale, scale)
+
+        assert decoded.shape == (96 // scale, 128 // scale)
+        assert np.abs(decoded - expected.mean(axis=(1, 3))).mean() < 2.0
+
+    def test_decode_scaled_flat_blocks(self):
+        """Test that a flat block keeps its value at every scale"""
+
+        image = np.kron(np.array([[40, 200], [120, 90]], dtype=np.uint8), np.ones((8, 8), dtype=np.uint8))
+        encoded = JPEGCompression.encode(image)
+
+        for scale in JPEGCompression.SCALES:
+            decoded = JPEGCompression.decode_scaled(encoded, scale)
+            np.testing.assert_array_equal(decoded, image[::scale, ::scale])
+
+    def test_decode_scaled_invalid_scale(self, sample_image):
+        """Test that only the supported scales are accepted"""
+
+        with pytest.raises(ValueError):
+            JPEGCompression.decode_scaled(JPEGCompression.encode(sample_image[:, :, 0]), 3)
+
+    def test_decode_region(self, sample_image):
+        """Test that a decoded region is the same rectangle of the full decode, with and without cropping"""
+
+        channel = sample_image[:90, :125, 0]
+        encoded = JPEGCompression.encode(channel)
+        full = JPEGCompression.decode(encoded, channel.shape)
+
+        for y0, x0, height, width in [(0, 0, 90, 125), (3, 5, 20, 17), (89, 124, 1, 1)]:
+            np.testing.assert_array_equal(
+                JPEGCompression.decode_region(encoded, y0, x0, height, width, channel.shape),
+                full[y0 : y0 + height, x0 : x0 + width],
+            )
+        np.testing.assert_array_equal(
+            JPEGCompression.decode_region(encoded, 10, 20, 30, 40), JPEGCompression.decode(encoded)[10:40, 20:60]
+        )
+        with pytest.raises(ValueError):
+            JPEGCompression.decode_region(encoded, 80, 0, 20, 10, channel.shape)
+
+    def test_encode_channels_invalid_shape(self, sample_image):
+        """Test that the number of channels must match the quantization methods"""
+
+        with pytest.raises(RuntimeError):
+            JPEGCompression.encode_channels(sample_image, ["luminance", "chroma"])
+
+    @pytest.mark.parametrize("subsampling", ["4:2:2", "4:2:0"])
+    def test_compress_rgb_subsampling(self, sample_image, subsampling):
+        """Test that subsampling the chroma keeps the shape and only costs a moderate amount of quality"""
+
+        full = ImageCompression.compress_rgb(sample_image)
+        subsampled = ImageCompression.compress_rgb(sample_image, subsampling=subsampling)
+
+        assert subsampled.shape == sample_image.shape
+        assert mean_squared_error(sample_image, subsampled) < 2 * mean_squared_error(sample_image, full)
+
+    def test_compress_to_mse_requires_target(self, sample_image):
+        """Test that the target MSE is mandatory"""
+
+        with pytest.raises(ValueError):
+            ImageCompression.compress_to_mse(sample_image)
+
+    @pytest.mark.parametrize("max_bytes", [3000, 8000])
+    def test_compress_to_size(self, sample_image, max_bytes):
+        """Test that the file fits the budget and that a slightly better quality would not"""
+
+        data, q_factor, mse = ImageCompression.compress_to_size(sample_image, max_bytes)
+
+        assert len(data) <= max_bytes
+        assert mse == pytest.approx(mean_squared_error(sample_image, ImageCompression.decompress_jpeg(data)), rel=0.01)
+        assert len(ImageCompression.compress_jpeg(sample_image, q_factor=q_factor * 0.98)) > len(data)
+        assert ImageCompression.decompress_jpeg(data).shape == sample_image.shape
+
+    def test_compress_to_size_hard_edge(self):
+        """Test that a generous budget on a black/white edge reaches the smallest q_factor without overflowing
+        the baseline categories of the entropy coder"""
+
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        image[:, 32:] = 255
+
+        data, q_factor, _ = ImageCompression.compress_to_size(image, 100000)
+
+        assert q_factor == pytest.approx(ImageCompression.Q_FACTOR_MIN)
+        assert np.abs(ImageCompression.decompress_jpeg(data).astype(int) - image).max() <= 4
+
+    def test_compress_to_size_unreachable(self, sample_image):
+        """Test that a budget below the smallest possible file raises an error"""
+
+        with pytest.raises(RuntimeError):
+            ImageCompression.compress_to_size(sample_image, 100)
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    def test_compress_ladder(self, sample_image, subsampling):
+        """Test that every rendition is the file and image of a separate compression at its q_factor"""
+
+        q_factors = [0.5, 1.0, 4.0]
+
+        renditions = ImageCompression.compress_ladder(sample_image, q_factors, subsampling, decode=True)
+
+        for q_factor, (data, decoded) in zip(q_factors, renditions):
+            assert data == ImageCompression.compress_jpeg(sample_image, q_factor, subsampling)
+            np.testing.assert_array_equal(decoded, ImageCompression.decompress_jpeg(data))
+        assert len(renditions[0][0]) > len(renditions[1][0]) > len(renditions[2][0])
+        assert ImageCompression.compress_ladder(sample_image[:, :, 0], [2.0])[0][1] is None
+
+    def test_compress_ladder_empty(self, sample_image):
+        """Test that a ladder without renditions is rejected"""
+
+        with pytest.raises(ValueError):
+            ImageCompression.compress_ladder(sample_image, [])
@@ -0,0 +1,354 @@
+import cv2 as cv
+import numpy as np
+import pytest
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.jfif import JFIF
+from skimage.metrics import mean_squared_error
+
+
+class TestJFIF:
+    @staticmethod
+    def sample_image(height: int = 67, width: int = 93) -> np.ndarray:
+        y, x = np.mgrid[0:height, 0:width]
+
+        return np.stack(
+            [
+                128 + 100 * np.sin(x / 9),
+                128 + 100 * np.cos(y / 13),
+                255 * (x + y) / (height + width),
+            ],
+            axis=-1,
+        ).astype(np.uint8)
+
+    @staticmethod
+    def libjpeg_decode(data: bytes, flags: int = cv.IMREAD_COLOR) -> np.ndarray:
+        image = cv.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        assert image is not None
+
+        return cv.cvtColor(image, cv.COLOR_BGR2RGB) if image.ndim == 3 else image
+
+    def test_file_structure(self):
+        """Test the markers of a written file"""
+
+        data = ImageCompression.compress_jpeg(TestJFIF.sample_image())
+
+        assert data[:2] == b"\xff\xd8" and data[-2:] == b"\xff\xd9"
+        assert b"JFIF\x00" in data[:20]
+        assert b"\xff\xc0" in data and b"\xff\xc4" in data and b"\xff\xda" in data
+
+    def test_rgb_round_trip(self):
+        """Test that the package decoder and libjpeg agree on a written file"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image)
+
+        decoded = ImageCompression.decompress_jpeg(data)
+        decoded_libjpeg = TestJFIF.libjpeg_decode(data)
+
+        assert decoded.shape == image.shape
+        assert mean_squared_error(decoded, decoded_libjpeg) < 2.0
+        assert mean_squared_error(image, decoded) < 60.0
+
+    def test_grayscale_round_trip(self):
+        """Test a single component file"""
+
+        image = TestJFIF.sample_image()[:, :, 0]
+        data = ImageCompression.compress_jpeg(image, q_factor=2.0)
+
+        decoded = ImageCompression.decompress_jpeg(data)
+        decoded_libjpeg = TestJFIF.libjpeg_decode(data, cv.IMREAD_GRAYSCALE)
+
+        assert decoded.shape == image.shape
+        np.testing.assert_allclose(decoded, decoded_libjpeg, atol=1)
+
+    @pytest.mark.parametrize("q_factor", [1 / 128, 0.05, 0.09])
+    def test_low_q_factor_hard_edge(self, q_factor):
+        """Test that quantization steps of 1 on black/white edges stay inside the baseline categories"""
+
+        image = np.zeros((64, 64, 3), dtype=np.uint8)
+        image[:, 32:] = 255
+        image[40:, :] = 255 - image[40:, :]
+
+        data = ImageCompression.compress_jpeg(image, q_factor=q_factor)
+
+        assert np.abs(ImageCompression.decompress_jpeg(data).astype(int) - image).max() <= 4
+        np.testing.assert_allclose(ImageCompression.decompress_jpeg(data), TestJFIF.libjpeg_decode(data), atol=2)
+
+    def test_baseline_tables(self):
+        """Test that quantization steps above 255 are clamped to 8 bit tables in an SOF0 frame"""
+
+        image = TestJFIF.sample_image()[:, :, 0]
+        data = ImageCompression.compress_jpeg(image, q_factor=8.0)
+
+        dqt = data.index(b"\xff\xdb")
+        assert b"\xff\xc0" in data and b"\xff\xc1" not in data
+        assert data[dqt + 4] == 0 and max(data[dqt + 5 : dqt + 69]) == 255
+        np.testing.assert_allclose(
+            ImageCompression.decompress_jpeg(data), TestJFIF.libjpeg_decode(data, cv.IMREAD_GRAYSCALE), atol=1
+        )
+
+    def test_write_rejects_wide_tables(self):
+        """Test that steps which do not fit an 8 bit table are rejected instead of written"""
+
+        components = [np.zeros((1, 1, 8, 8), dtype=np.int32)]
+
+        with pytest.raises(ValueError):
+            JFIF.write(components, ["luminance"], [np.full((8, 8), 256)], (8, 8))
+
+    def test_read_libjpeg_file(self):
+        """Test reading a 4:4:4 file written by libjpeg"""
+
+        image = TestJFIF.sample_image()
+        _, encoded = cv.imencode(
+            ".jpg",
+            cv.cvtColor(image, cv.COLOR_RGB2BGR),
+            [cv.IMWRITE_JPEG_QUALITY, 50, cv.IMWRITE_JPEG_SAMPLING_FACTOR, cv.IMWRITE_JPEG_SAMPLING_FACTOR_444],
+        )
+        data = encoded.tobytes()
+
+        _, q_tables, shape = JFIF.read(data)
+
+        assert shape == image.shape[:2]
+        assert mean_squared_error(ImageCompression.decompress_jpeg(data), TestJFIF.libjpeg_decode(data)) < 2.0
+
+    @pytest.mark.parametrize("subsampling", ["4:2:2", "4:2:0"])
+    def test_subsampled_round_trip(self, subsampling):
+        """Test that a subsampled file is smaller and decoded alike by libjpeg"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling=subsampling)
+
+        decoded = ImageCompression.decompress_jpeg(data)
+
+        assert len(data) < len(ImageCompression.compress_jpeg(image))
+        assert decoded.shape == image.shape
+        # libjpeg interpolates the chroma channels when upsampling, the package repeats them
+        assert mean_squared_error(decoded, TestJFIF.libjpeg_decode(data)) < 10.0
+
+    def test_read_libjpeg_subsampled_file(self):
+        """Test reading a file written by libjpeg with its default 4:2:0 subsampling"""
+
+        image = TestJFIF.sample_image()
+        _, encoded = cv.imencode(".jpg", cv.cvtColor(image, cv.COLOR_RGB2BGR), [cv.IMWRITE_JPEG_QUALITY, 75])
+        data = encoded.tobytes()
+
+        components, _, _ = JFIF.read(data)
+
+        assert components[0].shape[:2] == (10, 12) and components[1].shape[:2] == (5, 6)
+        assert mean_squared_error(ImageCompression.decompress_jpeg(data), TestJFIF.libjpeg_decode(data)) < 10.0
+
+    def test_size_close_to_libjpeg(self):
+        """Test that the file size is in line with libjpeg using the same tables"""
+
+        image = TestJFIF.sample_image(256, 256)
+        data = ImageCompression.compress_jpeg(image)
+        _, encoded = cv.imencode(
+            ".jpg",
+            cv.cvtColor(image, cv.COLOR_RGB2BGR),
+            [cv.IMWRITE_JPEG_QUALITY, 50, cv.IMWRITE_JPEG_SAMPLING_FACTOR, cv.IMWRITE_JPEG_SAMPLING_FACTOR_444],
+        )
+
+        assert len(data) < 1.25 * encoded.size
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    def test_progressive_round_trip(self, subsampling):
+        """Test that a progressive file decodes to the same image as a sequential one, and alike by libjpeg"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling=subsampling, progressive=True)
+
+        decoded = ImageCompression.decompress_jpeg(data)
+
+        assert b"\xff\xc2" in data
+        np.testing.assert_array_equal(
+            decoded, ImageCompression.decompress_jpeg(ImageCompression.compress_jpeg(image, subsampling=subsampling))
+        )
+        assert mean_squared_error(decoded, TestJFIF.libjpeg_decode(data)) < 10.0
+
+    def test_progressive_grayscale(self):
+        """Test a single component progressive file"""
+
+        image = TestJFIF.sample_image()[:, :, 0]
+        data = ImageCompression.compress_jpeg(image, progressive=True)
+
+        np.testing.assert_allclose(
+            ImageCompression.decompress_jpeg(data), TestJFIF.libjpeg_decode(data, cv.IMREAD_GRAYSCALE), atol=1
+        )
+
+    def test_progressive_dc_preview(self):
+        """Test that the first scan of a progressive file decodes to one flat color per 8x8 block"""
+
+        image = TestJFIF.sample_image(64, 96)
+        data = ImageCompression.compress_jpeg(image, progressive=True)
+
+        preview = ImageCompression.decompress_jpeg(data, scans=1)
+        blocks = preview.reshape(8, 8, 12, 8, 3).transpose(0, 2, 1, 3, 4)
+
+        assert preview.shape == image.shape
+        assert np.all(blocks == blocks[:, :, :1, :1])
+        assert mean_squared_error(image, preview) < 200.0
+
+    def test_progressive_scans_refine(self):
+        """Test that every additional scan of a progressive file brings the image closer to the original"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling="4:2:0", progressive=True)
+
+        errors = [mean_squared_error(image, ImageCompression.decompress_jpeg(data, scans)) for scans in range(1, 11)]
+
+        # the high frequency bands mostly add back quantization noise, rounding may then cost a little
+        assert all(error < previous + 1.0 for previous, error in zip(errors, errors[1:]))
+        assert errors[0] > 10 * errors[-1]
+        assert errors[-1] == mean_squared_error(image, ImageCompression.decompress_jpeg(data))
+
+    def test_progressive_truncated_file(self):
+        """Test that a progressive file cut short is decoded from its complete scans"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, progressive=True)
+
+        # the DC scan takes the first half of this small file, the cut falls in one of the AC scans
+        decoded = ImageCompression.decompress_jpeg(data[: 3 * len(data) // 4])
+
+        assert decoded.shape == image.shape
+        assert mean_squared_error(image, decoded) < mean_squared_error(
+            image, ImageCompression.decompress_jpeg(data, scans=1)
+        )
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    def test_scaled_decode(self, subsampling):
+        """Test that a file decoded at a reduced scale is close to the downscaled full decode"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling=subsampling)
+        full = ImageCompression.decompress_jpeg(data)
+
+        for scale in (2, 4, 8):
+            decoded = ImageCompression.decompress_jpeg(data, scale=scale)
+            # the average of the full decode over the scale x scale squares inside the image
+            height, width = image.shape[0] // scale, image.shape[1] // scale
+            expected = full[: height * scale, : width * scale].reshape(height, scale, width, scale, 3).mean(axis=(1, 3))
+
+            assert decoded.shape[:2] == (-(-image.shape[0] // scale), -(-image.shape[1] // scale))
+            assert mean_squared_error(decoded[:height, :width], expected) < 10.0
+
+    def test_pyramid(self):
+        """Test that the levels of a pyramid are the images decoded at every scale"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling="4:2:0")
+
+        pyramid = ImageCompression.decompress_jpeg_pyramid(data)
+
+        assert len(pyramid) == 4
+        for level, scale in zip(pyramid, (1, 2, 4, 8)):
+            np.testing.assert_array_equal(level, ImageCompression.decompress_jpeg(data, scale=scale))
+
+    def test_progressive_scaled_decode(self):
+        """Test that a progressive file decoded at 1/8 scale is its DC preview, and at 1/2 matches a sequential file"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling="4:2:0", progressive=True)
+        preview = ImageCompression.decompress_jpeg(data, scans=1)
+
+        np.testing.assert_array_equal(ImageCompression.decompress_jpeg(data, scale=8), preview[::8, ::8])
+        np.testing.assert_array_equal(
+            ImageCompression.decompress_jpeg(data, scale=2),
+            ImageCompression.decompress_jpeg(ImageCompression.compress_jpeg(image, subsampling="4:2:0"), scale=2),
+        )
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    @pytest.mark.parametrize("progressive", [False, True])
+    def test_restart_interval(self, subsampling, progressive):
+        """Test that a file with restart markers decodes to the same image, alike by libjpeg and in parallel"""
+
+        image = TestJFIF.sample_image()
+        reference = ImageCompression.decompress_jpeg(
+            ImageCompression.compress_jpeg(image, subsampling=subsampling, progressive=progressive)
+        )
+        data = ImageCompression.compress_jpeg(
+            image, subsampling=subsampling, progressive=progressive, restart_interval=5
+        )
+
+        assert b"\xff\xdd\x00\x04\x00\x05" in data and b"\xff\xd0" in data
+        assert data == ImageCompression.compress_jpeg(
+            image, subsampling=subsampling, progressive=progressive, restart_interval=5, workers=2
+        )
+        np.testing.assert_array_equal(ImageCompression.decompress_jpeg(data), reference)
+        np.testing.assert_array_equal(ImageCompression.decompress_jpeg(data, workers=2), reference)
+        assert mean_squared_error(reference, TestJFIF.libjpeg_decode(data)) < 10.0
+
+    def test_read_libjpeg_restart_file(self):
+        """Test reading a file written by libjpeg with a restart marker every 3 MCUs"""
+
+        image = TestJFIF.sample_image()
+        _, encoded = cv.imencode(
+            ".jpg",
+            cv.cvtColor(image, cv.COLOR_RGB2BGR),
+            [cv.IMWRITE_JPEG_QUALITY, 75, cv.IMWRITE_JPEG_RST_INTERVAL, 3],
+        )
+        data = encoded.tobytes()
+
+        decoded = ImageCompression.decompress_jpeg(data)
+
+        assert b"\xff\xdd" in data
+        assert mean_squared_error(decoded, TestJFIF.libjpeg_decode(data)) < 10.0
+        np.testing.assert_array_equal(ImageCompression.decompress_jpeg(data, workers=3), decoded)
+
+    def test_invalid_restart_interval(self):
+        """Test that restart intervals which do not fit the DRI segment are rejected"""
+
+        for restart_interval in [-1, 0x10000]:
+            with pytest.raises(ValueError):
+                ImageCompression.compress_jpeg(TestJFIF.sample_image(), restart_interval=restart_interval)
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    @pytest.mark.parametrize("progressive", [False, True])
+    def test_optimized_huffman_tables(self, subsampling, progressive):
+        """Test that a file with fitted Huffman tables is smaller, and decodes to the same image, alike by libjpeg"""
+
+        image = TestJFIF.sample_image(128, 160)
+        reference = ImageCompression.compress_jpeg(image, subsampling=subsampling, progressive=progressive)
+        data = ImageCompression.compress_jpeg(image, subsampling=subsampling, progressive=progressive, optimize=True)
+
+        decoded = ImageCompression.decompress_jpeg(data)
+
+        assert len(data) < len(reference)
+        np.testing.assert_array_equal(decoded, ImageCompression.decompress_jpeg(reference))
+        assert mean_squared_error(decoded, TestJFIF.libjpeg_decode(data)) < 10.0
+
+    def test_optimized_huffman_tables_restart_interval(self):
+        """Test fitted tables with restart markers, where the DC predictions restart, coded serially and in parallel"""
+
+        image = TestJFIF.sample_image()
+        data = ImageCompression.compress_jpeg(image, subsampling="4:2:0", restart_interval=3, optimize=True)
+
+        assert data == ImageCompression.compress_jpeg(
+            image, subsampling="4:2:0", restart_interval=3, workers=2, optimize=True
+        )
+        np.testing.assert_array_equal(
+            ImageCompression.decompress_jpeg(data),
+            ImageCompression.decompress_jpeg(ImageCompression.compress_jpeg(image, subsampling="4:2:0")),
+        )
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    def test_abbreviated_file(self, subsampling):
+        """Test that a file without its standard Huffman tables and with an extra segment decodes unchanged"""
+
+        data = ImageCompression.compress_jpeg(TestJFIF.sample_image(), subsampling=subsampling)
+
+        abbreviated = JFIF.insert_segment(JFIF.remove_segments(data, JFIF.DHT), JFIF.APP15, b"TEST\x00payload")
+
+        assert b"\xff\xc4" not in abbreviated[: abbreviated.index(b"\xff\xda")]
+        assert JFIF.find_segment(abbreviated, JFIF.APP15, b"TEST\x00") == b"payload"
+        assert JFIF.find_segment(data, JFIF.APP15, b"TEST\x00") is None
+        np.testing.assert_array_equal(
+            ImageCompression.decompress_jpeg(abbreviated), ImageCompression.decompress_jpeg(data)
+        )
+        np.testing.assert_array_equal(TestJFIF.libjpeg_decode(abbreviated), TestJFIF.libjpeg_decode(data))
+
+    def test_invalid_file(self):
+        """Test that data without a SOI marker is rejected"""
+
+        with pytest.raises(ValueError):
+            JFIF.read(b"\x89PNG")
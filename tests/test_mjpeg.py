@@ -0,0 +1,84 @@
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.mjpeg import MJPEGReader, MJPEGWriter
+
+
+@pytest.fixture
+def jpeg_frames() -> list[bytes]:
+    """The JFIF files of a few frames of odd size, a moving gradient."""
+
+    y, x = np.mgrid[0:45, 0:61]
+    frames = [np.stack([(x * 4 + index * 8) % 256, (y * 5) % 256, np.full_like(x, 128)], axis=-1) for index in range(5)]
+
+    return [ImageCompression.compress_jpeg(frame.astype(np.uint8)) for frame in frames]
+
+
+class TestMJPEG:
+    def test_roundtrip(self, tmp_path, jpeg_frames):
+        """Test that the frames and the stream properties are read back unchanged"""
+
+        path = os.path.join(tmp_path, "video.avi")
+        with MJPEGWriter(path, fps=12.5, width=61, height=45) as writer:
+            for data in jpeg_frames:
+                writer.write(data)
+
+        assert writer.frames == 5
+        assert writer.size + 8 + 16 * 5 == os.path.getsize(path)
+
+        reader = MJPEGReader(path)
+
+        assert (reader.width, reader.height, reader.frames) == (61, 45, 5)
+        assert reader.fps == pytest.approx(12.5)
+        assert list(reader) == jpeg_frames
+
+    def test_keyframes(self, tmp_path, jpeg_frames):
+        """Test that the keyframe flags are read back from the index and frames are read by index"""
+
+        path = os.path.join(tmp_path, "video.avi")
+        with MJPEGWriter(path, fps=25.0, width=61, height=45) as writer:
+            for index, data in enumerate(jpeg_frames):
+                writer.write(data, keyframe=index % 2 == 0)
+            writer.write(b"", keyframe=False)
+
+        reader = MJPEGReader(path)
+
+        assert reader.keyframes == [0, 2, 4]
+        assert len(reader) == 6
+        assert reader.read(3) == jpeg_frames[3]
+        assert reader.read(5) == b""
+
+    def test_opencv(self, tmp_path, jpeg_frames):
+        """Test that the file is a valid Motion-JPEG AVI file for other decoders"""
+
+        path = os.path.join(tmp_path, "video.avi")
+        with MJPEGWriter(path, fps=25.0, width=61, height=45) as writer:
+            for data in jpeg_frames:
+                writer.write(data)
+
+        capture = cv.VideoCapture(path)
+        decoded = []
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            decoded.append(cv.cvtColor(frame, cv.COLOR_BGR2RGB))
+        capture.release()
+
+        assert len(decoded) == 5
+        for frame, data in zip(decoded, jpeg_frames):
+            # the decoders differ in their IDCT and colour conversion rounding only
+            assert np.abs(frame.astype(int) - ImageCompression.decompress_jpeg(data)).max() <= 3
+
+    def test_not_avi(self, tmp_path):
+        """Test that other files are rejected"""
+
+        path = os.path.join(tmp_path, "video.avi")
+        with open(path, "wb") as file:
+            file.write(b"RIFF\x00\x00\x00\x00WAVE")
+
+        with pytest.raises(ValueError):
+            MJPEGReader(path)
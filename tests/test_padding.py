@@ -28,3 +28,13 @@ class TestPadding:
         padded_image = ImageBlockProcessor.pad(image)
 
         assert padded_image.shape == (24, 32)
+
+    def test_pad_8x8_batch(self):
+        """Test case for a batch of channels, only the last two axes are padded."""
+
+        image = np.ones((3, 15, 30))
+        padded_image = ImageBlockProcessor.pad(image)
+
+        assert padded_image.shape == (3, 16, 32)
+        assert np.all(padded_image[:, -1, :] == 0)
+        assert np.all(padded_image[:, :15, 1:31] == 1)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.jpeg_compression import JPEGCompression
+from jpegzip.utils.image import rgb_to_ycbcr
+from jpegzip.utils.precision import compute_dtype, compute_precision, set_compute_dtype
+from skimage.metrics import mean_squared_error
+
+
+class TestPrecision:
+    def test_default_float32(self, sample_image):
+        """Test that the intermediate arrays are single precision by default"""
+
+        assert compute_dtype() == np.float32
+        assert JPEGCompression.transform(sample_image[:, :, 0]).dtype == np.float32
+        assert JPEGCompression.encode(sample_image[:, :, 0]).dtype == np.float32
+        assert JPEGCompression.decode(JPEGCompression.encode(sample_image[:, :, 0])).dtype == np.float32
+
+    def test_float64_policy(self, sample_image):
+        """Test that the double precision policy is respected and restored afterwards"""
+
+        with compute_precision("float64"):
+            assert JPEGCompression.transform(sample_image[:, :, 0]).dtype == np.float64
+            assert JPEGCompression.decode(JPEGCompression.encode(sample_image[:, :, 0])).dtype == np.float64
+
+        assert compute_dtype() == np.float32
+
+    def test_quantization_matrix_independent_of_dtype(self):
+        """Test that the quantization steps stored in files do not depend on the policy"""
+
+        q_table = JPEGCompression.quantization_matrix("chroma", 1.37)
+
+        with compute_precision(np.float64):
+            np.testing.assert_array_equal(JPEGCompression.quantization_matrix("chroma", 1.37), q_table)
+
+    @pytest.mark.parametrize("q_factor", [0.5, 1.0, 3.0])
+    def test_float32_close_to_float64(self, sample_image, q_factor):
+        """Test that the single precision output stays within tolerance of the double precision reference"""
+
+        compressed = ImageCompression.compress_rgb(sample_image, q_factor=q_factor)
+        with compute_precision("float64"):
+            reference = ImageCompression.compress_rgb(sample_image, q_factor=q_factor)
+
+        # only coefficients sitting on a rounding tie can be quantized differently
+        assert mean_squared_error(reference, compressed) < 1.0
+        assert mean_squared_error(sample_image, compressed) == pytest.approx(
+            mean_squared_error(sample_image, reference), rel=0.05
+        )
+
+    def test_colour_conversion_close_to_float64(self, sample_image):
+        """Test that the colour conversion differs by at most one level between the two policies"""
+
+        ycbcr = rgb_to_ycbcr(sample_image)
+        with compute_precision("float64"):
+            reference = rgb_to_ycbcr(sample_image)
+
+        assert np.abs(ycbcr.astype(int) - reference).max() <= 1
+
+    def test_invalid_dtype(self):
+        """Test that only float32 and float64 can be selected"""
+
+        with pytest.raises(ValueError):
+            set_compute_dtype(np.float16)
+
+        assert compute_dtype() == np.float32
@@ -0,0 +1,100 @@
+import json
+import threading
+
+import numpy as np
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.utils.profiling import Profile, active_profile, profile, stage
+
+
+class TestProfiling:
+    def test_disabled(self, sample_image):
+        """Test that no statistics are collected outside of a profile"""
+
+        assert active_profile() is None
+        assert stage("dct") is stage("idct")
+
+        ImageCompression.compress_rgb(sample_image)
+
+        assert active_profile() is None
+
+    def test_stages(self, sample_image):
+        """Test that a subsampled compression reports every stage it runs through"""
+
+        with profile() as collected:
+            ImageCompression.compress_rgb(sample_image, subsampling="4:2:0")
+
+        assert active_profile() is None
+        assert {"rgb_to_ycbcr", "downsample", "preprocess", "pad", "dct", "quantize", "iblocks", "idct"} <= set(
+            collected.stages
+        )
+        assert {"upsample", "ycbcr_to_rgb"} <= set(collected.stages)
+
+        # the Y channel and the stacked chroma channels go through two batched passes
+        assert collected.stages["dct"]["calls"] == 2
+        assert collected.stages["rgb_to_ycbcr"]["bytes"] == sample_image.nbytes
+        assert all(
+            stats["seconds"] >= 0 and stats["allocated_bytes"] == 0 and stats["allocated_blocks"] == 0
+            for stats in collected.stages.values()
+        )
+
+    def test_memory(self, sample_image):
+        """Test that memory tracing records the allocations of nested stages"""
+
+        with profile(memory=True) as collected:
+            with stage("outer"):
+                ImageCompression.compress_rgb(sample_image)
+
+        stages = collected.stages
+        assert stages["dct"]["allocated_bytes"] > 0
+        assert stages["outer"]["allocated_bytes"] >= max(stats["allocated_bytes"] for stats in stages.values())
+        assert stages["dct"]["allocated_blocks"] >= 1
+
+    def test_memory_blocks(self):
+        """Test that the blocks a stage allocates and keeps are counted, and the ones it frees are not"""
+
+        with profile(memory=True) as collected:
+            with stage("kept"):
+                kept = [np.ones(1000) for _ in range(5)]
+            with stage("freed"):
+                np.ones((100, 100)).sum()
+
+        assert len(kept) == 5
+        assert collected.stages["kept"]["allocated_blocks"] >= 5
+        assert collected.stages["freed"]["allocated_blocks"] == 0
+        assert collected.stages["freed"]["allocated_bytes"] >= 100 * 100 * 8
+        assert "Blocks" in collected.report()
+
+    def test_memory_main_thread_only(self):
+        """Test that the stages of other threads are timed without touching the process-wide memory peak"""
+
+        def worker():
+            with stage("thread"):
+                np.ones((100, 100)).sum()
+
+        with profile(memory=True) as collected:
+            with stage("main"):
+                thread = threading.Thread(target=worker)
+                thread.start()
+                thread.join()
+
+        assert collected.stages["thread"]["calls"] == 1
+        assert (
+            collected.stages["thread"]["allocated_bytes"] == 0 and collected.stages["thread"]["allocated_blocks"] == 0
+        )
+        assert collected.stages["main"]["allocated_bytes"] >= 100 * 100 * 8
+
+    def test_export(self, sample_image):
+        """Test the dict and JSON export, the report and merging the profile of another process"""
+
+        with profile() as collected:
+            ImageCompression.decompress_jpeg(ImageCompression.compress_jpeg(sample_image))
+
+        exported = json.loads(collected.to_json())
+        assert exported == collected.as_dict()
+        assert {"entropy_encode", "entropy_decode"} <= set(exported["stages"])
+        assert "entropy_decode" in collected.report()
+
+        merged = Profile()
+        merged.merge(exported["stages"])
+        merged.merge(exported["stages"])
+        assert merged.stages["dct"]["calls"] == 2 * collected.stages["dct"]["calls"]
@@ -0,0 +1,40 @@
+import pytest
+from jpegzip.utils.streaming import prefetch
+
+
+class TestStreaming:
+    def test_prefetch_order(self):
+        """Test that all the items are yielded in order"""
+
+        assert list(prefetch(range(100), maxsize=3)) == list(range(100))
+
+    def test_prefetch_bounded(self):
+        """Test that the producer never gets more than `maxsize` items ahead of the consumer"""
+
+        produced = []
+
+        def producer():
+            for index in range(50):
+                produced.append(index)
+                yield index
+
+        for consumed in prefetch(producer(), maxsize=2):
+            # one item may be held by the producer thread, waiting for a free slot
+            assert len(produced) - consumed <= 2 + 2
+
+    def test_prefetch_exception(self):
+        """Test that an exception raised by the producer reaches the consumer"""
+
+        def producer():
+            yield 1
+            raise RuntimeError("failed to read")
+
+        with pytest.raises(RuntimeError, match="failed to read"):
+            list(prefetch(producer()))
+
+    def test_prefetch_early_stop(self):
+        """Test that the consumer can stop before the producer is exhausted"""
+
+        for item in prefetch(iter(range(1000)), maxsize=1):
+            if item == 5:
+                break
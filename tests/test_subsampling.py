@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from jpegzip.utils.image import CHROMA_SUBSAMPLING, downsample, upsample
+
+
+class TestSubsampling:
+    @pytest.mark.parametrize("subsampling, shape", [("4:2:2", (29, 16)), ("4:2:0", (15, 16))])
+    def test_downsample_shape(self, subsampling, shape):
+        """Test that odd dimensions are rounded up when downsampling"""
+
+        channel = np.zeros((29, 31), dtype=np.uint8)
+
+        assert downsample(channel, CHROMA_SUBSAMPLING[subsampling]).shape == shape
+
+    def test_downsample_average(self):
+        """Test that every output pixel is the average of its box"""
+
+        channel = np.array([[0, 2, 4, 6], [2, 4, 6, 8]], dtype=np.uint8)
+
+        np.testing.assert_array_equal(downsample(channel, (2, 2)), [[2, 6]])
+
+    def test_no_subsampling(self):
+        """Test that 4:4:4 leaves the channel untouched"""
+
+        channel = np.arange(12, dtype=np.uint8).reshape(3, 4)
+
+        assert downsample(channel, CHROMA_SUBSAMPLING["4:4:4"]) is channel
+        np.testing.assert_array_equal(upsample(channel, (1, 1), channel.shape), channel)
+
+    @pytest.mark.parametrize("subsampling", ["4:2:2", "4:2:0"])
+    def test_round_trip_constant_boxes(self, subsampling):
+        """Test that a channel made of constant boxes is restored exactly"""
+
+        factors = CHROMA_SUBSAMPLING[subsampling]
+        small = np.arange(8 * 9, dtype=np.uint8).reshape(8, 9)
+        channel = np.repeat(np.repeat(small, factors[0], axis=0), factors[1], axis=1)[:15, :17]
+
+        restored = upsample(downsample(channel, factors), factors, channel.shape)
+
+        assert restored.shape == channel.shape
+        np.testing.assert_array_equal(restored, channel)
@@ -0,0 +1,47 @@
+import io
+
+import numpy as np
+import pytest
+from jpegzip.compression.image_compression import ImageCompression
+
+
+@pytest.fixture
+def memmap_image(tmp_path) -> np.ndarray:
+    """A 203x150 RGB image stored in a `.npy` file and mapped into memory."""
+
+    rng = np.random.default_rng(2)
+    y, x = np.mgrid[0:203, 0:150]
+    image = np.stack([x, y, 128 + 60 * np.sin(x / 5) * np.cos(y / 7)], axis=-1)
+    image = np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8)
+
+    path = tmp_path / "image.npy"
+    np.save(path, image)
+
+    return np.load(path, mmap_mode="r")
+
+
+class TestTiledCompression:
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    @pytest.mark.parametrize("tile_rows", [16, 50, 1000])
+    def test_same_file_as_compress_jpeg(self, memmap_image, subsampling, tile_rows):
+        """Test that compressing strip by strip writes exactly the file of the whole image"""
+
+        file = io.BytesIO()
+        size = ImageCompression.compress_jpeg_tiled(memmap_image, file, subsampling=subsampling, tile_rows=tile_rows)
+
+        assert size == len(file.getvalue())
+        assert file.getvalue() == ImageCompression.compress_jpeg(np.asarray(memmap_image), subsampling=subsampling)
+
+    def test_grayscale(self, memmap_image):
+        """Test a single channel image with strips smaller than the default"""
+
+        file = io.BytesIO()
+        ImageCompression.compress_jpeg_tiled(memmap_image[:, :, 0], file, q_factor=2.0, tile_rows=8)
+
+        assert file.getvalue() == ImageCompression.compress_jpeg(np.asarray(memmap_image[:, :, 0]), q_factor=2.0)
+
+    def test_invalid_dimensions(self):
+        """Test that only 2D and 3D images are accepted"""
+
+        with pytest.raises(RuntimeError):
+            ImageCompression.compress_jpeg_tiled(np.zeros((8, 8, 3, 2), dtype=np.uint8), io.BytesIO())
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+import scipy
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.jpeg_compression import JPEGCompression
+from jpegzip.compression.transforms import (
+    TRANSFORMS,
+    AANTransform,
+    ScipyTransform,
+    get_transform,
+    register_transform,
+    set_transform_backend,
+    transform_backend,
+    use_transform_backend,
+)
+from jpegzip.utils.image import ImageBlockProcessor
+from skimage.metrics import mean_squared_error
+
+# largest absolute difference to the scipy reference, the AAN transform works on integers
+TOLERANCE = {"scipy": 1e-3, "matmul": 1e-3, "aan": 1.5}
+
+# the AAN transform is not registered by default
+BACKENDS = {**TRANSFORMS, "aan": AANTransform}
+
+
+@pytest.fixture
+def blocks() -> np.ndarray:
+    """The 8x8 blocks of a (3, 40, 56) stack of centered pixels, a strided view of the image."""
+
+    rng = np.random.default_rng(4)
+    image = rng.integers(-128, 128, (3, 40, 56)).astype(np.float32)
+
+    return ImageBlockProcessor.blocks(image)
+
+
+@pytest.fixture
+def aan(monkeypatch):
+    """Register the AAN transform for the duration of a test."""
+
+    monkeypatch.setitem(TRANSFORMS, "aan", AANTransform)
+
+
+class TestTransforms:
+    @pytest.mark.parametrize("backend", list(BACKENDS))
+    def test_dct(self, blocks, backend):
+        """Test that every backend computes the orthonormal DCT of the reference"""
+
+        expected = scipy.fft.dctn(blocks, axes=(-2, -1), norm="ortho")
+        coefficients = BACKENDS[backend].dct(blocks)
+
+        assert coefficients.shape == blocks.shape and coefficients.dtype == np.float32
+        np.testing.assert_allclose(coefficients, expected, atol=TOLERANCE[backend])
+
+    @pytest.mark.parametrize("backend", list(BACKENDS))
+    def test_idct(self, blocks, backend):
+        """Test that every backend inverts the reference DCT"""
+
+        coefficients = ScipyTransform.dct(blocks)
+        pixels = BACKENDS[backend].idct(coefficients)
+
+        assert pixels.shape == blocks.shape and pixels.dtype == np.float32
+        np.testing.assert_allclose(pixels, blocks, atol=TOLERANCE[backend])
+        assert not np.shares_memory(pixels, coefficients)
+
+    @pytest.mark.parametrize("backend", ["matmul", "aan"])
+    def test_any_layout(self, blocks, backend):
+        """Test blocks that are not views of a contiguous image, in double precision"""
+
+        blocks = np.ascontiguousarray(blocks[:, ::-1].astype(np.float64))
+        expected = scipy.fft.dctn(blocks, axes=(-2, -1), norm="ortho")
+        coefficients = BACKENDS[backend].dct(blocks)
+
+        assert coefficients.dtype == np.float64
+        np.testing.assert_allclose(coefficients, expected, atol=max(TOLERANCE[backend], 1e-9))
+
+    def test_aan_error_bound(self):
+        """Test the documented error bounds of the AAN transform on blocks of extreme 8-bit pixels"""
+
+        rng = np.random.default_rng(5)
+        blocks = rng.choice([-128.0, 127.0], (20000, 8, 8)).astype(np.float32)
+        coefficients = np.round(ScipyTransform.dct(blocks))
+
+        assert np.abs(AANTransform.dct(blocks) - ScipyTransform.dct(blocks)).max() <= 1.3
+        assert np.abs(AANTransform.idct(coefficients) - ScipyTransform.idct(coefficients)).max() <= 1.8
+
+        coefficients = rng.integers(-1024, 1024, (20000, 8, 8)).astype(np.float32)
+        assert np.abs(AANTransform.idct(coefficients) - ScipyTransform.idct(coefficients)).max() <= 2.1
+
+    def test_aan_chunks(self, blocks, monkeypatch):
+        """Test that the AAN transform does not depend on how the blocks are split into chunks"""
+
+        expected = AANTransform.dct(blocks)
+        monkeypatch.setattr(AANTransform, "CHUNK_BLOCKS", 7)
+
+        np.testing.assert_array_equal(AANTransform.dct(blocks), expected)
+
+    @pytest.mark.parametrize("backend", ["matmul", "aan"])
+    def test_compression(self, sample_image, backend, aan):
+        """Test that a backend compresses an image like the reference one"""
+
+        expected = ImageCompression.compress_rgb(sample_image)
+        expected_data = ImageCompression.compress_jpeg(sample_image)
+        with use_transform_backend(backend):
+            compressed = ImageCompression.compress_rgb(sample_image)
+            data = ImageCompression.compress_jpeg(sample_image)
+
+        assert transform_backend() == "scipy"
+        assert mean_squared_error(compressed, expected) < 1.0
+        assert abs(mean_squared_error(sample_image, compressed) - mean_squared_error(sample_image, expected)) < 1.0
+        assert abs(len(data) - len(expected_data)) < 0.02 * len(expected_data)
+        assert (
+            mean_squared_error(ImageCompression.decompress_jpeg(data), ImageCompression.decompress_jpeg(expected_data))
+            < 1.0
+        )
+
+    def test_per_call(self, sample_image, aan):
+        """Test that selecting a backend per call is the same as changing the default"""
+
+        channel = sample_image[:, :, 0]
+        encoded = JPEGCompression.encode(channel, backend="matmul")
+
+        decoded = JPEGCompression.decode(encoded, channel.shape, backend="aan")
+
+        with use_transform_backend("matmul"):
+            np.testing.assert_array_equal(JPEGCompression.encode(channel), encoded)
+        with use_transform_backend("aan"):
+            np.testing.assert_array_equal(JPEGCompression.decode(encoded, channel.shape), decoded)
+
+        assert not np.array_equal(JPEGCompression.encode(channel), JPEGCompression.encode(channel, backend="aan"))
+
+    def test_registry(self, blocks, monkeypatch):
+        """Test registering a backend and rejecting unknown names, and that the AAN transform is opt-in"""
+
+        with pytest.raises(ValueError):
+            get_transform("aan")
+
+        monkeypatch.setitem(TRANSFORMS, "reference", ScipyTransform)
+        register_transform("reference", ScipyTransform)
+        assert get_transform("reference") is ScipyTransform
+
+        with pytest.raises(ValueError):
+            get_transform("fftw")
+        with pytest.raises(ValueError):
+            set_transform_backend("fftw")
+
+        assert transform_backend() == "scipy"
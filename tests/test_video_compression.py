@@ -0,0 +1,325 @@
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+from jpegzip.compression.image_compression import ImageCompression
+from jpegzip.compression.mjpeg import MJPEGReader
+from jpegzip.compression.video_compression import ConditionalReplenishment, VideoCompression
+from jpegzip.utils.profiling import profile
+
+
+@pytest.fixture
+def sample_video(tmp_path) -> str:
+    """Write a short synthetic video with a moving gradient and return its absolute path."""
+
+    path = os.path.join(tmp_path, "video.mp4")
+    height, width = 48, 64
+
+    out_video = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"mp4v"), 10.0, (width, height))
+    y, x = np.mgrid[0:height, 0:width]
+    for index in range(12):
+        frame = np.stack([(x * 4 + index * 8) % 256, (y * 5) % 256, np.full_like(x, 128)], axis=-1)
+        out_video.write(frame.astype(np.uint8))
+    out_video.release()
+
+    return path
+
+
+@pytest.fixture
+def static_video(tmp_path) -> str:
+    """Write a short synthetic video of a static gradient crossed by a small square and return its path."""
+
+    path = os.path.join(tmp_path, "static.mp4")
+    y, x = np.mgrid[0:48, 0:64]
+    background = np.stack([x * 4, y * 5, np.full_like(x, 128)], axis=-1).astype(np.uint8)
+
+    out_video = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"mp4v"), 10.0, (64, 48))
+    for index in range(12):
+        frame = background.copy()
+        frame[16:24, 4 * index : 4 * index + 8] = 255
+        out_video.write(frame)
+    out_video.release()
+
+    return path
+
+
+class TestVideoCompression:
+    def test_properties(self, sample_video):
+        """Test that the video properties are read without decoding the frames"""
+
+        compressor = VideoCompression(sample_video)
+
+        assert (compressor.height, compressor.width) == (48, 64)
+        assert compressor.fps == pytest.approx(10.0)
+        assert compressor.output_path.endswith("video_compressed.mp4")
+
+    def test_compress(self, sample_video):
+        """Test that every frame is written and the running MSE is kept"""
+
+        compressor = VideoCompression(sample_video)
+        average_mse = compressor.compress()
+
+        assert compressor.compressed_frames == 12
+        assert 0 < average_mse < 100
+
+        output = cv.VideoCapture(compressor.output_path)
+        assert int(output.get(cv.CAP_PROP_FRAME_COUNT)) == 12
+        output.release()
+
+    def test_compress_parallel(self, sample_video):
+        """Test that the process pool gives the same result as the sequential pipeline"""
+
+        sequential = VideoCompression(sample_video)
+        sequential_mse = sequential.compress()
+
+        parallel = VideoCompression(sample_video, workers=2)
+        parallel_mse = parallel.compress()
+
+        assert parallel.compressed_frames == 12
+        assert parallel_mse == pytest.approx(sequential_mse)
+
+    def test_compress_frames_parallel_order(self, sample_video):
+        """Test that frames come out of the pool in their original order"""
+
+        compressor = VideoCompression(sample_video, workers=2)
+        frames = [np.full((48, 64, 3), 10 * index, dtype=np.uint8) for index in range(9)]
+
+        means = [float(frame.mean()) for frame, _ in compressor.compress_frames_parallel(frames)]
+
+        assert means == sorted(means)
+
+    def test_invalid_workers(self, sample_video):
+        """Test that at least one worker is required"""
+
+        with pytest.raises(ValueError):
+            VideoCompression(sample_video, workers=0)
+
+    def test_compress_target_mse(self, sample_video):
+        """Test that every frame is compressed close to the target MSE, warm starting from the previous frame"""
+
+        compressor = VideoCompression(sample_video, target_mse=40.0)
+        average_mse = compressor.compress()
+
+        assert average_mse == pytest.approx(40.0, abs=10.0)
+        assert compressor.search_iterations < 3 * compressor.compressed_frames
+
+    def test_compress_parallel_subsampling(self, sample_video):
+        """Test that the subsampling mode reaches the pool workers"""
+
+        sequential = VideoCompression(sample_video, subsampling="4:2:0")
+        sequential_mse = sequential.compress()
+
+        parallel = VideoCompression(sample_video, workers=2, subsampling="4:2:0")
+
+        assert parallel.compress() == pytest.approx(sequential_mse)
+        assert sequential_mse != pytest.approx(VideoCompression(sample_video).compress())
+
+    def test_profile_parallel(self, sample_video):
+        """Test that the stages run by the worker processes are merged into the parent's profile"""
+
+        with profile() as collected:
+            VideoCompression(sample_video, workers=2).compress()
+
+        assert collected.stages["read"]["calls"] == 13
+        assert collected.stages["compress_frame"]["calls"] == 12
+        assert collected.stages["write"]["calls"] == 12
+        assert collected.stages["dct"]["calls"] == 12
+
+    def test_compress_jpeg(self, sample_video):
+        """Test that the JFIF frames are stored in a Motion-JPEG file and the MSE is the one of the stored frames"""
+
+        compressor = VideoCompression(sample_video, jpeg=True)
+        average_mse = compressor.compress()
+
+        assert compressor.output_path.endswith("video_compressed.avi")
+        assert compressor.output_bytes == os.path.getsize(compressor.output_path)
+
+        frames = list(MJPEGReader(compressor.output_path))
+        assert len(frames) == compressor.compressed_frames == 12
+
+        original = cv.VideoCapture(sample_video)
+        errors = []
+        for data in frames:
+            _, frame = original.read()
+            frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
+            errors.append(np.mean((frame.astype(float) - ImageCompression.decompress_jpeg(data)) ** 2))
+        original.release()
+
+        assert average_mse == pytest.approx(np.mean(errors))
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:0"])
+    def test_compress_jpeg_target_mse(self, sample_video, subsampling):
+        """Test that every stored JFIF frame decodes to the target MSE"""
+
+        compressor = VideoCompression(sample_video, target_mse=60.0, jpeg=True, subsampling=subsampling)
+        compressor.compress()
+
+        original = cv.VideoCapture(sample_video)
+        for data in MJPEGReader(compressor.output_path):
+            _, frame = original.read()
+            frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
+            mse = np.mean((frame.astype(float) - ImageCompression.decompress_jpeg(data)) ** 2)
+            assert abs(mse - 60.0) <= ImageCompression.MSE_TOLERANCE
+        original.release()
+
+    def test_compress_jpeg_parallel(self, sample_video, tmp_path):
+        """Test that the process pool writes the same Motion-JPEG file as the sequential pipeline"""
+
+        sequential = VideoCompression(sample_video, jpeg=True, subsampling="4:2:0")
+        sequential.output_path = os.path.join(tmp_path, "sequential.avi")
+        sequential.compress()
+
+        parallel = VideoCompression(sample_video, workers=2, jpeg=True, subsampling="4:2:0")
+        parallel.output_path = os.path.join(tmp_path, "parallel.avi")
+        parallel.compress()
+
+        assert list(MJPEGReader(parallel.output_path)) == list(MJPEGReader(sequential.output_path))
+
+    def test_temporal_jpeg(self, static_video, tmp_path):
+        """Test that the skipped MCUs are left out of the Motion-JPEG file and the frames decode to the MSE"""
+
+        intra = VideoCompression(static_video, jpeg=True)
+        intra.output_path = os.path.join(tmp_path, "intra.avi")
+        intra.compress()
+
+        compressor = VideoCompression(static_video, temporal=True, keyframe_interval=5, jpeg=True)
+        compressor.output_path = os.path.join(tmp_path, "temporal.avi")
+        average_mse = compressor.compress()
+
+        assert compressor.output_bytes < intra.output_bytes / 2
+        assert MJPEGReader(compressor.output_path).keyframes == [0, 5, 10]
+
+        original = cv.VideoCapture(static_video)
+        errors = []
+        for frame in VideoCompression.decode_mjpeg(compressor.output_path):
+            _, expected = original.read()
+            errors.append(np.mean((cv.cvtColor(expected, cv.COLOR_BGR2RGB).astype(float) - frame) ** 2))
+        original.release()
+
+        assert len(errors) == 12
+        assert average_mse == pytest.approx(np.mean(errors))
+
+    def test_temporal_jpeg_seek(self, static_video):
+        """Test that decoding from a keyframe, or from the frames after it, gives the frames of a full decode"""
+
+        compressor = VideoCompression(static_video, temporal=True, keyframe_interval=5, jpeg=True)
+        compressor.compress()
+        frames = list(VideoCompression.decode_mjpeg(compressor.output_path))
+
+        for start in [5, 7, 11]:
+            seeked = list(VideoCompression.decode_mjpeg(compressor.output_path, start=start))
+
+            assert len(seeked) == 12 - start
+            for frame, expected in zip(seeked, frames[start:]):
+                np.testing.assert_array_equal(frame, expected)
+
+    def test_temporal_static(self, tmp_path):
+        """Test that only the keyframes of a static video are coded in temporal mode"""
+
+        path = os.path.join(tmp_path, "static.mp4")
+        y, x = np.mgrid[0:48, 0:64]
+        frame = np.stack([x * 4, y * 5, np.full_like(x, 128)], axis=-1).astype(np.uint8)
+
+        out_video = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"mp4v"), 10.0, (64, 48))
+        for _ in range(12):
+            out_video.write(frame)
+        out_video.release()
+
+        compressor = VideoCompression(path, temporal=True, keyframe_interval=5)
+        average_mse = compressor.compress()
+
+        assert compressor.compressed_frames == 12
+        assert compressor.total_blocks == 12 * 6 * 8
+        # frames 0, 5 and 10 are keyframes, the decoded frames in between barely differ
+        assert compressor.coded_blocks < 4 * 6 * 8
+        assert 0 < average_mse < 100
+
+    def test_temporal_invalid_workers(self, sample_video):
+        """Test that temporal mode is sequential"""
+
+        with pytest.raises(ValueError):
+            VideoCompression(sample_video, workers=2, temporal=True)
+
+
+class TestConditionalReplenishment:
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    def test_strip_matches_keyframe(self, subsampling):
+        """Test that coding every MCU of a frame as a strip gives the keyframe of that frame"""
+
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, (37, 50, 3), dtype=np.uint8)
+        sequence = ConditionalReplenishment((37, 50), change_threshold=-1, subsampling=subsampling)
+
+        keyframe, keyframe_mse, _, coded = sequence.compress(frame)
+        replenished, mse, _, replenished_coded = sequence.compress(frame)
+
+        assert coded == replenished_coded == sequence.grid[0] * sequence.grid[1]
+        np.testing.assert_array_equal(replenished, keyframe)
+        assert mse == pytest.approx(keyframe_mse)
+
+    def test_changed_blocks(self):
+        """Test that only the changed MCUs are coded and the others keep their reconstruction"""
+
+        frame = np.full((32, 32, 3), 100, dtype=np.uint8)
+        sequence = ConditionalReplenishment((32, 32), keyframe_interval=10)
+        first, _, _, coded = sequence.compress(frame)
+        assert coded == 16
+
+        moved = frame.copy()
+        moved[8:16, 16:24] = 200
+        second, _, _, coded = sequence.compress(moved)
+
+        assert coded == 1
+        np.testing.assert_array_equal(second[:8], first[:8])
+        assert abs(int(second[12, 20, 0]) - 200) <= 2
+
+    def test_keyframe_interval(self):
+        """Test that every keyframe is fully coded, whatever changed"""
+
+        frame = np.zeros((16, 24, 3), dtype=np.uint8)
+        sequence = ConditionalReplenishment((16, 24), keyframe_interval=3)
+
+        coded = [sequence.compress(frame)[3] for _ in range(7)]
+
+        assert coded == [6, 0, 0, 6, 0, 0, 6]
+
+    @pytest.mark.parametrize("subsampling", ["4:4:4", "4:2:2", "4:2:0"])
+    def test_encode_decode(self, subsampling):
+        """Test that the decoded files are the reconstruction of `compress` and only the keyframes stand alone"""
+
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (37, 50, 3), dtype=np.uint8)]
+        for index in range(1, 5):
+            frames.append(frames[-1].copy())
+            if index == 2:
+                frames[-1][:10, 20:30] = 0
+            if index == 4:
+                frames[-1][30:] = 255
+
+        encoder = ConditionalReplenishment((37, 50), keyframe_interval=4, subsampling=subsampling)
+        compressor = ConditionalReplenishment((37, 50), keyframe_interval=4, subsampling=subsampling)
+        files, errors, expected = [], [], []
+        for frame in frames:
+            data, mse, _, _ = encoder.encode(frame)
+            files.append(data)
+            errors.append(mse)
+            expected.append(compressor.compress(frame)[0])
+
+        assert files[1] == files[3] == b""
+        assert [ConditionalReplenishment.is_keyframe(data) for data in files] == [True, False, False, False, True]
+
+        decoded = list(ConditionalReplenishment.decode(files, (37, 50)))
+        for frame, mse, decoded_frame, compressed_frame in zip(frames, errors, decoded, expected):
+            assert mse == pytest.approx(np.mean((frame.astype(float) - decoded_frame) ** 2))
+            # the JFIF path pads and clamps like a file, unlike `compress_rgb`
+            assert np.abs(decoded_frame.astype(int) - compressed_frame).mean() < 3
+
+        with pytest.raises(ValueError):
+            list(ConditionalReplenishment.decode(files[2:], (37, 50)))
+
+    def test_invalid_keyframe_interval(self):
+        """Test that the keyframe interval must be positive"""
+
+        with pytest.raises(ValueError):
+            ConditionalReplenishment((16, 16), keyframe_interval=0)